@@ -1,6 +1,11 @@
 import streamlit as st
-import pandas as pd
+from itertools import chain
+from chat_history import (CONTEXT_MESSAGES, LOAD_MORE_SIZE, RENDER_WINDOW, SESSION_CAP, ChatHistory,
+                          cap_messages)
 from streamlit_google_auth import Authenticate
+from fingpt_client import ANALYST_PROMPT, FINGPT_API_KEY, FinGPTClient, FinGPTError
+from llm_cache import ResponseCache
+from prompt_context import build_context, estimate_messages_tokens, with_context
 
 # --- 1. 頁面基本設定 ---
 st.set_page_config(page_title="莫連投資代理人 v2.9", layout="wide")
@@ -16,6 +21,27 @@ except:
     client_id = "temp_id"
     client_secret = "temp_secret"
 
+# FinGPT 客戶端：跨工作階段共用同一個連線池與回應快取
+@st.cache_resource
+def get_fingpt_client():
+    try:
+        api_key = st.secrets["FINGPT_API_KEY"]
+    except Exception:
+        api_key = FINGPT_API_KEY
+    return FinGPTClient(api_key=api_key, cache=ResponseCache())
+
+# 對話紀錄資料庫：跨工作階段共用
+@st.cache_resource
+def get_chat_history():
+    return ChatHistory()
+
+# 各帳號可查詢的投資者（Secrets 中 AUTHORIZED_INVESTORS = { "email" = ["INV001", ...] }），未設定時不提供投資者資料
+def authorized_investors(email):
+    try:
+        return list(st.secrets["AUTHORIZED_INVESTORS"].get(email, []))
+    except Exception:
+        return []
+
 # 初始化 Google 驗證器
 auth = Authenticate(
     secret_id=client_id,
@@ -47,17 +73,77 @@ if st.sidebar.button("🚪 安全登出"):
 st.title("🤖 莫連投資代理人 v2.9")
 st.caption("Google 安全認證連線中 | 永豐大戶投審核中")
 
-# 初始化對話紀錄 (確保重新整理不會消失)
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# 初始化對話紀錄：依登入 email 由資料庫載入最近視窗 (重新整理不會消失)
+user_email = user_info.get('email') or "anonymous"
+history = get_chat_history()
+if st.session_state.get("history_owner") != user_email:
+    st.session_state.messages = history.recent(user_email, RENDER_WINDOW)
+    st.session_state.history_window = RENDER_WINDOW
+    st.session_state.history_owner = user_email
+
+# 對話參考資料只限於本工作階段選定、且此帳號有權限的投資者
+allowed_investors = authorized_investors(user_email)
+selected_investor = st.sidebar.selectbox("📁 參考審核資料的投資者", allowed_investors, index=None,
+                                         placeholder="未選擇（不提供投資者資料）",
+                                         disabled=not allowed_investors, key="selected_investor")
+
+def remember(message):
+    """保存訊息到資料庫與工作階段（工作階段訊息數有上限）"""
+    try:
+        message["id"] = history.append(user_email, message)
+    except Exception as e:
+        st.warning(f"⚠️ 對話紀錄保存失敗：{e}")
+    st.session_state.messages = cap_messages(st.session_state.messages + [message])
+
+def load_older_messages():
+    """擴大顯示視窗，工作階段不足時由資料庫往前載入"""
+    messages = st.session_state.messages
+    window = min(st.session_state.history_window + LOAD_MORE_SIZE, SESSION_CAP)
+    missing = window - len(messages)
+    if missing > 0 and messages and messages[0].get("id") is not None:
+        st.session_state.messages = history.recent(user_email, missing, before_id=messages[0]["id"]) + messages
+    st.session_state.history_window = window
+
+def interrupt_stream(stream):
+    """中止未完成的串流回覆並保留已收到的內容"""
+    if stream is not None and not stream.finished:
+        stream.cancel()
+        if stream.text:
+            remember({
+                "role": "assistant",
+                "content": f"【FinGPT 診斷】{stream.text}…（已中斷）",
+                "metrics": stream.metrics()
+            })
+
+# 上一則回覆串流途中被新提問打斷時，中止連線並保留已收到的內容
+interrupt_stream(st.session_state.pop("active_stream", None))
+
+def show_reply_metrics(metrics):
+    """顯示回覆延遲"""
+    if metrics and metrics.get("total_latency") is not None:
+        first_token = metrics.get("time_to_first_token")
+        first_token_text = f"{first_token:.2f} 秒" if first_token is not None else "—"
+        caption = f"⏱ 首字 {first_token_text}｜總計 {metrics['total_latency']:.2f} 秒"
+        if metrics.get("prompt_tokens") is not None:
+            caption += f"｜提示約 {metrics['prompt_tokens']} tokens（資料 {metrics['context_tokens']}，建構 {metrics['context_ms']:.1f} ms）"
+        st.caption(caption)
 
 # 建立滾動對話區域
 chat_container = st.container()
 
 with chat_container:
-    for message in st.session_state.messages:
+    # 只顯示最近視窗，較早訊息按需載入
+    window = st.session_state.history_window
+    visible = st.session_state.messages[-window:]
+    oldest = visible[0].get("id") if visible else None
+    can_load_more = window < SESSION_CAP and (len(st.session_state.messages) > window or (
+        oldest is not None and history.has_older(user_email, oldest)))
+    if can_load_more:
+        st.button("⬆ 載入較早訊息", on_click=load_older_messages)
+    for message in visible:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
+            show_reply_metrics(message.get("metrics"))
 
 # --- 6. 永豐大戶投 - 存錢筒區 ---
 with st.sidebar.expander("🏦 永豐大戶投：活存監控", expanded=True):
@@ -69,14 +155,36 @@ with st.sidebar.expander("🏦 永豐大戶投：活存監控", expanded=True):
 # --- 7. 對話輸入框 (修復點：必須放在最後以確保不被中斷) ---
 if prompt := st.chat_input("莫連，想聊聊哪支股票？或是分析活存配置？"):
     # 立即顯示使用者訊息
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    remember({"role": "user", "content": prompt})
     with chat_container:
         with st.chat_message("user"):
             st.markdown(prompt)
 
-    # 模擬 FinGPT 回應 (莫連，這裡之後會串接你的 fin_gpt_test.py 邏輯)
+    # FinGPT 串流回應（逐字顯示，連線失敗時改為提示訊息）
     with chat_container:
         with st.chat_message("assistant"):
-            response = f"【FinGPT 診斷】莫連，針對您的提問「{prompt}」，我正在調閱 Google 開發計畫中的大數據進行分析..."
-            st.markdown(response)
-    st.session_state.messages.append({"role": "assistant", "content": response})
\ No newline at end of file
+            # 依提問挑選審核、風險與技術指標資料（有 token 預算上限）
+            # 只帶入選定的投資者，提問中提及的其他投資者 ID 不會載入
+            context = build_context(prompt, investor_id=selected_investor)
+            messages = [{"role": "system", "content": with_context(ANALYST_PROMPT, context)}] + [
+                {"role": message["role"], "content": message["content"]}
+                for message in st.session_state.messages[-CONTEXT_MESSAGES:]
+            ]
+            stream = get_fingpt_client().stream_chat(messages, prompt_class="chat")
+            st.session_state.active_stream = stream
+            try:
+                st.write_stream(chain(["【FinGPT 診斷】"], stream))
+                response = f"【FinGPT 診斷】{stream.text}"
+            except FinGPTError as e:
+                response = f"【FinGPT 診斷】莫連，針對您的提問「{prompt}」，FinGPT 暫時無法回應（{e}），請稍後再試。"
+                st.markdown(response)
+            except BaseException:
+                # 串流途中被重新執行或停止打斷（例如送出新提問）時，先中止連線並保留已收到的內容
+                interrupt_stream(stream)
+                raise
+            finally:
+                st.session_state.pop("active_stream", None)
+            metrics = {**stream.metrics(), "prompt_tokens": estimate_messages_tokens(messages),
+                       "context_tokens": context["tokens"], "context_ms": context["build_ms"]}
+            show_reply_metrics(metrics)
+    remember({"role": "assistant", "content": response, "metrics": metrics})
\ No newline at end of file
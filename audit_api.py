@@ -0,0 +1,356 @@
+"""
+審核作業 HTTP API - 大戶投資審核系統
+以 JSON 端點批次提供風險指標、合規檢查與審核記錄建立；運算密集的部分交給程序池，資料庫存取集中於共用的連線執行緒池
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+import audit_db
+import instrumentation
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8780
+DB_THREADS = 4
+# 每段送入程序池的筆數
+CHUNK_SIZE = 2000
+MAX_BATCH_ITEMS = 20_000
+MAX_BODY_BYTES = 32 * 1024 * 1024
+REQUEST_TIMEOUT = 60
+DEFAULT_AUDITOR = "API"
+
+
+class ApiError(Exception):
+    """請求錯誤，以指定狀態碼回應"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+# 路徑 -> (操作名稱, 處理函式 (服務, 請求內容) -> 回應 dict)
+ENDPOINTS: Dict[str, tuple] = {}
+
+
+def endpoint(path: str):
+    """註冊 POST 端點（耗時記錄為 api.<路徑>）"""
+    def decorator(func):
+        ENDPOINTS[path] = ("api." + path.split("/v1/", 1)[-1].replace("/", "."), func)
+        return func
+    return decorator
+
+
+def _json_value(value):
+    """NaN 與無限大轉為 null（JSON 不支援）"""
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+
+def _warm_up() -> int:
+    """於子程序預先載入運算模組"""
+    import audit_ingest  # noqa: F401
+    import risk_engine  # noqa: F401
+    return os.getpid()
+
+
+def _risk_chunk(series: List[list]) -> List[Dict]:
+    """於子程序計算一段投資組合的風險指標（序列長度不一時尾端以 NaN 補齊）"""
+    import numpy as np
+    from risk_engine import RISK_COLUMNS, compute_risk_arrays
+
+    matrix = np.full((len(series), max(len(values) for values in series)), np.nan)
+    for row, values in enumerate(series):
+        matrix[row, :len(values)] = values
+    metrics = compute_risk_arrays(matrix)
+    columns = [[_json_value(value) for value in metrics[column].tolist()] for column in RISK_COLUMNS]
+    return [dict(zip(RISK_COLUMNS, row)) for row in zip(*columns)]
+
+
+def _compliance_chunk(portfolios: List[Dict]) -> List[Dict]:
+    """於子程序對一段投資者執行合規規則"""
+    import pandas as pd
+    from compliance import evaluate_compliance, load_rule_config
+
+    config = load_rule_config()
+    frame = pd.DataFrame.from_records(portfolios)
+    frame["portfolio_value"] = frame["portfolio_value"].astype(float)
+    result = evaluate_compliance(frame, config)
+    details = result[list(config)].to_numpy(dtype=bool).tolist()
+    return [{
+        "compliance_score": score,
+        "findings": list(findings),
+        "recommendations": list(recommendations),
+        "details": dict(zip(config, passed)),
+    } for score, findings, recommendations, passed in zip(
+        result["compliance_score"].tolist(), result["findings"], result["recommendations"], details)]
+
+
+def _prepare_records(records: List[Dict], auditor: str):
+    """於子程序驗證一段審核記錄並計算合規分數，回傳 (可寫入資料列, [(段內序號, 拒絕原因)])"""
+    import pandas as pd
+    from audit_ingest import prepare_chunk
+
+    return prepare_chunk(pd.DataFrame.from_records(records), auditor)
+
+
+def _insert_rows(rows: List[tuple], db_path: Optional[str] = None) -> List[int]:
+    """於單一交易寫入審核記錄，回傳各筆 id"""
+    from audit_ingest import INSERT_SQL
+
+    sql = INSERT_SQL.rstrip() + " RETURNING id"
+    return audit_db.run_write(lambda cursor: [cursor.execute(sql, row).fetchone()[0] for row in rows], db_path)
+
+
+class AuditApi:
+    """服務狀態：運算程序池與資料庫存取執行緒池"""
+
+    def __init__(self, workers: Optional[int] = None, db_threads: int = DB_THREADS,
+                 db_path: Optional[str] = None, chunk_size: int = CHUNK_SIZE, timeout: float = REQUEST_TIMEOUT):
+        self.workers = workers or os.cpu_count() or 1
+        self.db_threads = db_threads
+        self.db_path = db_path
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        audit_db.init_schema(db_path)
+        # 以 spawn 建立子程序，避免 fork 複製資料庫連線與執行緒狀態
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        # 所有資料庫存取都在這些執行緒執行，各執行緒的長連線即為共用連線池，連線數不隨併發請求增加
+        self.db_pool = ThreadPoolExecutor(db_threads, thread_name_prefix="audit-api-db")
+
+    def warm_up(self) -> "AuditApi":
+        """預先啟動所有子程序並載入運算模組，避免第一批請求承擔啟動成本"""
+        # 本程序寫入審核記錄時也需要批次匯入模組
+        import audit_ingest  # noqa: F401
+        for future in [self.pool.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+        return self
+
+    def _result(self, future: Future, deadline: float):
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeout:
+            future.cancel()
+            raise ApiError("處理逾時", 503)
+        except (ValueError, TypeError) as e:
+            raise ApiError(f"資料格式錯誤: {e}")
+
+    def map_chunks(self, func: Callable, items: List, *args) -> List:
+        """將批次切段交給程序池平行處理，依原順序回傳各段結果"""
+        deadline = time.monotonic() + self.timeout
+        futures = [self.pool.submit(func, items[start:start + self.chunk_size], *args)
+                   for start in range(0, len(items), self.chunk_size)]
+        return [self._result(future, deadline) for future in futures]
+
+    def run_db(self, operation: Callable, *args):
+        """於資料庫執行緒池執行操作並等待結果"""
+        return self._result(self.db_pool.submit(operation, *args), time.monotonic() + self.timeout)
+
+    def health(self) -> Dict:
+        return {"status": "ok", "workers": self.workers, "db_threads": self.db_threads,
+                "db_path": self.db_path or audit_db.DB_PATH}
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.db_pool.shutdown(wait=True)
+
+
+def _batch(payload: Dict, key: str) -> List[Dict]:
+    """取出批次陣列並檢查筆數與型別"""
+    items = payload.get(key)
+    if not isinstance(items, list) or not items:
+        raise ApiError(f"{key} 必須為非空陣列")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise ApiError(f"{key} 每次最多 {MAX_BATCH_ITEMS} 筆", 413)
+    if not all(isinstance(item, dict) for item in items):
+        raise ApiError(f"{key} 的每個元素都必須為物件")
+    return items
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+@endpoint("/v1/risk/metrics")
+def risk_metrics(api: AuditApi, payload: Dict) -> Dict:
+    """批次計算風險指標：{"portfolios": [{"investor_id": ..., "values": [市值序列]}]}"""
+    portfolios = _batch(payload, "portfolios")
+    for index, portfolio in enumerate(portfolios):
+        values = portfolio.get("values")
+        if not isinstance(values, list) or not values:
+            raise ApiError(f"portfolios[{index}].values 必須為非空數值陣列")
+    chunks = api.map_chunks(_risk_chunk, [portfolio["values"] for portfolio in portfolios])
+    results = [metrics for chunk in chunks for metrics in chunk]
+    return {"results": [{"investor_id": portfolio.get("investor_id"), **metrics}
+                        for portfolio, metrics in zip(portfolios, results)]}
+
+
+@endpoint("/v1/compliance/check")
+def compliance_check(api: AuditApi, payload: Dict) -> Dict:
+    """批次合規檢查：{"portfolios": [{"investor_id": ..., "portfolio_value": ..., 其他規則欄位}]}"""
+    portfolios = _batch(payload, "portfolios")
+    for index, portfolio in enumerate(portfolios):
+        if not _is_number(portfolio.get("portfolio_value")):
+            raise ApiError(f"portfolios[{index}].portfolio_value 必須為數值")
+    chunks = api.map_chunks(_compliance_chunk, portfolios)
+    results = [check for chunk in chunks for check in chunk]
+    return {"results": [{"investor_id": portfolio.get("investor_id"), **check}
+                        for portfolio, check in zip(portfolios, results)]}
+
+
+@endpoint("/v1/audit/records")
+def audit_records(api: AuditApi, payload: Dict) -> Dict:
+    """批次建立審核記錄：{"records": [...], "auditor": 預設審核員}
+
+    驗證與合規分數和批次匯入相同（未提供發現與建議時由規則補齊），整批於單一交易寫入；
+    ids 與 records 順序對應，被拒絕的記錄為 null。
+    """
+    records = _batch(payload, "records")
+    auditor = payload.get("auditor") or DEFAULT_AUDITOR
+    rows, accepted, rejected = [], [], []
+    chunks = api.map_chunks(_prepare_records, records, auditor)
+    for offset, (chunk_rows, chunk_rejected) in zip(range(0, len(records), api.chunk_size), chunks):
+        skipped = {index for index, _ in chunk_rejected}
+        rows += chunk_rows
+        accepted += [offset + index for index in range(len(chunk_rows) + len(skipped)) if index not in skipped]
+        rejected += [{"row": offset + index, "reason": reason} for index, reason in chunk_rejected]
+
+    ids: List[Optional[int]] = [None] * len(records)
+    for index, record_id in zip(accepted, api.run_db(_insert_rows, rows, api.db_path) if rows else []):
+        ids[index] = record_id
+    return {"inserted": len(rows), "ids": ids, "rejected": rejected}
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    """JSON 端點、GET /health 與 GET /metrics（Prometheus 文字格式）"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+
+    def send_body(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False, allow_nan=False).encode("utf-8")
+        self.send_body(status, body, "application/json; charset=utf-8")
+
+    def read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            # 不讀取過大的內容，回應後關閉連線
+            self.close_connection = True
+            raise ApiError(f"請求內容超過 {MAX_BODY_BYTES} 位元組", 413)
+        body = self.rfile.read(length)
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError as e:
+            raise ApiError(f"JSON 格式錯誤: {e}")
+        if not isinstance(payload, dict):
+            raise ApiError("請求內容必須為 JSON 物件")
+        return payload
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/health":
+            self.send_json(200, self.server.api.health())
+        elif path == "/metrics":
+            self.send_body(200, instrumentation.render_prometheus().encode("utf-8"),
+                           "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self.send_json(404, {"error": f"找不到路徑 {path}"})
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        started = time.perf_counter()
+        try:
+            payload = self.read_json()
+            if path not in ENDPOINTS:
+                raise ApiError(f"找不到路徑 {path}", 404)
+            operation, handler = ENDPOINTS[path]
+            with instrumentation.timer(operation):
+                result = handler(self.server.api, payload)
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self.send_json(200, result)
+        except ApiError as e:
+            self.send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+
+class AuditApiServer(ThreadingHTTPServer):
+    """審核作業 API 伺服器：每個連線一個執行緒，運算與資料庫存取交給 AuditApi 的共用池"""
+
+    daemon_threads = True
+    # 併發連線多時避免連線佇列溢出
+    request_queue_size = 128
+
+    def __init__(self, api: Optional[AuditApi] = None, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.api = api or AuditApi()
+        super().__init__((host, port), _ApiHandler)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "AuditApiServer":
+        """於背景執行緒啟動"""
+        threading.Thread(target=self.serve_forever, daemon=True, name="audit-api").start()
+        return self
+
+    def stop(self):
+        """停止服務並關閉運算與資料庫池"""
+        self.shutdown()
+        self.server_close()
+        self.api.close()
+
+
+def main():
+    """啟動 API 服務"""
+    parser = argparse.ArgumentParser(description="審核作業 HTTP API（風險指標、合規檢查、審核記錄）")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="運算程序池大小（預設 CPU 數）")
+    parser.add_argument("--db-threads", type=int, default=DB_THREADS, help="資料庫存取執行緒（連線）數")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="每段送入程序池的筆數")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="單一請求處理逾時秒數")
+    parser.add_argument("--db", default=None, help="審核數據庫路徑（預設 investment_audit.db）")
+    args = parser.parse_args()
+
+    api = AuditApi(args.workers, args.db_threads, args.db, args.chunk_size, args.timeout).warm_up()
+    server = AuditApiServer(api, args.host, args.port)
+    # 以 SIGTERM 停止時同樣關閉程序池，避免留下子程序
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"🌐 審核作業 API 啟動: {server.base_url}（程序池 {api.workers}，資料庫連線 {api.db_threads}）", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️ API 服務停止")
+    finally:
+        server.server_close()
+        api.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+審核作業 HTTP API 測試與壓測 - 大戶投資審核系統
+驗證批次端點結果與核心函式一致、錯誤回應、併發寫入共用連線池；--benchmark 模式輸出每秒請求數與延遲百分位
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import audit_api
+import audit_core
+import audit_db
+
+PAYLOAD_VARIANTS = 8
+SERIES_LENGTH = 250
+
+
+def temp_database() -> str:
+    """建立暫存審核資料庫路徑"""
+    return os.path.join(tempfile.mkdtemp(), "audit.db")
+
+
+def start_server(db_path: str, **options) -> audit_api.AuditApiServer:
+    """於本程序背景啟動 API（隨機埠）"""
+    api = audit_api.AuditApi(workers=options.pop("workers", 1), db_path=db_path, **options).warm_up()
+    return audit_api.AuditApiServer(api, port=0).start()
+
+
+def post(base_url: str, path: str, payload, raw: Optional[bytes] = None) -> Tuple[int, Dict]:
+    """送出 JSON 請求，回傳 (狀態碼, 回應內容)"""
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+    try:
+        body = raw if raw is not None else json.dumps(payload).encode("utf-8")
+        conn.request("POST", path, body, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def random_series(rng: random.Random, length: int = SERIES_LENGTH) -> list:
+    """模擬每日市值序列"""
+    value, series = rng.uniform(1e7, 5e8), []
+    for _ in range(length):
+        value *= 1 + rng.gauss(0.0005, 0.015)
+        series.append(round(value, 2))
+    return series
+
+
+def risk_payload(rng: random.Random, batch: int) -> Dict:
+    return {"portfolios": [{"investor_id": f"LOAD{rng.randrange(10 ** 6):06d}", "values": random_series(rng)}
+                           for _ in range(batch)]}
+
+
+def compliance_payload(rng: random.Random, batch: int) -> Dict:
+    return {"portfolios": [{"investor_id": f"LOAD{rng.randrange(10 ** 6):06d}",
+                            "portfolio_value": round(rng.uniform(1e6, 3e8), 2)} for _ in range(batch)]}
+
+
+def audit_payload(rng: random.Random, batch: int) -> Dict:
+    return {"auditor": "壓測", "records": [{
+        "investor_id": f"LOAD{rng.randrange(10 ** 6):06d}",
+        "audit_type": rng.choice(audit_db.AUDIT_TYPES),
+        "risk_level": rng.choice(audit_db.RISK_LEVELS),
+        "portfolio_value": round(rng.uniform(1e6, 3e8), 2),
+    } for _ in range(batch)]}
+
+
+# 情境 -> (端點, 產生請求內容)
+SCENARIOS = {
+    "risk": ("/v1/risk/metrics", risk_payload),
+    "compliance": ("/v1/compliance/check", compliance_payload),
+    "audit": ("/v1/audit/records", audit_payload),
+}
+
+
+def percentile(sorted_values, p: float):
+    """最近排名法百分位數"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_load_test(base_url: str, scenario: str, total_requests: int, concurrency: int, batch: int,
+                  seed: int = 42) -> Dict:
+    """以 C 個併發連線（keep-alive）送出 N 個批次請求，回傳吞吐量、延遲百分位與錯誤分類"""
+    path, make_payload = SCENARIOS[scenario]
+    rng = random.Random(seed)
+    bodies = [json.dumps(make_payload(rng, batch)).encode("utf-8") for _ in range(PAYLOAD_VARIANTS)]
+    parts = urlsplit(base_url)
+    local = threading.local()
+
+    def one_request(index: int):
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+        start = time.perf_counter()
+        try:
+            conn.request("POST", path, bodies[index % len(bodies)], {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            error = None if response.status == 200 else str(response.status)
+        except Exception as e:
+            conn.close()
+            local.conn = None
+            error = type(e).__name__
+        return time.perf_counter() - start, error
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one_request, range(total_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for latency, error in results if error is None)
+    errors = {}
+    for _, error in results:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+    return {
+        "scenario": scenario,
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "batch": batch,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 1) if elapsed else 0,
+        "items_per_second": round(len(latencies) * batch / elapsed, 1) if elapsed else 0,
+        "succeeded": len(latencies),
+        "failed": total_requests - len(latencies),
+        "error_breakdown": errors,
+        "latency_ms": {f"p{p}": round(percentile(latencies, p), 2) if latencies else None for p in (50, 95, 99)},
+    }
+
+
+def test_endpoints():
+    """測試三個批次端點的結果與核心函式一致，跨段批次維持原順序"""
+    print("\n🌐 開始測試批次端點...")
+    db_path = temp_database()
+    server = start_server(db_path, chunk_size=2)
+    try:
+        rng = random.Random(3)
+        series = [random_series(rng, length) for length in (30, 120, 2, 60, 250)]
+        status, risk = post(server.base_url, "/v1/risk/metrics",
+                            {"portfolios": [{"investor_id": f"API{index}", "values": values}
+                                            for index, values in enumerate(series)]})
+        expected = [audit_core.calculate_risk_metrics(values) for values in series]
+        assert status == 200
+        for index, (result, metrics) in enumerate(zip(risk["results"], expected)):
+            assert result["investor_id"] == f"API{index}", "跨段批次應維持原順序"
+            assert result["risk_level"] == metrics["risk_level"]
+            assert abs(result["risk_score"] - metrics["risk_score"]) < 1e-9, f"第 {index} 筆風險分數與核心函式不一致"
+
+        values = [5e7, 2.5e8, 1e8]
+        status, compliance = post(server.base_url, "/v1/compliance/check",
+                                  {"portfolios": [{"portfolio_value": value} for value in values]})
+        assert status == 200
+        for result, value in zip(compliance["results"], values):
+            assert ({key: result[key] for key in ("compliance_score", "findings", "recommendations", "details")}
+                    == audit_core.generate_compliance_check(value)), f"市值 {value} 的合規結果與核心函式不一致"
+
+        records = [{"investor_id": "API001", "audit_type": "例行審核", "risk_level": "中", "portfolio_value": 5e7},
+                   {"investor_id": "API002", "audit_type": "未知", "risk_level": "中", "portfolio_value": 5e7},
+                   {"investor_id": "API003", "audit_type": "特別審核", "risk_level": "高", "portfolio_value": 2.5e8,
+                    "findings": "大額轉入"}]
+        status, created = post(server.base_url, "/v1/audit/records", {"records": records, "auditor": "整合測試"})
+        stored = audit_db.query(
+            "SELECT id, investor_id, compliance_score, findings, auditor FROM audit_records ORDER BY id", (), db_path)
+        print(f"📊 風險 {risk['results'][2]}\n📊 審核記錄 {created}\n📊 已寫入 {stored}")
+        assert status == 200 and created["inserted"] == 2
+        assert created["ids"][1] is None and created["rejected"] == [{"row": 1, "reason": "審核類型無效"}], \
+            "無效列應被拒絕且不影響其他列"
+        assert [row[0] for row in stored] == [created["ids"][0], created["ids"][2]], "回傳的 id 與寫入的記錄不符"
+        assert stored[0][2] == round(audit_core.generate_compliance_check(5e7)["compliance_score"])
+        assert stored[1][2] == round(audit_core.generate_compliance_check(2.5e8)["compliance_score"])
+        assert stored[1][3] == "大額轉入", "提供的 findings 應保留"
+        assert stored[0][4] == "整合測試"
+    finally:
+        server.stop()
+
+
+def test_errors():
+    """測試格式錯誤、未知路徑、過大批次與健康檢查、效能指標"""
+    print("\n🚫 開始測試錯誤回應...")
+    server = start_server(temp_database())
+    try:
+        responses = {
+            "bad_json": post(server.base_url, "/v1/risk/metrics", None, raw=b"{not json"),
+            "not_object": post(server.base_url, "/v1/risk/metrics", [1, 2]),
+            "unknown": post(server.base_url, "/v1/unknown", {}),
+            "empty": post(server.base_url, "/v1/compliance/check", {"portfolios": []}),
+            "no_values": post(server.base_url, "/v1/risk/metrics", {"portfolios": [{"values": []}]}),
+            "bad_value": post(server.base_url, "/v1/risk/metrics", {"portfolios": [{"values": [1, "x"]}]}),
+            "bad_portfolio": post(server.base_url, "/v1/compliance/check", {"portfolios": [{"portfolio_value": "1"}]}),
+            "too_many": post(server.base_url, "/v1/audit/records",
+                             {"records": [{}] * (audit_api.MAX_BATCH_ITEMS + 1)}),
+        }
+        for name, (status, body) in responses.items():
+            print(f"📊 {name}: {status} {body.get('error')}")
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+        conn.request("GET", "/health")
+        health = json.loads(conn.getresponse().read())
+        conn.request("GET", "/metrics")
+        metrics = conn.getresponse().read().decode("utf-8")
+        conn.close()
+        expected = {"bad_json": 400, "not_object": 400, "unknown": 404, "empty": 400, "no_values": 400,
+                    "bad_value": 400, "bad_portfolio": 400, "too_many": 413}
+        assert {name: status for name, (status, _) in responses.items()} == expected
+        assert health["status"] == "ok"
+        assert 'operation="api.risk.metrics"' in metrics, "/metrics 應包含端點耗時"
+    finally:
+        server.stop()
+
+
+def test_concurrent_clients():
+    """測試多個用戶端併發寫入與運算：全部成功、id 不重複，資料庫連線數不超過連線池大小"""
+    print("\n🔀 開始測試併發請求...")
+    db_path = temp_database()
+    server = start_server(db_path, db_threads=2)
+    try:
+        writes = run_load_test(server.base_url, "audit", 40, 8, 20)
+        risk = run_load_test(server.base_url, "risk", 24, 8, 10)
+        count = audit_db.query_one("SELECT COUNT(*), COUNT(DISTINCT id) FROM audit_records", (), db_path)
+        connections = sum(1 for _, path, _ in audit_db._all_connections if path == db_path)
+        print(f"📊 寫入 {writes['throughput_rps']} req/s，風險 {risk['throughput_rps']} req/s，"
+              f"記錄 {count}，連線 {connections}")
+        assert writes["failed"] == 0 and risk["failed"] == 0, f"寫入失敗 {writes['failed']}，風險失敗 {risk['failed']}"
+        assert count == (800, 800), f"記錄數或 id 不符: {count}"
+        assert connections <= 2 + 1, f"資料庫連線 {connections} 條，超出連線池大小"
+    finally:
+        server.stop()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def launch_server(workers: Optional[int], db_threads: int) -> Tuple[subprocess.Popen, str]:
+    """以獨立程序啟動 API（暫存資料庫），等待健康檢查通過"""
+    port = free_port()
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "audit_api.py"),
+               "--port", str(port), "--db", temp_database(), "--db-threads", str(db_threads)]
+    if workers:
+        command += ["--workers", str(workers)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("API 服務啟動逾時")
+
+
+def benchmark_main(args):
+    """壓測模式：對各情境輸出每秒請求數與延遲百分位（JSON 報告）"""
+    process = None
+    base_url = args.base_url
+    if not base_url:
+        process, base_url = launch_server(args.workers, args.db_threads)
+    try:
+        reports = []
+        for scenario in args.scenario.split(","):
+            run_load_test(base_url, scenario, args.concurrency, args.concurrency, args.batch)
+            report = run_load_test(base_url, scenario, args.requests, args.concurrency, args.batch)
+            latency = report["latency_ms"]
+            print(f"🚀 {scenario:<10} {report['throughput_rps']:>8.1f} req/s  {report['items_per_second']:>10.1f} 筆/s  "
+                  f"p50 {latency['p50']} ms  p95 {latency['p95']} ms  p99 {latency['p99']} ms  "
+                  f"失敗 {report['failed']}", file=sys.stderr)
+            reports.append(report)
+        print(json.dumps({"base_url": base_url, "reports": reports}, ensure_ascii=False, indent=2))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    """主測試程式"""
+    parser = argparse.ArgumentParser(description="審核作業 HTTP API 測試與壓測")
+    parser.add_argument("--benchmark", action="store_true", help="壓測模式，輸出 JSON 報告")
+    parser.add_argument("--scenario", default=",".join(SCENARIOS), help=f"壓測情境（逗號分隔：{', '.join(SCENARIOS)}）")
+    parser.add_argument("--requests", type=int, default=500, help="每個情境的請求總數")
+    parser.add_argument("--concurrency", type=int, default=16, help="併發連線數")
+    parser.add_argument("--batch", type=int, default=50, help="每個請求的批次筆數")
+    parser.add_argument("--base-url", default=None, help="既有的 API 端點（預設啟動暫存服務）")
+    parser.add_argument("--workers", type=int, default=None, help="暫存服務的運算程序池大小")
+    parser.add_argument("--db-threads", type=int, default=audit_api.DB_THREADS, help="暫存服務的資料庫連線數")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_main(args)
+        return
+
+    print("=" * 60)
+    print("🌐 審核作業 HTTP API 測試")
+    print("=" * 60)
+
+    tests = [
+        ("🌐 批次端點測試", test_endpoints),
+        ("🚫 錯誤回應測試", test_errors),
+        ("🔀 併發請求測試", test_concurrent_clients)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+    print("\n💡 壓測: python audit_api_test.py --benchmark --requests 500 --concurrency 16 --batch 50")
+
+
+if __name__ == "__main__":
+    main()
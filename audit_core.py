@@ -0,0 +1,114 @@
+"""
+審核核心操作 - 大戶投資審核系統
+審核記錄建立、風險指標、合規檢查與尾端風險，不依賴 Streamlit；numpy / pandas 等重型函式庫於呼叫時才載入
+"""
+
+from typing import Dict, List, Optional
+
+import audit_db
+
+INSERT_SQL = '''
+    INSERT INTO audit_records
+    (investor_id, audit_type, risk_level, portfolio_value, compliance_score, findings, recommendations, auditor,
+     tail_var, tail_cvar)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def create_audit_record(investor_id: str, audit_type: str, risk_level: str,
+                        portfolio_value: float, compliance_score: int,
+                        findings: str, recommendations: str, auditor: str,
+                        tail_var: Optional[float] = None, tail_cvar: Optional[float] = None,
+                        db_path: Optional[str] = None) -> Dict:
+    """創建審核記錄，回傳 {"id": 記錄 id}"""
+    try:
+        record_id = audit_db.execute_write(INSERT_SQL, (
+            investor_id, audit_type, risk_level, portfolio_value, compliance_score, findings, recommendations,
+            auditor, tail_var, tail_cvar), db_path)
+        return {"id": record_id}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def generate_compliance_check(portfolio_value: float) -> Dict:
+    """生成合規檢查（首次呼叫時載入規則引擎）"""
+    from compliance import generate_compliance_check as check
+    return check(portfolio_value)
+
+
+def calculate_risk_metrics(portfolio_data) -> Dict:
+    """計算風險指標（單一投資組合的市值序列，DataFrame 取 current_value 欄），委派批次風險引擎"""
+    try:
+        import numpy as np
+        from risk_engine import RISK_COLUMNS, calculate_risk_metrics_batch
+
+        values = portfolio_data["current_value"] if hasattr(portfolio_data, "columns") else portfolio_data
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return {"risk_score": 0, "risk_level": "低", "volatility": 0}
+
+        metrics = calculate_risk_metrics_batch(values[None, :]).iloc[0]
+        return {column: metrics[column] for column in RISK_COLUMNS}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def save_risk_state(investor_id: str, accumulator, db_path: Optional[str] = None):
+    """保存串流風險累加器狀態"""
+    audit_db.execute_write('''
+        INSERT INTO risk_states (investor_id, state, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(investor_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+    ''', (investor_id, accumulator.to_json()), db_path)
+
+
+def load_risk_state(investor_id: str, db_path: Optional[str] = None):
+    """讀取串流風險累加器狀態（RiskAccumulator），無紀錄時回傳空累加器"""
+    from risk_engine import RiskAccumulator
+
+    row = audit_db.query_one('SELECT state FROM risk_states WHERE investor_id = ?', (investor_id,), db_path)
+    return RiskAccumulator.from_json(row[0]) if row else RiskAccumulator()
+
+
+def update_risk_metrics(investor_id: str, new_values: List[float], db_path: Optional[str] = None) -> Dict:
+    """以最新價值增量更新風險指標並保存狀態"""
+    try:
+        accumulator = load_risk_state(investor_id, db_path).update_many(new_values)
+        save_risk_state(investor_id, accumulator, db_path)
+        return accumulator.metrics()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def parse_holdings(text: str) -> Dict[str, float]:
+    """解析持股明細（每行「代號, 股數」，略過無法解析的行）"""
+    holdings = {}
+    for line in text.splitlines():
+        ticker, _, shares = line.replace("，", ",").partition(",")
+        try:
+            if ticker.strip() and float(shares) > 0:
+                holdings[ticker.strip().upper()] = holdings.get(ticker.strip().upper(), 0.0) + float(shares)
+        except ValueError:
+            continue
+    return holdings
+
+
+def calculate_tail_risk(holdings: Dict[str, float]) -> Dict:
+    """以行情快取計算持股組合的 VaR / CVaR"""
+    try:
+        import market_data
+        from tail_risk import holdings_tail_risk
+
+        prices = market_data.load_prices(list(holdings), refresh=False)
+        return holdings_tail_risk(holdings, prices)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def format_tail_risk(tail: Dict) -> str:
+    """尾端風險摘要文字（寫入審核發現）"""
+    from tail_risk import TAIL_RISK_COLUMNS
+
+    return (f"一日 {tail['confidence']:.0%} VaR：歷史 {tail['historical_var']:.2%}／參數 {tail['parametric_var']:.2%}"
+            f"／蒙地卡羅 {tail['monte_carlo_var']:.2%}；CVaR 最高 "
+            f"{max(tail[column] for column in TAIL_RISK_COLUMNS[1::2]):.2%}（尾端風險{tail['risk_level']}）")
@@ -0,0 +1,99 @@
+"""
+審核核心操作測試 - 大戶投資審核系統
+驗證不經 Streamlit 建立審核記錄、計算風險指標、合規檢查與風險狀態累加
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import audit_core
+import audit_db
+
+
+def temp_database() -> str:
+    """建立暫存審核資料庫"""
+    db_path = os.path.join(tempfile.mkdtemp(), "audit.db")
+    audit_db.init_schema(db_path)
+    return db_path
+
+
+def test_create_audit_record():
+    """測試建立審核記錄回傳 id，錯誤時回傳 error"""
+    print("\n📝 開始測試建立審核記錄...")
+    db_path = temp_database()
+    result = audit_core.create_audit_record("CORE001", "例行審核", "中", 5e7, 100, "無", "維持", "測試",
+                                            tail_var=0.02, tail_cvar=0.03, db_path=db_path)
+    row = audit_db.query_one("SELECT investor_id, tail_cvar FROM audit_records WHERE id = ?", (result["id"],),
+                             db_path)
+    failed = audit_core.create_audit_record("CORE002", "例行審核", "中", 5e7, 100, "", "", "測試",
+                                            db_path=os.path.join(tempfile.mkdtemp(), "missing", "audit.db"))
+    print(f"📊 {result} {row}，錯誤 {failed}")
+    assert row == ("CORE001", 0.03), f"寫入內容不符: {row}"
+    assert "error" in failed, "資料庫無法開啟時應回傳 error 而非拋出例外"
+
+
+def test_risk_and_compliance():
+    """測試風險指標接受 DataFrame 或市值序列，並可增量累加保存"""
+    print("\n🎯 開始測試風險指標與合規檢查...")
+    db_path = temp_database()
+    values = 1e8 * np.cumprod(1 + np.random.default_rng(7).normal(0.0005, 0.01, 120))
+    from_frame = audit_core.calculate_risk_metrics(pd.DataFrame({"current_value": values}))
+    from_list = audit_core.calculate_risk_metrics(values.tolist())
+    empty = audit_core.calculate_risk_metrics([])
+    single = audit_core.calculate_risk_metrics([1e8])
+    audit_core.update_risk_metrics("CORE001", values[:60].tolist(), db_path)
+    incremental = audit_core.update_risk_metrics("CORE001", values[60:].tolist(), db_path)
+    compliance = audit_core.generate_compliance_check(5e7)
+    print(f"📊 {from_frame}\n📊 累加 {incremental}\n📊 合規 {compliance['compliance_score']}")
+    assert from_frame == from_list, "DataFrame 與序列輸入的結果不同"
+    assert empty == {"risk_score": 0, "risk_level": "低", "volatility": 0}, f"空序列結果不符: {empty}"
+    # 只有一個價值時沒有報酬率，波動率為 0 而非 NaN
+    assert single["volatility"] == 0 and single["risk_level"] == "低", f"單一價值結果不符: {single}"
+    assert abs(incremental["volatility"] - from_frame["volatility"]) < 1e-9, "分兩次累加的波動率與一次計算不同"
+    assert set(compliance) == {"compliance_score", "findings", "recommendations", "details"}
+
+
+def test_parse_holdings():
+    """測試持股明細解析：全形逗號、代號正規化、重複代號合併，略過無效或非正數的行"""
+    print("\n📋 開始測試持股明細解析...")
+    holdings = audit_core.parse_holdings("2330.tw, 100\n0050，50\n格式錯誤\n2330.TW,20\nX, -5\n, 3\nY, abc")
+    print(f"📊 {holdings}")
+    assert holdings == {"2330.TW": 120.0, "0050": 50.0}, f"解析結果不符: {holdings}"
+    assert audit_core.parse_holdings("") == {}
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("🧩 審核核心操作測試")
+    print("=" * 60)
+
+    tests = [
+        ("📝 建立審核記錄測試", test_create_audit_record),
+        ("🎯 風險指標與合規檢查測試", test_risk_and_compliance),
+        ("📋 持股明細解析測試", test_parse_holdings)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+"""
+審核數據庫連線管理 - 大戶投資審核系統
+每個執行緒重用長連線，啟用 WAL 並於鎖定時退避重試
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional, Sequence
+
+import instrumentation
+
+DB_PATH = os.environ.get("AUDIT_DB_PATH", "investment_audit.db")
+
+# 連線參數
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 20000
+MAX_RETRIES = 6
+BASE_DELAY = 0.02
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+# 已建立的連線：[擁有執行緒, 資料庫路徑, 連線]
+_all_connections: List[list] = []
+
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    """取得新連線：優先接手已結束執行緒留下的連線，否則開啟並調校新連線
+
+    Streamlit 每次重新執行都在新執行緒，接手舊連線可避免重複開檔並防止連線累積。
+    """
+    with _registry_lock:
+        for entry in _all_connections:
+            if entry[1] == db_path and not entry[0].is_alive():
+                entry[0] = threading.current_thread()
+                return entry[2]
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                           check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    with _registry_lock:
+        _all_connections.append([threading.current_thread(), db_path, conn])
+    return conn
+
+
+def get_connection(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """取得目前執行緒的長連線（不存在時建立）"""
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = _open_connection(db_path)
+    return conn
+
+
+def close_all():
+    """關閉所有已建立的連線（測試或程式結束時使用）"""
+    with _registry_lock:
+        for _, _, conn in _all_connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _all_connections.clear()
+    _local.__dict__.clear()
+
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    """判斷是否為鎖定錯誤"""
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def with_retry(operation: Callable[[], Any], retries: int = MAX_RETRIES,
+               base_delay: float = BASE_DELAY) -> Any:
+    """執行操作，遇到 database is locked 時以指數退避加隨機抖動重試"""
+    for attempt in range(retries + 1):
+        try:
+            return operation()
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == retries:
+                raise
+            instrumentation.increment("db.busy_retry")
+            time.sleep(base_delay * (2 ** attempt) * (0.5 + random.random()))
+
+
+@contextmanager
+def transaction(db_path: Optional[str] = None):
+    """寫入交易：BEGIN IMMEDIATE 取得寫鎖，成功提交、失敗回滾"""
+    conn = get_connection(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+@instrumentation.instrument("db.write")
+def run_write(operation: Callable[[sqlite3.Cursor], Any], db_path: Optional[str] = None) -> Any:
+    """於交易內執行寫入操作，鎖定時整筆交易重試"""
+    def attempt():
+        with transaction(db_path) as cursor:
+            return operation(cursor)
+    return with_retry(attempt)
+
+
+def execute_write(sql: str, params: Sequence = (), db_path: Optional[str] = None) -> int:
+    """執行單一寫入語句，回傳 lastrowid"""
+    return run_write(lambda cursor: cursor.execute(sql, params).lastrowid, db_path)
+
+
+@instrumentation.instrument("db.query")
+def query(sql: str, params: Sequence = (), db_path: Optional[str] = None) -> List[tuple]:
+    """執行查詢並回傳所有資料列"""
+    return with_retry(lambda: get_connection(db_path).execute(sql, params).fetchall())
+
+
+@instrumentation.instrument("db.query")
+def query_one(sql: str, params: Sequence = (), db_path: Optional[str] = None) -> Optional[tuple]:
+    """執行查詢並回傳第一列"""
+    return with_retry(lambda: get_connection(db_path).execute(sql, params).fetchone())
+
+
+# 審核類型與風險等級
+AUDIT_TYPES = ["例行審核", "特別審核", "風險評估", "合規檢查"]
+RISK_LEVELS = ["低", "中", "高"]
+
+# 審核數據庫結構
+SCHEMA = [
+    # 審核記錄表
+    '''
+    CREATE TABLE IF NOT EXISTS audit_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        investor_id TEXT,
+        audit_type TEXT,
+        risk_level TEXT,
+        portfolio_value REAL,
+        compliance_score INTEGER,
+        findings TEXT,
+        recommendations TEXT,
+        auditor TEXT
+    )
+    ''',
+    # 投資者表
+    '''
+    CREATE TABLE IF NOT EXISTS investors (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        investor_id TEXT UNIQUE,
+        name TEXT,
+        registration_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        risk_profile TEXT,
+        max_investment REAL,
+        status TEXT DEFAULT 'active'
+    )
+    ''',
+    # 串流風險狀態表
+    '''
+    CREATE TABLE IF NOT EXISTS risk_states (
+        investor_id TEXT PRIMARY KEY,
+        state TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+]
+
+
+# 儀表板彙總表：由觸發器隨 audit_records 寫入即時維護
+SUMMARY_TABLES = [
+    # 每位投資者最新一筆審核
+    '''
+    CREATE TABLE IF NOT EXISTS investor_audit_summary (
+        investor_id TEXT PRIMARY KEY,
+        last_timestamp DATETIME,
+        last_id INTEGER,
+        risk_level TEXT,
+        compliance_score INTEGER,
+        warning INTEGER
+    )
+    ''',
+    # 各風險等級投資者數與警示數
+    '''
+    CREATE TABLE IF NOT EXISTS risk_level_summary (
+        risk_level TEXT PRIMARY KEY,
+        investor_count INTEGER NOT NULL DEFAULT 0,
+        warning_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    # 每日審核數與合規數（供滾動合規率使用）
+    '''
+    CREATE TABLE IF NOT EXISTS daily_audit_summary (
+        day TEXT PRIMARY KEY,
+        audit_count INTEGER NOT NULL DEFAULT 0,
+        compliant_count INTEGER NOT NULL DEFAULT 0,
+        score_sum REAL NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_records_summary AFTER INSERT ON audit_records
+    BEGIN
+        INSERT INTO daily_audit_summary (day, audit_count, compliant_count, score_sum)
+        VALUES (date(NEW.timestamp), 1, COALESCE(NEW.compliance_score, 0) >= 100, COALESCE(NEW.compliance_score, 0))
+        ON CONFLICT(day) DO UPDATE SET
+            audit_count = audit_count + 1,
+            compliant_count = compliant_count + excluded.compliant_count,
+            score_sum = score_sum + excluded.score_sum;
+        INSERT INTO investor_audit_summary (investor_id, last_timestamp, last_id, risk_level, compliance_score, warning)
+        VALUES (NEW.investor_id, NEW.timestamp, NEW.id, NEW.risk_level, NEW.compliance_score,
+                NEW.risk_level = '高' OR COALESCE(NEW.compliance_score, 0) < 100)
+        ON CONFLICT(investor_id) DO UPDATE SET
+            last_timestamp = excluded.last_timestamp,
+            last_id = excluded.last_id,
+            risk_level = excluded.risk_level,
+            compliance_score = excluded.compliance_score,
+            warning = excluded.warning
+        WHERE (excluded.last_timestamp, excluded.last_id) >= (last_timestamp, last_id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_investor_summary_insert AFTER INSERT ON investor_audit_summary
+    BEGIN
+        INSERT INTO risk_level_summary (risk_level, investor_count, warning_count)
+        VALUES (NEW.risk_level, 1, NEW.warning)
+        ON CONFLICT(risk_level) DO UPDATE SET
+            investor_count = investor_count + 1,
+            warning_count = warning_count + excluded.warning_count;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_investor_summary_update AFTER UPDATE ON investor_audit_summary
+    BEGIN
+        UPDATE risk_level_summary
+        SET investor_count = investor_count - 1, warning_count = warning_count - OLD.warning
+        WHERE risk_level = OLD.risk_level;
+        INSERT INTO risk_level_summary (risk_level, investor_count, warning_count)
+        VALUES (NEW.risk_level, 1, NEW.warning)
+        ON CONFLICT(risk_level) DO UPDATE SET
+            investor_count = investor_count + 1,
+            warning_count = warning_count + excluded.warning_count;
+    END
+    ''',
+]
+
+# 投資者彙總中的最新一筆被刪除或修改後，由熱資料庫剩餘記錄重選最新一筆（已封存的記錄需以重建納入）
+_SUMMARY_RESELECT = '''
+        DELETE FROM investor_audit_summary WHERE investor_id = OLD.investor_id AND last_id = OLD.id;
+        INSERT INTO investor_audit_summary (investor_id, last_timestamp, last_id, risk_level, compliance_score, warning)
+        SELECT investor_id, timestamp, id, risk_level, compliance_score,
+               risk_level = '高' OR COALESCE(compliance_score, 0) < 100
+        FROM audit_records
+        WHERE investor_id = OLD.investor_id
+          AND NOT EXISTS (SELECT 1 FROM investor_audit_summary WHERE investor_id = OLD.investor_id)
+        ORDER BY timestamp DESC, id DESC
+        LIMIT 1;
+'''
+
+_DAILY_SUBTRACT = '''
+        UPDATE daily_audit_summary SET
+            audit_count = audit_count - 1,
+            compliant_count = compliant_count - (COALESCE(OLD.compliance_score, 0) >= 100),
+            score_sum = score_sum - COALESCE(OLD.compliance_score, 0)
+        WHERE day = date(OLD.timestamp);
+        DELETE FROM daily_audit_summary WHERE day = date(OLD.timestamp) AND audit_count <= 0;
+'''
+
+# 修改與刪除審核記錄時同步彙總表；封存搬移期間（audit_maintenance.archiving = 1）刪除的記錄仍計入彙總
+SUMMARY_CORRECTION_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS audit_maintenance (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        archiving INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    "INSERT OR IGNORE INTO audit_maintenance (id) VALUES (1)",
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_investor_summary_delete AFTER DELETE ON investor_audit_summary
+    BEGIN
+        UPDATE risk_level_summary
+        SET investor_count = investor_count - 1, warning_count = warning_count - OLD.warning
+        WHERE risk_level = OLD.risk_level;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_records_summary_delete AFTER DELETE ON audit_records
+    WHEN COALESCE((SELECT archiving FROM audit_maintenance), 0) = 0
+    BEGIN''' + _DAILY_SUBTRACT + _SUMMARY_RESELECT + '''
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_records_summary_update
+    AFTER UPDATE OF timestamp, investor_id, risk_level, compliance_score ON audit_records
+    BEGIN''' + _DAILY_SUBTRACT + '''
+        INSERT INTO daily_audit_summary (day, audit_count, compliant_count, score_sum)
+        VALUES (date(NEW.timestamp), 1, COALESCE(NEW.compliance_score, 0) >= 100, COALESCE(NEW.compliance_score, 0))
+        ON CONFLICT(day) DO UPDATE SET
+            audit_count = audit_count + 1,
+            compliant_count = compliant_count + excluded.compliant_count,
+            score_sum = score_sum + excluded.score_sum;''' + _SUMMARY_RESELECT + '''
+        INSERT INTO investor_audit_summary (investor_id, last_timestamp, last_id, risk_level, compliance_score, warning)
+        VALUES (NEW.investor_id, NEW.timestamp, NEW.id, NEW.risk_level, NEW.compliance_score,
+                NEW.risk_level = '高' OR COALESCE(NEW.compliance_score, 0) < 100)
+        ON CONFLICT(investor_id) DO UPDATE SET
+            last_timestamp = excluded.last_timestamp,
+            last_id = excluded.last_id,
+            risk_level = excluded.risk_level,
+            compliance_score = excluded.compliance_score,
+            warning = excluded.warning
+        WHERE (excluded.last_timestamp, excluded.last_id) >= (last_timestamp, last_id);
+    END
+    ''',
+]
+
+# 各投資者審核記錄的變更次數：新增、修改與刪除都遞增（封存搬移除外），供快取判斷投資者的審核資料是否變動
+_REVISION_BUMP = '''
+        INSERT INTO investor_audit_revisions (investor_id, revision) SELECT {investor}, 1 WHERE {condition}
+        ON CONFLICT(investor_id) DO UPDATE SET revision = revision + 1;
+'''
+
+AUDIT_REVISION_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS investor_audit_revisions (
+        investor_id TEXT PRIMARY KEY,
+        revision INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_records_revision_insert AFTER INSERT ON audit_records
+    BEGIN''' + _REVISION_BUMP.format(investor="NEW.investor_id", condition="1") + '''
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_records_revision_update AFTER UPDATE ON audit_records
+    BEGIN''' + _REVISION_BUMP.format(investor="OLD.investor_id", condition="1") + _REVISION_BUMP.format(
+        investor="NEW.investor_id", condition="NEW.investor_id IS NOT OLD.investor_id") + '''
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_audit_records_revision_delete AFTER DELETE ON audit_records
+    WHEN COALESCE((SELECT archiving FROM audit_maintenance), 0) = 0
+    BEGIN''' + _REVISION_BUMP.format(investor="OLD.investor_id", condition="1") + '''
+    END
+    ''',
+]
+
+# 由 audit_records 全量重建彙總表（遷移回填與修正偏差時使用）
+SUMMARY_REBUILD = [
+    "DELETE FROM daily_audit_summary",
+    "DELETE FROM risk_level_summary",
+    "DELETE FROM investor_audit_summary",
+    '''
+    INSERT INTO daily_audit_summary (day, audit_count, compliant_count, score_sum)
+    SELECT date(timestamp), COUNT(*), SUM(COALESCE(compliance_score, 0) >= 100), SUM(COALESCE(compliance_score, 0))
+    FROM audit_records
+    GROUP BY date(timestamp)
+    ''',
+    # 寫入投資者彙總時由觸發器同步重建 risk_level_summary
+    '''
+    INSERT INTO investor_audit_summary (investor_id, last_timestamp, last_id, risk_level, compliance_score, warning)
+    SELECT investor_id, timestamp, id, risk_level, compliance_score,
+           risk_level = '高' OR COALESCE(compliance_score, 0) < 100
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY investor_id ORDER BY timestamp DESC, id DESC) AS latest_rank
+        FROM audit_records
+    )
+    WHERE latest_rank = 1
+    ''',
+]
+
+# 將封存分區（附加為 {source}）併入彙總表，與熱資料庫重建結果合併
+SUMMARY_MERGE = [
+    '''
+    INSERT INTO daily_audit_summary (day, audit_count, compliant_count, score_sum)
+    SELECT date(timestamp), COUNT(*), SUM(COALESCE(compliance_score, 0) >= 100), SUM(COALESCE(compliance_score, 0))
+    FROM {source}.audit_records
+    GROUP BY date(timestamp)
+    ON CONFLICT(day) DO UPDATE SET
+        audit_count = audit_count + excluded.audit_count,
+        compliant_count = compliant_count + excluded.compliant_count,
+        score_sum = score_sum + excluded.score_sum
+    ''',
+    '''
+    INSERT INTO investor_audit_summary (investor_id, last_timestamp, last_id, risk_level, compliance_score, warning)
+    SELECT investor_id, timestamp, id, risk_level, compliance_score,
+           risk_level = '高' OR COALESCE(compliance_score, 0) < 100
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY investor_id ORDER BY timestamp DESC, id DESC) AS latest_rank
+        FROM {source}.audit_records
+    )
+    WHERE latest_rank = 1
+    ON CONFLICT(investor_id) DO UPDATE SET
+        last_timestamp = excluded.last_timestamp,
+        last_id = excluded.last_id,
+        risk_level = excluded.risk_level,
+        compliance_score = excluded.compliance_score,
+        warning = excluded.warning
+    WHERE (excluded.last_timestamp, excluded.last_id) >= (last_timestamp, last_id)
+    ''',
+]
+
+# 背景作業佇列（時間欄位為 epoch 秒）
+JOB_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT,
+        idempotency_key TEXT UNIQUE,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        progress REAL NOT NULL DEFAULT 0,
+        message TEXT,
+        result TEXT,
+        error TEXT,
+        worker TEXT,
+        created_at REAL,
+        run_after REAL,
+        started_at REAL,
+        heartbeat_at REAL,
+        finished_at REAL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, run_after, id)",
+]
+
+
+# 審核記錄月分區登記：已移至封存檔的月份與實際資料時間範圍（路徑相對於熱資料庫目錄）
+PARTITION_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS audit_partitions (
+        period TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        min_timestamp DATETIME,
+        max_timestamp DATETIME,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+]
+
+# 審核發現與建議的全文檢索索引（trigram 分詞，可搜尋任意三字以上的中文子字串），由觸發器隨 audit_records 同步；
+# {schema} 為資料庫別名，封存分區以同一結構建立
+SEARCH_TABLES = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.audit_records_fts USING fts5(
+        findings, recommendations, content='audit_records', content_rowid='id', tokenize='trigram'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS {schema}.trg_audit_records_fts_insert AFTER INSERT ON audit_records
+    BEGIN
+        INSERT INTO audit_records_fts (rowid, findings, recommendations)
+        VALUES (NEW.id, NEW.findings, NEW.recommendations);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS {schema}.trg_audit_records_fts_delete AFTER DELETE ON audit_records
+    BEGIN
+        INSERT INTO audit_records_fts (audit_records_fts, rowid, findings, recommendations)
+        VALUES ('delete', OLD.id, OLD.findings, OLD.recommendations);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS {schema}.trg_audit_records_fts_update
+    AFTER UPDATE OF findings, recommendations ON audit_records
+    BEGIN
+        INSERT INTO audit_records_fts (audit_records_fts, rowid, findings, recommendations)
+        VALUES ('delete', OLD.id, OLD.findings, OLD.recommendations);
+        INSERT INTO audit_records_fts (rowid, findings, recommendations)
+        VALUES (NEW.id, NEW.findings, NEW.recommendations);
+    END
+    ''',
+]
+
+# 由 audit_records 全量重建全文檢索索引（遷移回填與修正偏差時使用）
+SEARCH_REBUILD = "INSERT INTO {schema}.audit_records_fts (audit_records_fts) VALUES ('rebuild')"
+
+# 結構遷移：依序執行，版本記錄於 PRAGMA user_version
+MIGRATIONS = [
+    # 1: 審核報告查詢索引（投資者 / 審核類型 + 時間，支援鍵集分頁）
+    [
+        "CREATE INDEX IF NOT EXISTS idx_audit_records_investor_time ON audit_records (investor_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_records_type_time ON audit_records (audit_type, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_records_time ON audit_records (timestamp)",
+    ],
+    # 2: 儀表板彙總表與觸發器，並回填既有資料
+    SUMMARY_TABLES + SUMMARY_REBUILD,
+    # 3: 背景作業佇列
+    JOB_TABLES,
+    # 4: 審核記錄的尾端風險（一日 VaR / CVaR，佔組合價值比例）
+    [
+        "ALTER TABLE audit_records ADD COLUMN tail_var REAL",
+        "ALTER TABLE audit_records ADD COLUMN tail_cvar REAL",
+    ],
+    # 5: 審核記錄月分區封存登記
+    PARTITION_TABLES,
+    # 6: 審核發現與建議全文檢索，並回填既有資料
+    [statement.format(schema="main") for statement in SEARCH_TABLES + [SEARCH_REBUILD]],
+    # 7: 修改與刪除審核記錄時同步儀表板彙總表
+    SUMMARY_CORRECTION_TABLES,
+    # 8: 各投資者審核記錄的變更次數
+    AUDIT_REVISION_TABLES,
+]
+
+
+def init_schema(db_path: Optional[str] = None):
+    """建立審核數據庫結構並套用尚未執行的遷移"""
+    def create(cursor: sqlite3.Cursor):
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(f"PRAGMA user_version = {number}")
+    run_write(create, db_path)
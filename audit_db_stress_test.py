@@ -0,0 +1,156 @@
+"""
+審核數據庫併發壓力測試 - 大戶投資審核系統
+比較「每次呼叫開關連線」與連線管理層在 N 寫入 / M 讀取執行緒下的吞吐量
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import audit_db
+
+INSERT_SQL = '''
+    INSERT INTO audit_records
+    (investor_id, audit_type, risk_level, portfolio_value, compliance_score, findings, recommendations, auditor)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+READ_SQL = 'SELECT COUNT(*), AVG(portfolio_value) FROM audit_records WHERE investor_id = ?'
+
+
+def _row(writer: int, i: int) -> tuple:
+    """產生一筆測試審核記錄"""
+    return (f"INV{writer:03d}", "例行審核", "中", 1000000.0 + i, 100, "", "", "壓力測試")
+
+
+def _naive_insert(db_path: str, params: tuple):
+    """舊寫法：每次開啟連線、提交後關閉"""
+    conn = sqlite3.connect(db_path)
+    conn.execute(INSERT_SQL, params)
+    conn.commit()
+    conn.close()
+
+
+def _naive_read(db_path: str, investor_id: str):
+    """舊寫法：每次開啟連線查詢後關閉"""
+    conn = sqlite3.connect(db_path)
+    conn.execute(READ_SQL, (investor_id,)).fetchall()
+    conn.close()
+
+
+def run_stress(mode: str, writers: int, readers: int, inserts_per_writer: int) -> dict:
+    """執行一次壓力測試並回傳統計結果"""
+    db_path = os.path.join(tempfile.mkdtemp(), f"stress_{mode}.db")
+    audit_db.init_schema(db_path)
+    audit_db.close_all()
+    if mode == "naive":
+        # 還原為預設 rollback journal，模擬舊行為
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+    stats = {"inserts": 0, "reads": 0, "write_errors": 0, "read_errors": 0}
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def count(key: str):
+        with lock:
+            stats[key] += 1
+
+    def writer(index: int):
+        for i in range(inserts_per_writer):
+            try:
+                if mode == "naive":
+                    _naive_insert(db_path, _row(index, i))
+                else:
+                    audit_db.execute_write(INSERT_SQL, _row(index, i), db_path)
+                count("inserts")
+            except sqlite3.Error:
+                count("write_errors")
+
+    def reader(index: int):
+        while not done.is_set():
+            investor_id = f"INV{index % max(writers, 1):03d}"
+            try:
+                if mode == "naive":
+                    _naive_read(db_path, investor_id)
+                else:
+                    audit_db.query(READ_SQL, (investor_id,), db_path)
+                count("reads")
+            except sqlite3.Error:
+                count("read_errors")
+
+    writer_threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    reader_threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+
+    start = time.perf_counter()
+    for thread in reader_threads + writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in reader_threads:
+        thread.join()
+    audit_db.close_all()
+
+    stats.update({
+        "mode": mode,
+        "writers": writers,
+        "readers": readers,
+        "elapsed_seconds": round(elapsed, 3),
+        "inserts_per_second": round(stats["inserts"] / elapsed, 1) if elapsed else 0,
+        "reads_per_second": round(stats["reads"] / elapsed, 1) if elapsed else 0,
+    })
+    return stats
+
+
+def test_pooled_connection_stress(writers: int = 4, readers: int = 4, inserts_per_writer: int = 200):
+    """測試連線管理層在併發下無鎖定錯誤"""
+    print("\n🗄 開始連線管理層併發測試...")
+    result = run_stress("pooled", writers, readers, inserts_per_writer)
+    print(f"📊 寫入 {result['inserts']} 筆，{result['inserts_per_second']} 筆/秒，"
+          f"寫入錯誤 {result['write_errors']}，讀取錯誤 {result['read_errors']}")
+    assert result["write_errors"] == 0 and result["read_errors"] == 0, "連線管理層併發下不應出現鎖定錯誤"
+    assert result["inserts"] == writers * inserts_per_writer
+
+
+def main():
+    """主測試程式"""
+    parser = argparse.ArgumentParser(description="審核數據庫併發壓力測試")
+    parser.add_argument("--writers", type=int, default=8, help="寫入執行緒數 N")
+    parser.add_argument("--readers", type=int, default=8, help="讀取執行緒數 M")
+    parser.add_argument("--inserts", type=int, default=500, help="每個寫入執行緒的寫入筆數")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出結果")
+    args = parser.parse_args()
+
+    results = [run_stress(mode, args.writers, args.readers, args.inserts) for mode in ("naive", "pooled")]
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print("=" * 60)
+    print("🗄 審核數據庫併發壓力測試")
+    print("=" * 60)
+    print(f"📅 測試時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"🧵 寫入執行緒: {args.writers}，讀取執行緒: {args.readers}，每執行緒寫入: {args.inserts}")
+    for result in results:
+        label = "改善前（每次開關連線）" if result["mode"] == "naive" else "改善後（連線管理層 + WAL）"
+        print(f"\n{label}")
+        print(f"  寫入: {result['inserts_per_second']} 筆/秒（錯誤 {result['write_errors']}）")
+        print(f"  讀取: {result['reads_per_second']} 筆/秒（錯誤 {result['read_errors']}）")
+        print(f"  耗時: {result['elapsed_seconds']} 秒")
+    print("=" * 60)
+    pooled = results[1]
+    if pooled["write_errors"] or pooled["read_errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
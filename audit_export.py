@@ -0,0 +1,176 @@
+"""
+審核記錄匯出 - 大戶投資審核系統
+以獨立唯讀連線於單一快照逐段讀取審核記錄（含封存分區），分批寫入 CSV 或 Parquet 資料列群組，記憶體用量與資料表大小無關
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+import pandas as pd
+
+import audit_db
+import audit_partitions
+import audit_queries
+import instrumentation
+
+DEFAULT_CHUNK_SIZE = 10_000
+EXPORT_FORMATS = ["csv", "parquet"]
+# CSV 加上 BOM，Excel 開啟中文欄位不會亂碼
+CSV_ENCODING = "utf-8-sig"
+
+# 各欄位的 Parquet 型別（固定結構，避免各段因空值推斷出不同型別）
+PARQUET_TYPES = {
+    "id": "int64", "timestamp": "string", "investor_id": "string", "audit_type": "string",
+    "risk_level": "string", "portfolio_value": "float64", "compliance_score": "int64",
+    "findings": "string", "recommendations": "string", "auditor": "string",
+    "tail_var": "float64", "tail_cvar": "float64",
+}
+
+
+def _read_only_connection(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """開啟唯讀連線：長時間讀取維持單一快照，不佔用執行緒共用的寫入連線"""
+    uri = Path(db_path or audit_db.DB_PATH).absolute().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=audit_db.BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout={audit_db.BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def _in_snapshot(conn: sqlite3.Connection, ids: List[int]) -> Set[int]:
+    """ids 中仍存在於熱資料庫（conn 的讀取快照）的記錄"""
+    rows = conn.execute("SELECT id FROM audit_records WHERE id IN (SELECT value FROM json_each(?))",
+                        (json.dumps(ids),)).fetchall()
+    return {row[0] for row in rows}
+
+
+def iter_audit_chunks(investor_id: Optional[str] = None, audit_date: Optional[date] = None,
+                      audit_type: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      db_path: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """依審核報告的篩選條件逐段讀取審核記錄，每段最多 chunk_size 筆
+
+    依序讀取熱資料庫與日期範圍涉及的封存分區（新到舊），各來源內由新到舊。
+    匯出結果為開始時熱資料庫的一致快照，與同時執行的 archive_period 無關：整個匯出期間維持熱資料庫的
+    同一讀取交易，分區清單也取自該快照；分區檔不是不可變的（重新封存會併入遲到的記錄），
+    因此分區中仍存在於快照的記錄（匯出開始後才搬移）略過，每筆記錄恰好匯出一次。
+    分區各以獨立連線讀取，不受 ATTACH 數量上限限制。
+    """
+    sql, params = audit_queries.build_audit_query(investor_id, audit_date, audit_type, page_size=None)
+    id_index = audit_queries.AUDIT_COLUMNS.index("id")
+    conn = _read_only_connection(db_path)
+    try:
+        conn.execute("BEGIN")
+        partitions = audit_queries.touched_partitions(audit_date, conn=conn)
+        sources = [None] + [audit_partitions.resolve_path(partition["path"], db_path) for partition in partitions]
+        for source in sources:
+            source_conn = _read_only_connection(source) if source else conn
+            try:
+                cursor = source_conn.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    if source:
+                        moved = _in_snapshot(conn, [row[id_index] for row in rows])
+                        rows = [row for row in rows if row[id_index] not in moved]
+                    if rows:
+                        yield pd.DataFrame.from_records(rows, columns=audit_queries.AUDIT_COLUMNS)
+            finally:
+                if source:
+                    source_conn.close()
+    finally:
+        conn.close()
+
+
+def _write_csv(chunks: Iterator[pd.DataFrame], path: str, report: Callable[[int], None]) -> int:
+    rows = 0
+    with open(path, "w", encoding=CSV_ENCODING, newline="") as f:
+        f.write(",".join(audit_queries.AUDIT_COLUMNS) + "\n")
+        for chunk in chunks:
+            chunk.to_csv(f, header=False, index=False, lineterminator="\n")
+            rows += len(chunk)
+            report(rows)
+    return rows
+
+
+def _write_parquet(chunks: Iterator[pd.DataFrame], path: str, report: Callable[[int], None]) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.type_for_alias(PARQUET_TYPES[name])) for name in audit_queries.AUDIT_COLUMNS])
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in chunks:
+            # 每段寫成一個資料列群組
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+            report(rows)
+    return rows
+
+
+def export_format(path: str, fmt: Optional[str] = None) -> str:
+    """決定匯出格式（未指定時依副檔名判斷）"""
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".") or "csv").lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支援的匯出格式: {fmt}")
+    return fmt
+
+
+@instrumentation.instrument("export.audit_records")
+def export_audit_records(path: str, fmt: Optional[str] = None, investor_id: Optional[str] = None,
+                         audit_date: Optional[date] = None, audit_type: Optional[str] = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE, db_path: Optional[str] = None,
+                         progress: Optional[Callable[[int], None]] = None) -> Dict:
+    """匯出審核記錄到 CSV 或 Parquet 檔
+
+    先寫入暫存檔，完成後才替換目標檔；progress 於每段寫入後以已匯出筆數呼叫。
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        fmt = export_format(path, fmt)
+        start = time.perf_counter()
+        chunks = iter_audit_chunks(investor_id, audit_date, audit_type, chunk_size, db_path)
+        writer = _write_parquet if fmt == "parquet" else _write_csv
+        rows = writer(chunks, temp_path, progress or (lambda rows: None))
+        os.replace(temp_path, path)
+        elapsed = time.perf_counter() - start
+        return {
+            "path": path,
+            "format": fmt,
+            "rows": rows,
+            "bytes": os.path.getsize(path),
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else 0,
+        }
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return {"error": str(e)}
+
+
+def main():
+    """命令列匯出程式"""
+    parser = argparse.ArgumentParser(description="匯出審核記錄（CSV / Parquet）")
+    parser.add_argument("path", help="輸出檔案路徑（副檔名 .csv 或 .parquet）")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default=None, help="匯出格式（預設依副檔名）")
+    parser.add_argument("--investor", default=None, help="投資者 ID")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="審核日期（YYYY-MM-DD）")
+    parser.add_argument("--type", choices=audit_db.AUDIT_TYPES, default=None, help="審核類型")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每段讀取筆數")
+    parser.add_argument("--db", default=None, help="審核數據庫路徑（預設 investment_audit.db）")
+    args = parser.parse_args()
+
+    result = export_audit_records(args.path, args.format, args.investor, args.date, args.type,
+                                  args.chunk_size, args.db)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if "error" in result:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+審核記錄匯出測試 - 大戶投資審核系統
+驗證 CSV / Parquet 匯出內容與查詢一致、篩選條件、匯出期間封存的快照一致性，以及記憶體用量不隨資料量增加
+"""
+
+import os
+import sys
+import tempfile
+import tracemalloc
+from datetime import date
+
+import pandas as pd
+
+import audit_db
+import audit_export
+import audit_partitions
+import audit_queries
+from audit_ingest import create_audit_records_bulk
+from benchmarks import make_snapshot
+
+
+def sample_database(rows: int) -> str:
+    """建立含 rows 筆審核記錄的暫存資料庫"""
+    db_path = os.path.join(tempfile.mkdtemp(), "audit.db")
+    audit_db.init_schema(db_path)
+    create_audit_records_bulk(make_snapshot(rows), db_path=db_path)
+    return db_path
+
+
+def test_export_matches_query():
+    """測試 CSV 與 Parquet 匯出內容與篩選查詢一致"""
+    print("\n📤 開始測試匯出內容...")
+    db_path = sample_database(5000)
+    filters = {"audit_type": "合規檢查", "audit_date": None, "investor_id": None}
+    expected = pd.DataFrame(audit_queries.query_audit_records(page_size=10_000, db_path=db_path,
+                                                              **filters)["rows"])
+
+    csv_result = audit_export.export_audit_records(db_path + ".csv", chunk_size=300, db_path=db_path, **filters)
+    parquet_result = audit_export.export_audit_records(db_path + ".parquet", chunk_size=300, db_path=db_path,
+                                                       **filters)
+    print(f"📊 CSV: {csv_result}\n📊 Parquet: {parquet_result}")
+    exported_csv = pd.read_csv(db_path + ".csv", dtype={"investor_id": str})
+    exported_parquet = pd.read_parquet(db_path + ".parquet")
+
+    import pyarrow.parquet as pq
+    row_groups = pq.ParquetFile(db_path + ".parquet").num_row_groups
+    assert csv_result["rows"] == parquet_result["rows"] == len(expected) > 0, "匯出筆數與查詢不符"
+    assert exported_csv["id"].tolist() == expected["id"].tolist(), "CSV 內容或順序與查詢不符"
+    assert exported_parquet["id"].tolist() == expected["id"].tolist(), "Parquet 內容或順序與查詢不符"
+    # 投資者 ID 須保留為字串（不可被轉為數字而遺失前導零）
+    assert exported_parquet["investor_id"].tolist() == expected["investor_id"].tolist()
+    assert set(exported_csv["audit_type"]) == {"合規檢查"}
+    assert row_groups == -(-len(expected) // 300), f"Parquet 列群組數 {row_groups} 與分段大小不符"
+    assert not os.path.exists(f"{db_path}.csv.{os.getpid()}.tmp"), "暫存檔未清除"
+
+
+def test_filters_and_errors():
+    """測試投資者與日期篩選、無符合資料時仍輸出欄位標題，以及錯誤回報"""
+    print("\n🔍 開始測試篩選條件...")
+    db_path = sample_database(2000)
+    row = audit_queries.query_audit_records(db_path=db_path)["rows"][0]
+    day = date.fromisoformat(row["timestamp"][:10])
+    by_investor = audit_export.export_audit_records(db_path + "_investor.csv", investor_id=row["investor_id"],
+                                                    db_path=db_path)
+    by_day = audit_export.export_audit_records(db_path + "_day.parquet", audit_date=day, db_path=db_path)
+    nobody = audit_export.export_audit_records(db_path + "_empty.parquet", investor_id="NOBODY", db_path=db_path)
+    unknown = audit_export.export_audit_records(db_path + ".xlsx", db_path=db_path)
+    print(f"📊 投資者 {by_investor['rows']} 筆，單日 {by_day['rows']} 筆，未知格式 {unknown}")
+    assert by_investor["rows"] == 1
+    assert by_day["rows"] == audit_queries.count_audit_records(audit_date=day, db_path=db_path) > 0, "單日匯出筆數不符"
+    assert nobody["rows"] == 0, "無符合資料時應匯出 0 筆"
+    assert list(pd.read_parquet(db_path + "_empty.parquet").columns) == audit_queries.AUDIT_COLUMNS, \
+        "無符合資料時仍應保留欄位結構"
+    assert "error" in unknown and not os.path.exists(db_path + ".xlsx"), "未知格式應回報錯誤且不留下檔案"
+
+
+def test_archive_during_export():
+    """測試匯出途中封存新月份、重新封存併入遲到的記錄，每筆記錄仍恰好匯出一次"""
+    print("\n🗄️ 開始測試匯出期間封存...")
+    db_path = os.path.join(tempfile.mkdtemp(), "audit.db")
+    audit_db.init_schema(db_path)
+    insert = ("INSERT INTO audit_records (timestamp, investor_id, audit_type, risk_level, portfolio_value, "
+              "compliance_score) VALUES (?, ?, '例行審核', '低', 5e7, 100)")
+    for day in range(1, 29):
+        for hour in range(10):
+            for month in ("2024-01", "2024-02", "2024-03"):
+                audit_db.execute_write(insert, (f"{month}-{day:02d} {hour:02d}:00:00", f"ARC{day:02d}"), db_path)
+    audit_partitions.archive_period("2024-01", db_path, "archive")
+    # 已封存月份的遲到記錄留在熱資料庫，待重新封存時併入既有分區
+    for day in range(1, 11):
+        audit_db.execute_write(insert, (f"2024-01-{day:02d} 23:00:00", "LATE"), db_path)
+    expected = sorted(row[0] for row in audit_db.query("SELECT id FROM audit_records", (), db_path)) + \
+        sorted(row[0] for row in audit_db.query("SELECT id FROM audit_records", (),
+                                                 os.path.join(os.path.dirname(db_path), "archive", "audit_2024_01.db")))
+
+    chunks = audit_export.iter_audit_chunks(chunk_size=50, db_path=db_path)
+    exported = list(next(chunks)["id"])
+    moved = [audit_partitions.archive_period(period, db_path, "archive")["moved"] for period in ("2024-01", "2024-02")]
+    for chunk in chunks:
+        exported += list(chunk["id"])
+    print(f"📊 匯出途中封存 {moved} 筆，共匯出 {len(exported)} 筆")
+    assert moved == [10, 280], "測試前提：重新封存與新月份封存都應搬移記錄"
+    assert len(exported) == len(set(exported)), "封存搬移的記錄被重複匯出"
+    assert sorted(exported) == sorted(expected), "匯出內容應為開始時的快照"
+
+    after = audit_export.export_audit_records(db_path + ".csv", db_path=db_path)
+    assert after["rows"] == len(expected), "封存後匯出筆數不符"
+
+
+def test_constant_memory():
+    """測試匯出的記憶體高峰不隨資料量增加"""
+    print("\n💾 開始測試記憶體用量...")
+    peaks = {}
+    for rows in (10_000, 60_000):
+        db_path = sample_database(rows)
+        for fmt in audit_export.EXPORT_FORMATS:
+            tracemalloc.start()
+            result = audit_export.export_audit_records(f"{db_path}.{fmt}", chunk_size=2000, db_path=db_path)
+            peaks[(rows, fmt)] = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+            print(f"📊 {rows} 筆 {fmt}: {result['bytes'] / 1e6:.1f} MB 檔案，記憶體高峰 {peaks[(rows, fmt)]:.1f} MB")
+    for fmt in audit_export.EXPORT_FORMATS:
+        assert peaks[(60_000, fmt)] < peaks[(10_000, fmt)] * 1.5, f"{fmt} 記憶體高峰隨資料量增加"
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("📤 審核記錄匯出測試")
+    print("=" * 60)
+
+    tests = [
+        ("📤 匯出內容測試", test_export_matches_query),
+        ("🔍 篩選條件測試", test_filters_and_errors),
+        ("🗄️ 匯出期間封存測試", test_archive_during_export),
+        ("💾 記憶體用量測試", test_constant_memory)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
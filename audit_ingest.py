@@ -0,0 +1,200 @@
+"""
+審核記錄批次匯入 - 大戶投資審核系統
+以大批次 executemany 與分段交易匯入大量歷史審核記錄，可直接於命令列執行
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, Optional, Union
+
+import pandas as pd
+
+import audit_db
+import instrumentation
+from compliance import evaluate_compliance
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_AUDITOR = "批次匯入"
+MAX_REJECTED_SAMPLES = 1000
+
+INSERT_SQL = '''
+    INSERT INTO audit_records
+    (timestamp, investor_id, audit_type, risk_level, portfolio_value, compliance_score, findings, recommendations, auditor)
+    VALUES (COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def _iter_chunks(source: Union[str, pd.DataFrame, Iterable[Dict]], batch_size: int) -> Iterator[pd.DataFrame]:
+    """將各種來源切成固定大小的 DataFrame 區塊"""
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        if path.lower().endswith(".parquet"):
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(path, chunksize=batch_size, dtype={"investor_id": str})
+    elif isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), batch_size):
+            yield source.iloc[start:start + batch_size]
+    else:
+        iterator = iter(source)
+        while True:
+            rows = list(islice(iterator, batch_size))
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows)
+
+
+def count_rows(path: str) -> int:
+    """估計檔案資料列數供進度回報：Parquet 讀取中繼資料，CSV 計算換行數（欄位內含換行時略為高估）"""
+    if path.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1
+    # 扣除標題列
+    return max(lines - 1, 0)
+
+
+def prepare_chunk(chunk: pd.DataFrame, auditor: str):
+    """驗證區塊並計算合規分數，回傳 (可寫入資料列, 拒絕原因)"""
+    chunk = chunk.reset_index(drop=True)
+    n = len(chunk)
+
+    def column(name: str, default=None) -> pd.Series:
+        if name in chunk:
+            return chunk[name]
+        return pd.Series([default] * n, dtype=object)
+
+    investor_id = column("investor_id").astype("string").str.strip()
+    audit_type = column("audit_type", audit_db.AUDIT_TYPES[0]).fillna(audit_db.AUDIT_TYPES[0]).astype(str)
+    risk_level = column("risk_level").astype("string")
+    portfolio_value = pd.to_numeric(column("portfolio_value"), errors="coerce")
+    # 審核時間統一為資料庫 CURRENT_TIMESTAMP 的格式（UTC，精確到秒），帶時區者先換算
+    raw_timestamp = column("timestamp")
+    timestamp = pd.to_datetime(raw_timestamp, errors="coerce", format="mixed", utc=True)
+
+    # 向量化驗證：依序記錄第一個不符合的原因
+    reason = pd.Series([None] * n, dtype=object)
+    checks = [
+        (investor_id.isna() | (investor_id == ""), "缺少投資者 ID"),
+        (~audit_type.isin(audit_db.AUDIT_TYPES), "審核類型無效"),
+        (~risk_level.isin(audit_db.RISK_LEVELS).fillna(False).astype(bool), "風險等級無效"),
+        (portfolio_value.isna() | (portfolio_value <= 0), "投資組合價值無效"),
+        (raw_timestamp.notna() & (raw_timestamp.astype(str).str.strip() != "") & timestamp.isna(), "審核時間無效"),
+    ]
+    for mask, message in checks:
+        mask = mask.fillna(True).astype(bool)
+        reason[mask & reason.isna()] = message
+    valid = reason.isna()
+
+    compliance = evaluate_compliance(chunk[valid].assign(portfolio_value=portfolio_value[valid]))
+
+    def text(name: str, fallback: Optional[pd.Series] = None) -> pd.Series:
+        values = column(name)[valid].astype(object)
+        values = values.where(values.notna(), None)
+        if fallback is not None:
+            values = values.where(values.notna() & (values != ""), fallback.map("；".join))
+        return values.fillna("")
+
+    timestamp = timestamp[valid].dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    rows = list(zip(
+        timestamp.astype(object).where(timestamp.notna(), None).tolist(),
+        investor_id[valid].astype(object).tolist(),
+        audit_type[valid].tolist(),
+        risk_level[valid].astype(object).tolist(),
+        portfolio_value[valid].astype(float).tolist(),
+        compliance["compliance_score"].round().astype(int).tolist(),
+        text("findings", compliance["findings"]).tolist(),
+        text("recommendations", compliance["recommendations"]).tolist(),
+        text("auditor").replace("", auditor).tolist(),
+    ))
+    rejected = [(int(index), message) for index, message in reason[~valid].items()]
+    return rows, rejected
+
+
+@instrumentation.instrument("db.bulk_ingest")
+def create_audit_records_bulk(source: Union[str, pd.DataFrame, Iterable[Dict]],
+                              batch_size: int = DEFAULT_BATCH_SIZE,
+                              auditor: str = DEFAULT_AUDITOR,
+                              db_path: Optional[str] = None,
+                              progress: Optional[Callable[[int], None]] = None,
+                              start_row: int = 0) -> Dict:
+    """批次創建審核記錄
+
+    source 可為 dict 迭代器、DataFrame，或 CSV / Parquet 檔案路徑。
+    每個批次於單一交易內以 executemany 寫入，回傳匯入統計與被拒絕的資料列。
+    progress 於每批寫入後以已處理列數呼叫。
+    中途失敗時已提交的批次不會回復，錯誤結果另附 inserted 與 failed_offset（失敗批次的第一列），
+    修正後以 start_row=failed_offset 重新匯入即可接續，不會重複寫入。
+    """
+    inserted = 0
+    rejected_count = 0
+    rejected_rows = []
+    offset = 0
+    try:
+        audit_db.init_schema(db_path)
+        start = time.perf_counter()
+
+        for chunk in _iter_chunks(source, batch_size):
+            skipped = min(max(start_row - offset, 0), len(chunk))
+            if skipped:
+                offset += skipped
+                chunk = chunk.iloc[skipped:]
+                if chunk.empty:
+                    continue
+            rows, rejected = prepare_chunk(chunk, auditor)
+            if rows:
+                audit_db.run_write(lambda cursor: cursor.executemany(INSERT_SQL, rows), db_path)
+            inserted += len(rows)
+            rejected_count += len(rejected)
+            for index, message in rejected:
+                if len(rejected_rows) < MAX_REJECTED_SAMPLES:
+                    rejected_rows.append({"row": offset + index, "reason": message})
+            offset += len(chunk)
+            if progress is not None:
+                progress(offset)
+
+        elapsed = time.perf_counter() - start
+        return {
+            "inserted": inserted,
+            "rejected": rejected_count,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(inserted / elapsed, 1) if elapsed > 0 else 0,
+            "rejected_rows": rejected_rows,
+        }
+    except Exception as e:
+        return {"error": str(e), "inserted": inserted, "rejected": rejected_count, "failed_offset": offset,
+                "rejected_rows": rejected_rows}
+
+
+def main():
+    """命令列匯入程式"""
+    parser = argparse.ArgumentParser(description="批次匯入審核記錄（CSV / Parquet）")
+    parser.add_argument("path", help="CSV 或 Parquet 檔案路徑")
+    parser.add_argument("--db", default=None, help="審核數據庫路徑（預設 investment_audit.db）")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每批寫入筆數")
+    parser.add_argument("--auditor", default=DEFAULT_AUDITOR, help="未提供審核員時的預設值")
+    parser.add_argument("--start-row", type=int, default=0, help="由第幾列開始匯入（中途失敗時填入 failed_offset）")
+    args = parser.parse_args()
+
+    result = create_audit_records_bulk(args.path, batch_size=args.batch_size,
+                                       auditor=args.auditor, db_path=args.db, start_row=args.start_row)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if "error" in result:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+審核記錄批次匯入測試 - 大戶投資審核系統
+驗證匯入與拒絕筆數、欄位驗證、進度回報、時間格式、中途失敗接續，以及批次寫入與逐筆寫入結果一致
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import audit_core
+import audit_db
+import audit_ingest
+
+STORED_COLUMNS = ["investor_id", "audit_type", "risk_level", "portfolio_value", "compliance_score",
+                  "findings", "recommendations", "auditor", "tail_var", "tail_cvar"]
+
+
+def new_database() -> str:
+    """建立暫存審核數據庫"""
+    db_path = os.path.join(tempfile.mkdtemp(), "audit.db")
+    audit_db.init_schema(db_path)
+    return db_path
+
+
+def stored_rows(db_path: str) -> list:
+    """依寫入順序讀取審核記錄（不含 id 與時間）"""
+    return audit_db.query(f"SELECT {', '.join(STORED_COLUMNS)} FROM audit_records ORDER BY id", (), db_path)
+
+
+def test_validation_and_counts():
+    """測試每種無效欄位的拒絕原因、跨批次的原始列號，以及只寫入有效資料列"""
+    print("\n🧮 開始測試欄位驗證...")
+    db_path = new_database()
+    records = pd.DataFrame([
+        {"investor_id": "INV001", "audit_type": "例行審核", "risk_level": "中", "portfolio_value": 5e7},
+        {"investor_id": None, "audit_type": "例行審核", "risk_level": "中", "portfolio_value": 5e7},
+        {"investor_id": "   ", "audit_type": "例行審核", "risk_level": "中", "portfolio_value": 5e7},
+        {"investor_id": "INV004", "audit_type": "年度審核", "risk_level": "中", "portfolio_value": 5e7},
+        {"investor_id": "INV005", "audit_type": None, "risk_level": "低", "portfolio_value": 5e7},
+        {"investor_id": "INV006", "audit_type": "特別審核", "risk_level": "極高", "portfolio_value": 5e7},
+        {"investor_id": "INV007", "audit_type": "特別審核", "risk_level": None, "portfolio_value": 5e7},
+        {"investor_id": "INV008", "audit_type": "風險評估", "risk_level": "高", "portfolio_value": 0},
+        {"investor_id": "INV009", "audit_type": "風險評估", "risk_level": "高", "portfolio_value": "abc"},
+        {"investor_id": " INV010 ", "audit_type": "合規檢查", "risk_level": "高", "portfolio_value": "2e8"},
+        # 多個欄位無效時回報第一個檢查到的原因
+        {"investor_id": "", "audit_type": "未知", "risk_level": "未知", "portfolio_value": -1},
+    ])
+    result = audit_ingest.create_audit_records_bulk(records, batch_size=3, db_path=db_path)
+    stored = stored_rows(db_path)
+    print(f"📊 匯入 {result['inserted']} 筆，拒絕 {result['rejected']} 筆: {result['rejected_rows']}")
+
+    assert result["inserted"] == 3 and result["rejected"] == 8, f"筆數不符: {result}"
+    assert result["rejected_rows"] == [
+        {"row": 1, "reason": "缺少投資者 ID"},
+        {"row": 2, "reason": "缺少投資者 ID"},
+        {"row": 3, "reason": "審核類型無效"},
+        {"row": 5, "reason": "風險等級無效"},
+        {"row": 6, "reason": "風險等級無效"},
+        {"row": 7, "reason": "投資組合價值無效"},
+        {"row": 8, "reason": "投資組合價值無效"},
+        {"row": 10, "reason": "缺少投資者 ID"},
+    ], "拒絕原因或原始列號不符（列號應跨批次累計）"
+    assert [row[0] for row in stored] == ["INV001", "INV005", "INV010"], "投資者 ID 應去除前後空白"
+    assert stored[1][1] == audit_db.AUDIT_TYPES[0], "缺少審核類型時應使用預設類型"
+    assert stored[2][3] == 2e8, "文字格式的市值應轉為數值"
+
+    empty = audit_ingest.create_audit_records_bulk(records.iloc[[1, 2]], db_path=db_path)
+    assert empty["inserted"] == 0 and empty["rejected"] == 2 and len(stored_rows(db_path)) == 3
+    missing = audit_ingest.create_audit_records_bulk(os.path.join(tempfile.mkdtemp(), "missing.csv"),
+                                                     db_path=db_path)
+    assert "error" in missing, "來源檔案不存在時應回傳錯誤"
+
+
+def test_progress_and_sources():
+    """測試每批寫入後回報累計列數，且 DataFrame、dict 迭代器、CSV 與 Parquet 來源結果一致"""
+    print("\n📶 開始測試進度回報與來源格式...")
+    root = tempfile.mkdtemp()
+    records = pd.DataFrame({"investor_id": [f"P{i:03d}" for i in range(10)], "audit_type": "例行審核",
+                            "risk_level": ["低", "中", "高", "低", "中", "高", "低", "中", "高", "低"],
+                            "portfolio_value": np.linspace(1e6, 2e7, 10)})
+    records.loc[4, "risk_level"] = "無效"
+    records.to_csv(os.path.join(root, "records.csv"), index=False)
+    records.to_parquet(os.path.join(root, "records.parquet"))
+    sources = {
+        "DataFrame": records,
+        "dict": iter(records.to_dict("records")),
+        "CSV": os.path.join(root, "records.csv"),
+        "Parquet": os.path.join(root, "records.parquet"),
+    }
+
+    contents = {}
+    for name, source in sources.items():
+        db_path = new_database()
+        calls = []
+        result = audit_ingest.create_audit_records_bulk(source, batch_size=4, db_path=db_path, progress=calls.append)
+        contents[name] = stored_rows(db_path)
+        print(f"📊 {name}: 進度 {calls}，匯入 {result['inserted']} 筆")
+        assert calls == [4, 8, 10], f"{name} 進度應為每批後的累計列數（含被拒絕的列），實際 {calls}"
+        assert result["inserted"] == 9 and result["rejected_rows"] == [{"row": 4, "reason": "風險等級無效"}]
+    assert all(rows == contents["DataFrame"] for rows in contents.values()), "不同來源格式的寫入結果不一致"
+
+
+def test_timestamps():
+    """測試審核時間統一為 UTC、精確到秒的資料庫格式，無法解析的時間被拒絕"""
+    print("\n🕒 開始測試審核時間格式...")
+    db_path = new_database()
+    timestamps = [pd.Timestamp("2024-03-01 09:30:15.750"), "2024-03-01T09:30:15+08:00", datetime(2024, 3, 2, 8),
+                  "2024/03/03 10:00", None, "下週一"]
+    records = pd.DataFrame({"investor_id": [f"T{i:03d}" for i in range(len(timestamps))], "audit_type": "例行審核",
+                            "risk_level": "低", "portfolio_value": 5e6, "timestamp": pd.Series(timestamps, dtype=object)})
+    result = audit_ingest.create_audit_records_bulk(records, db_path=db_path)
+    stored = audit_db.query("SELECT investor_id, timestamp, timestamp = datetime(timestamp) FROM audit_records "
+                            "ORDER BY id", (), db_path)
+    print(f"📊 {stored}")
+    assert result["rejected_rows"] == [{"row": 5, "reason": "審核時間無效"}], f"拒絕原因不符: {result}"
+    assert [row[1] for row in stored[:4]] == ["2024-03-01 09:30:15", "2024-03-01 01:30:15", "2024-03-02 08:00:00",
+                                              "2024-03-03 10:00:00"], "審核時間應轉為 UTC 的 YYYY-MM-DD HH:MM:SS"
+    assert all(row[2] for row in stored), "缺少審核時間時應使用 CURRENT_TIMESTAMP，格式須與 SQLite 日期函式一致"
+
+
+def test_failure_and_resume():
+    """測試中途失敗時回傳已寫入筆數與失敗批次的起始列，並可由該列接續而不重複寫入"""
+    print("\n♻️ 開始測試中途失敗與接續...")
+    db_path = new_database()
+    records = [{"investor_id": f"R{i:03d}", "audit_type": "例行審核", "risk_level": "中" if i != 7 else "未知",
+                "portfolio_value": 5e6} for i in range(10)]
+
+    def broken_source():
+        for index, record in enumerate(records):
+            if index == 7:
+                raise IOError("來源讀取中斷")
+            yield record
+
+    failed = audit_ingest.create_audit_records_bulk(broken_source(), batch_size=3, db_path=db_path)
+    print(f"📊 失敗結果: {failed}")
+    assert failed["error"] == "來源讀取中斷"
+    assert failed["inserted"] == 6 and failed["failed_offset"] == 6, "應回報已提交的筆數與失敗批次的起始列"
+    assert len(stored_rows(db_path)) == 6
+
+    resumed = audit_ingest.create_audit_records_bulk(records, batch_size=3, db_path=db_path,
+                                                     start_row=failed["failed_offset"])
+    print(f"📊 接續結果: 匯入 {resumed['inserted']} 筆，拒絕 {resumed['rejected_rows']}")
+    assert resumed["inserted"] == 3 and resumed["rejected_rows"] == [{"row": 7, "reason": "風險等級無效"}], \
+        "接續匯入應只處理起始列之後的資料，拒絕列號仍以原始來源計算"
+    assert [row[0] for row in stored_rows(db_path)] == [f"R{i:03d}" for i in range(10) if i != 7], "接續後不應重複寫入"
+
+
+def test_matches_single_insert():
+    """測試批次寫入的每一欄與逐筆 audit_core.create_audit_record 寫入一致"""
+    print("\n🪞 開始測試批次與逐筆一致...")
+    records = pd.DataFrame([
+        {"investor_id": "INV001", "audit_type": "例行審核", "risk_level": "低", "portfolio_value": 5e6},
+        {"investor_id": "INV002", "audit_type": "特別審核", "risk_level": "高", "portfolio_value": 2.5e8},
+        {"investor_id": "INV003", "audit_type": "合規檢查", "risk_level": "中", "portfolio_value": 1e7,
+         "findings": "大額轉入", "recommendations": "追蹤資金來源", "auditor": "王審核"},
+        {"investor_id": "INV004", "audit_type": "風險評估", "risk_level": "中", "portfolio_value": 10000000.01},
+    ])
+    bulk_db, single_db = new_database(), new_database()
+    audit_ingest.create_audit_records_bulk(records, auditor="批次", db_path=bulk_db)
+
+    for record in records.to_dict("records"):
+        check = audit_core.generate_compliance_check(record["portfolio_value"])
+        findings = record.get("findings") if isinstance(record.get("findings"), str) else "；".join(check["findings"])
+        recommendations = (record.get("recommendations") if isinstance(record.get("recommendations"), str)
+                           else "；".join(check["recommendations"]))
+        auditor = record.get("auditor") if isinstance(record.get("auditor"), str) else "批次"
+        created = audit_core.create_audit_record(record["investor_id"], record["audit_type"], record["risk_level"],
+                                                 record["portfolio_value"], round(check["compliance_score"]),
+                                                 findings, recommendations, auditor, db_path=single_db)
+        assert "id" in created, f"逐筆寫入失敗: {created}"
+
+    bulk, single = stored_rows(bulk_db), stored_rows(single_db)
+    for row in bulk:
+        print(f"📊 {row}")
+    assert bulk == single, "批次寫入結果與逐筆寫入不一致"
+    assert bulk[1][4] == 80 and bulk[1][5] == "投資金額超過大戶定義上限", "超過上限應扣分並記錄發現"
+    assert bulk[2][4] == 100 and bulk[3][4] == 80, "上限本身符合規定，超過一分錢即不符合"
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("📥 審核記錄批次匯入測試")
+    print("=" * 60)
+
+    tests = [
+        ("🧮 欄位驗證測試", test_validation_and_counts),
+        ("📶 進度回報測試", test_progress_and_sources),
+        ("🕒 審核時間格式測試", test_timestamps),
+        ("♻️ 中途失敗接續測試", test_failure_and_resume),
+        ("🪞 批次與逐筆一致測試", test_matches_single_insert)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
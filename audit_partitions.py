@@ -0,0 +1,218 @@
+"""
+審核記錄分區封存 - 大戶投資審核系統
+將較舊月份的審核記錄移至每月一個封存檔，查詢時依時間範圍以 ATTACH 附加涉及的分區
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import audit_db
+import instrumentation
+
+ARCHIVE_DIR = os.environ.get("AUDIT_ARCHIVE_DIR", "audit_archive")
+# 熱資料庫保留的月數（含當月）
+HOT_MONTHS = 3
+# SQLite 預設最多附加 10 個資料庫，單次查詢保留餘裕
+MAX_ATTACHED = 8
+
+PARTITION_COLUMNS = ["period", "path", "min_timestamp", "max_timestamp", "row_count", "archived_at"]
+
+ARCHIVE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_audit_records_investor_time ON audit_records (investor_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_audit_records_type_time ON audit_records (audit_type, timestamp)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_audit_records_time ON audit_records (timestamp)",
+]
+
+
+def period_bounds(period: str) -> Tuple[str, str]:
+    """月份（YYYY-MM）的時間範圍 [起, 迄)"""
+    year, month = map(int, period.split("-"))
+    start = date(year, month, 1)
+    end = date(year + month // 12, month % 12 + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
+def _base_dir(db_path: Optional[str]) -> str:
+    return os.path.dirname(os.path.abspath(db_path or audit_db.DB_PATH))
+
+
+def resolve_path(path: str, db_path: Optional[str] = None) -> str:
+    """登記的封存檔路徑（相對於熱資料庫目錄）轉為實際路徑"""
+    return os.path.join(_base_dir(db_path), path)
+
+
+def list_partitions(db_path: Optional[str] = None) -> List[Dict]:
+    """所有已封存分區（新到舊）"""
+    rows = audit_db.query(f"SELECT {', '.join(PARTITION_COLUMNS)} FROM audit_partitions ORDER BY period DESC",
+                          db_path=db_path)
+    return [dict(zip(PARTITION_COLUMNS, row)) for row in rows]
+
+
+def partitions_for(start: Optional[str] = None, end: Optional[str] = None,
+                   db_path: Optional[str] = None, conn: Optional[sqlite3.Connection] = None) -> List[Dict]:
+    """資料時間與 [start, end) 重疊的封存分區（新到舊），未指定時回傳全部；指定 conn 時於該連線（交易）讀取"""
+    sql = f"SELECT {', '.join(PARTITION_COLUMNS)} FROM audit_partitions WHERE row_count > 0"
+    params = []
+    if start:
+        sql += " AND max_timestamp >= ?"
+        params.append(start)
+    if end:
+        sql += " AND min_timestamp < ?"
+        params.append(end)
+    sql += " ORDER BY period DESC"
+    rows = conn.execute(sql, params).fetchall() if conn else audit_db.query(sql, params, db_path)
+    return [dict(zip(PARTITION_COLUMNS, row)) for row in rows]
+
+
+def batches(partitions: List[Dict]) -> Iterator[List[Dict]]:
+    """依附加上限切分分區"""
+    for offset in range(0, len(partitions), MAX_ATTACHED):
+        yield partitions[offset:offset + MAX_ATTACHED]
+
+
+@contextmanager
+def attached(partitions: List[Dict], db_path: Optional[str] = None):
+    """於目前執行緒的連線附加分區（別名 p0、p1…），離開時卸離；回傳 (連線, 別名清單)"""
+    conn = audit_db.get_connection(db_path)
+    aliases = []
+    try:
+        for index, partition in enumerate(partitions):
+            path = resolve_path(partition["path"], db_path)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"找不到封存分區 {partition['period']}: {path}")
+            conn.execute(f"ATTACH DATABASE ? AS p{index}", (path,))
+            aliases.append(f"p{index}")
+        yield conn, aliases
+    finally:
+        for alias in aliases:
+            conn.execute(f"DETACH DATABASE {alias}")
+
+
+def prepare_archive(conn: sqlite3.Connection, schema: str):
+    """依熱資料庫的 audit_records 欄位建立（或補齊）封存表、索引與全文檢索索引"""
+    columns = [(row[1], row[2]) for row in conn.execute("PRAGMA main.table_info(audit_records)")]
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {schema}.audit_records (id INTEGER PRIMARY KEY, " +
+                 ", ".join(f"{name} {kind}" for name, kind in columns if name != "id") + ")")
+    existing = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(audit_records)")}
+    for name, kind in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {schema}.audit_records ADD COLUMN {name} {kind}")
+    for statement in ARCHIVE_INDEXES:
+        conn.execute(statement.format(schema=schema))
+    # 加入全文檢索前建立的封存檔：建立索引後回填既有記錄
+    indexed = conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'audit_records_fts'").fetchone()
+    for statement in audit_db.SEARCH_TABLES:
+        conn.execute(statement.format(schema=schema))
+    if not indexed:
+        conn.execute(audit_db.SEARCH_REBUILD.format(schema=schema))
+    return [name for name, _ in columns]
+
+
+@instrumentation.instrument("db.archive_period")
+def archive_period(period: str, db_path: Optional[str] = None, archive_dir: str = ARCHIVE_DIR) -> Dict:
+    """將指定月份的審核記錄移至封存檔
+
+    先於封存檔提交複製（以 id 去重，可重複執行），確認每筆都已寫入後才在熱資料庫刪除並登記分區；
+    WAL 模式下跨檔交易不保證同時提交，分兩階段可避免中斷時遺失資料。
+    """
+    start, end = period_bounds(period)
+    relative = os.path.join(archive_dir, f"audit_{period.replace('-', '_')}.db")
+    path = resolve_path(relative, db_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = audit_db.get_connection(db_path)
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        columns = ", ".join(audit_db.run_write(lambda cursor: prepare_archive(cursor.connection, "archive"),
+                                               db_path))
+        audit_db.run_write(lambda cursor: cursor.execute(
+            f"INSERT OR IGNORE INTO archive.audit_records ({columns}) "
+            f"SELECT {columns} FROM main.audit_records WHERE timestamp >= ? AND timestamp < ?", (start, end)),
+            db_path)
+
+        def move(cursor):
+            missing = cursor.execute('''
+                SELECT COUNT(*) FROM main.audit_records AS hot
+                WHERE timestamp >= ? AND timestamp < ?
+                  AND NOT EXISTS (SELECT 1 FROM archive.audit_records AS cold WHERE cold.id = hot.id)
+            ''', (start, end)).fetchone()[0]
+            if missing:
+                raise RuntimeError(f"{period} 有 {missing} 筆記錄未寫入封存檔，取消刪除")
+            # 搬移到封存檔的記錄仍計入儀表板彙總，刪除期間停用彙總修正觸發器
+            cursor.execute("UPDATE main.audit_maintenance SET archiving = 1")
+            moved = cursor.execute("DELETE FROM main.audit_records WHERE timestamp >= ? AND timestamp < ?",
+                                   (start, end)).rowcount
+            cursor.execute("UPDATE main.audit_maintenance SET archiving = 0")
+            stats = cursor.execute("SELECT MIN(timestamp), MAX(timestamp), COUNT(*) FROM archive.audit_records"
+                                   ).fetchone()
+            cursor.execute('''
+                INSERT INTO audit_partitions (period, path, min_timestamp, max_timestamp, row_count, archived_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(period) DO UPDATE SET
+                    path = excluded.path,
+                    min_timestamp = excluded.min_timestamp,
+                    max_timestamp = excluded.max_timestamp,
+                    row_count = excluded.row_count,
+                    archived_at = excluded.archived_at
+            ''', (period, relative, *stats))
+            return moved, stats[2]
+
+        moved, total = audit_db.run_write(move, db_path)
+    finally:
+        conn.execute("DETACH DATABASE archive")
+    return {"period": period, "path": path, "moved": moved, "row_count": total}
+
+
+def archivable_periods(keep_months: int = HOT_MONTHS, today: Optional[date] = None,
+                       db_path: Optional[str] = None) -> List[str]:
+    """熱資料庫中早於保留期間的月份（舊到新）"""
+    today = today or date.today()
+    months = today.year * 12 + today.month - 1 - (keep_months - 1)
+    cutoff = date(months // 12, months % 12 + 1, 1).isoformat()
+    rows = audit_db.query("SELECT DISTINCT substr(timestamp, 1, 7) FROM audit_records WHERE timestamp < ? "
+                          "ORDER BY 1", (cutoff,), db_path)
+    return [row[0] for row in rows]
+
+
+def archive_old_partitions(keep_months: int = HOT_MONTHS, today: Optional[date] = None,
+                           db_path: Optional[str] = None, archive_dir: str = ARCHIVE_DIR,
+                           vacuum: bool = False) -> Dict:
+    """封存保留期間以前的所有月份，vacuum=True 時於完成後壓縮熱資料庫"""
+    try:
+        results = [archive_period(period, db_path, archive_dir)
+                   for period in archivable_periods(keep_months, today, db_path)]
+        if vacuum and results:
+            audit_db.with_retry(lambda: audit_db.get_connection(db_path).execute("VACUUM"))
+        return {"archived": results, "moved": sum(result["moved"] for result in results)}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def main():
+    """命令列：列出或封存分區"""
+    parser = argparse.ArgumentParser(description="審核記錄月分區封存")
+    parser.add_argument("--db", default=None, help="審核數據庫路徑（預設 investment_audit.db）")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="封存檔目錄（相對於熱資料庫目錄）")
+    parser.add_argument("--archive", action="store_true", help="封存保留期間以前的月份")
+    parser.add_argument("--keep-months", type=int, default=HOT_MONTHS, help="熱資料庫保留月數（含當月）")
+    parser.add_argument("--vacuum", action="store_true", help="封存後壓縮熱資料庫")
+    args = parser.parse_args()
+
+    audit_db.init_schema(args.db)
+    if args.archive:
+        result = archive_old_partitions(args.keep_months, db_path=args.db, archive_dir=args.archive_dir,
+                                        vacuum=args.vacuum)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        if "error" in result:
+            sys.exit(1)
+        return
+    print(json.dumps(list_partitions(args.db), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
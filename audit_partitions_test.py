@@ -0,0 +1,146 @@
+"""
+審核記錄分區封存測試 - 大戶投資審核系統
+驗證封存前後查詢結果一致、分區路由、彙總重建與重複封存
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date
+
+import audit_db
+import audit_export
+import audit_partitions
+import audit_queries
+import audit_summary
+from audit_ingest import create_audit_records_bulk
+from benchmarks import make_snapshot
+
+
+def sample_database(rows: int = 6000) -> str:
+    """建立審核時間分布於 2024 全年的暫存資料庫"""
+    db_path = os.path.join(tempfile.mkdtemp(), "audit.db")
+    audit_db.init_schema(db_path)
+    create_audit_records_bulk(make_snapshot(rows), db_path=db_path)
+    return db_path
+
+
+def walk_ids(db_path: str, page_size: int = 500, **filters) -> list:
+    """以鍵集分頁走訪全部符合的記錄 id"""
+    ids, cursor = [], None
+    while True:
+        page = audit_queries.query_audit_records(cursor=cursor, page_size=page_size, db_path=db_path, **filters)
+        ids += [row["id"] for row in page["rows"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def summary_tables(db_path: str) -> dict:
+    """彙總表內容"""
+    return {table: audit_db.query(f"SELECT * FROM {table} ORDER BY 1", db_path=db_path)
+            for table in ("daily_audit_summary", "investor_audit_summary", "risk_level_summary")}
+
+
+def test_archive_preserves_queries():
+    """測試封存後分頁、篩選、筆數、匯出與彙總重建結果不變，熱資料庫只剩保留月份"""
+    print("\n🗄️ 開始測試封存前後查詢一致...")
+    db_path = sample_database()
+    day = date(2024, 6, 3)
+    before = {
+        "all": walk_ids(db_path),
+        "type": walk_ids(db_path, audit_type="合規檢查"),
+        "day": walk_ids(db_path, audit_date=day),
+        "count": audit_queries.count_audit_records(db_path=db_path),
+        "summary": summary_tables(db_path),
+    }
+
+    result = audit_partitions.archive_old_partitions(keep_months=3, today=date(2025, 1, 15), db_path=db_path,
+                                                     vacuum=True)
+    hot_rows = audit_db.query_one("SELECT COUNT(*) FROM audit_records", db_path=db_path)[0]
+    print(f"📊 封存 {len(result['archived'])} 個月 {result['moved']} 筆，熱資料庫剩 {hot_rows} 筆")
+
+    audit_summary.rebuild_summaries(db_path)
+    export = audit_export.export_audit_records(db_path + ".csv", db_path=db_path)
+    routed = audit_queries.touched_partitions(audit_date=day, db_path=db_path)
+    print(f"📊 {day} 路由分區: {[partition['period'] for partition in routed]}")
+    assert "error" not in result and len(result["archived"]) == 10, f"封存結果不符: {result}"
+    assert hot_rows == before["count"] - result["moved"] and 0 < hot_rows < before["count"] / 4, \
+        f"熱資料庫剩 {hot_rows} 筆，與搬移筆數不符"
+    assert walk_ids(db_path) == before["all"], "封存後全部分頁結果改變"
+    assert walk_ids(db_path, audit_type="合規檢查") == before["type"], "封存後審核類型篩選結果改變"
+    assert before["day"] and walk_ids(db_path, audit_date=day) == before["day"], "封存後單日篩選結果改變"
+    assert audit_queries.count_audit_records(db_path=db_path) == before["count"]
+    assert summary_tables(db_path) == before["summary"], "重建的彙總表與封存前不同"
+    assert export["rows"] == before["count"]
+    assert [partition["period"] for partition in routed] == ["2024-06"], "單日查詢應只附加當月分區"
+
+
+def test_late_rows_and_rerun():
+    """測試已封存月份的補登記錄仍依時間排序，重新封存會併入同一分區"""
+    print("\n🔁 開始測試補登與重複封存...")
+    db_path = sample_database(2000)
+    audit_partitions.archive_old_partitions(keep_months=1, today=date(2025, 1, 15), db_path=db_path)
+    audit_db.execute_write("INSERT INTO audit_records (timestamp, investor_id, audit_type, risk_level) "
+                           "VALUES ('2024-03-15 12:00:00', 'LATE001', '特別審核', '高')", db_path=db_path)
+    late_id = audit_db.query_one("SELECT MAX(id) FROM audit_records", db_path=db_path)[0]
+    march = walk_ids(db_path, audit_date=date(2024, 3, 15))
+    everything = walk_ids(db_path, page_size=97)
+
+    again = audit_partitions.archive_old_partitions(keep_months=1, today=date(2025, 1, 15), db_path=db_path)
+    partitions = {partition["period"]: partition for partition in audit_partitions.list_partitions(db_path)}
+    print(f"📊 重新封存: {again}")
+    assert late_id in march, "補登記錄未出現在當日查詢"
+    assert len(everything) == 2001 and len(set(everything)) == 2001, "跨熱資料庫與分區分頁有漏讀或重複"
+    assert [item["period"] for item in again["archived"]] == ["2024-03"] and again["moved"] == 1, \
+        f"重新封存應只搬移補登的一筆: {again}"
+    assert walk_ids(db_path, page_size=97) == everything, "重新封存後分頁結果改變"
+    assert len(partitions) == 12, "重新封存不應建立新的分區"
+    assert sum(partition["row_count"] for partition in partitions.values()) == 2001
+
+
+def test_missing_partition():
+    """測試封存檔遺失時回報錯誤而非回傳不完整結果"""
+    print("\n⚠️ 開始測試封存檔遺失...")
+    db_path = sample_database(500)
+    audit_partitions.archive_period("2024-02", db_path)
+    os.remove(audit_partitions.resolve_path(audit_partitions.list_partitions(db_path)[0]["path"], db_path))
+    try:
+        audit_queries.query_audit_records(audit_date=date(2024, 2, 10), db_path=db_path)
+    except FileNotFoundError as e:
+        print(f"📊 {e}")
+        return
+    raise AssertionError("封存檔遺失時應拋出 FileNotFoundError")
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("🗄️ 審核記錄分區封存測試")
+    print("=" * 60)
+
+    tests = [
+        ("🗄️ 封存前後一致測試", test_archive_preserves_queries),
+        ("🔁 補登與重複封存測試", test_late_rows_and_rerun),
+        ("⚠️ 封存檔遺失測試", test_missing_partition)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
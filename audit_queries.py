@@ -0,0 +1,132 @@
+"""
+審核記錄查詢 - 大戶投資審核系統
+參數化篩選與鍵集（游標）分頁，依索引由新到舊讀取審核記錄
+"""
+
+import sqlite3
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import audit_db
+import audit_partitions
+import instrumentation
+
+DEFAULT_PAGE_SIZE = 50
+
+AUDIT_COLUMNS = ["id", "timestamp", "investor_id", "audit_type", "risk_level", "portfolio_value",
+                 "compliance_score", "findings", "recommendations", "auditor", "tail_var", "tail_cvar"]
+
+
+def filter_conditions(investor_id: Optional[str] = None, audit_date: Optional[date] = None,
+                       audit_type: Optional[str] = None,
+                       cursor: Optional[Tuple[str, int]] = None) -> Tuple[List[str], list]:
+    """篩選條件與參數；日期篩選以範圍條件表示以便使用索引"""
+    conditions = []
+    params = []
+
+    if investor_id:
+        conditions.append("investor_id = ?")
+        params.append(investor_id)
+    if audit_type:
+        conditions.append("audit_type = ?")
+        params.append(audit_type)
+    if audit_date:
+        conditions.append("timestamp >= ? AND timestamp < ?")
+        params.extend([audit_date.isoformat(), (audit_date + timedelta(days=1)).isoformat()])
+    if cursor:
+        conditions.append("(timestamp, id) < (?, ?)")
+        params.extend(cursor)
+    return conditions, params
+
+
+def build_audit_query(investor_id: Optional[str] = None, audit_date: Optional[date] = None,
+                      audit_type: Optional[str] = None, cursor: Optional[Tuple[str, int]] = None,
+                      page_size: Optional[int] = DEFAULT_PAGE_SIZE,
+                      table: str = "audit_records") -> Tuple[str, list]:
+    """組出參數化查詢語句
+
+    cursor 為上一頁最後一筆的 (timestamp, id)；page_size 為 None 時不加 LIMIT（匯出全部符合資料）；
+    table 可指定附加分區的資料表（如 p0.audit_records）。
+    """
+    conditions, params = filter_conditions(investor_id, audit_date, audit_type, cursor)
+    sql = f"SELECT {', '.join(AUDIT_COLUMNS)} FROM {table}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY timestamp DESC, id DESC"
+    if page_size is not None:
+        sql += " LIMIT ?"
+        params.append(page_size)
+    return sql, params
+
+
+def touched_partitions(audit_date: Optional[date] = None, cursor: Optional[Tuple[str, int]] = None,
+                       db_path: Optional[str] = None, conn: Optional[sqlite3.Connection] = None) -> List[Dict]:
+    """篩選條件涉及的封存分區（新到舊）"""
+    start = audit_date.isoformat() if audit_date else None
+    end = (audit_date + timedelta(days=1)).isoformat() if audit_date else None
+    if cursor:
+        # 游標之後的資料 timestamp <= 游標時間；s + "\0" 為緊接 s 之後的字串
+        end = min(filter(None, [end, cursor[0] + "\0"]))
+    return audit_partitions.partitions_for(start, end, db_path, conn)
+
+
+def _federated_page(investor_id: Optional[str], audit_date: Optional[date], audit_type: Optional[str],
+                    cursor: Optional[Tuple[str, int]], limit: int, partitions: List[Dict],
+                    db_path: Optional[str]) -> List[tuple]:
+    """於熱資料庫與涉及的分區各取前 limit 筆再合併；分區依時間不重疊，頁面已滿且較舊分區不可能入選時停止"""
+    rows: List[tuple] = []
+    for number, batch in enumerate(audit_partitions.batches(partitions)):
+        if len(rows) >= limit and batch[0]["max_timestamp"] < rows[limit - 1][1]:
+            break
+        with audit_partitions.attached(batch, db_path) as (conn, aliases):
+            tables = (["main"] if number == 0 else []) + aliases
+            queries = [build_audit_query(investor_id, audit_date, audit_type, cursor, limit, f"{table}.audit_records")
+                       for table in tables]
+            sql = (" UNION ALL ".join(f"SELECT * FROM ({query})" for query, _ in queries)
+                   + " ORDER BY timestamp DESC, id DESC LIMIT ?")
+            params = [param for _, query_params in queries for param in query_params] + [limit]
+            fetched = audit_db.with_retry(lambda: conn.execute(sql, params).fetchall())
+        rows = sorted(rows + fetched, key=lambda row: (row[1], row[0]), reverse=True)[:limit]
+    return rows
+
+
+@instrumentation.instrument("report.audit_page")
+def query_audit_records(investor_id: Optional[str] = None, audit_date: Optional[date] = None,
+                        audit_type: Optional[str] = None, cursor: Optional[Tuple[str, int]] = None,
+                        page_size: int = DEFAULT_PAGE_SIZE, db_path: Optional[str] = None) -> Dict:
+    """查詢一頁審核記錄，回傳資料列與下一頁游標（只附加日期範圍涉及的封存分區）"""
+    partitions = touched_partitions(audit_date, cursor, db_path)
+    # 多取一筆以判斷是否還有下一頁
+    if partitions:
+        raw = _federated_page(investor_id, audit_date, audit_type, cursor, page_size + 1, partitions, db_path)
+    else:
+        sql, params = build_audit_query(investor_id, audit_date, audit_type, cursor, page_size + 1)
+        raw = audit_db.query(sql, params, db_path)
+    rows = [dict(zip(AUDIT_COLUMNS, row)) for row in raw]
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = (rows[-1]["timestamp"], rows[-1]["id"])
+    return {"rows": rows, "next_cursor": next_cursor}
+
+
+def count_audit_records(investor_id: Optional[str] = None, audit_date: Optional[date] = None,
+                        audit_type: Optional[str] = None, db_path: Optional[str] = None) -> int:
+    """符合篩選條件的審核記錄筆數（含涉及的封存分區）"""
+    conditions, params = filter_conditions(investor_id, audit_date, audit_type)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    total = audit_db.query_one(f"SELECT COUNT(*) FROM audit_records{where}", params, db_path)[0]
+    for batch in audit_partitions.batches(touched_partitions(audit_date, db_path=db_path)):
+        with audit_partitions.attached(batch, db_path) as (conn, aliases):
+            sql = " + ".join(f"(SELECT COUNT(*) FROM {alias}.audit_records{where})" for alias in aliases)
+            total += audit_db.with_retry(lambda: conn.execute(f"SELECT {sql}", params * len(aliases)).fetchone()[0])
+    return total
+
+
+def explain_audit_query(investor_id: Optional[str] = None, audit_date: Optional[date] = None,
+                        audit_type: Optional[str] = None, cursor: Optional[Tuple[str, int]] = None,
+                        db_path: Optional[str] = None) -> List[str]:
+    """回傳查詢的 EXPLAIN QUERY PLAN 說明"""
+    sql, params = build_audit_query(investor_id, audit_date, audit_type, cursor)
+    return [row[-1] for row in audit_db.query("EXPLAIN QUERY PLAN " + sql, params, db_path)]
@@ -0,0 +1,137 @@
+"""
+審核記錄查詢測試 - 大戶投資審核系統
+驗證報告查詢走索引（EXPLAIN QUERY PLAN）且鍵集分頁結果正確
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date
+
+import audit_db
+import audit_queries
+
+INSERT_SQL = '''
+    INSERT INTO audit_records
+    (timestamp, investor_id, audit_type, risk_level, portfolio_value, compliance_score, findings, recommendations, auditor)
+    VALUES (?, ?, ?, '中', 1000000, 100, '', '', '查詢測試')
+'''
+
+
+def _create_test_db() -> str:
+    """建立含測試資料的臨時審核數據庫"""
+    db_path = os.path.join(tempfile.mkdtemp(), "audit_queries_test.db")
+    audit_db.init_schema(db_path)
+    rows = [(f"2024-01-{day:02d} {hour:02d}:00:00", f"INV{hour % 3}", audit_db.AUDIT_TYPES[day % 4])
+            for day in range(1, 29) for hour in range(24)]
+    audit_db.run_write(lambda cursor: cursor.executemany(INSERT_SQL, rows), db_path)
+    return db_path
+
+
+def _uses_index(plan, index_name: str) -> bool:
+    """查詢計畫是否使用指定索引且無需額外排序"""
+    return any(index_name in step for step in plan) and not any("TEMP B-TREE" in step for step in plan)
+
+
+def _read_all_pages(page_size: int, db_path: str, **filters) -> list:
+    """以游標讀完所有分頁，回傳依序讀到的 id"""
+    seen = []
+    cursor = None
+    while True:
+        page = audit_queries.query_audit_records(cursor=cursor, page_size=page_size, db_path=db_path, **filters)
+        seen.extend(row["id"] for row in page["rows"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return seen
+
+
+def test_investor_query_uses_index():
+    """測試投資者查詢使用 (investor_id, timestamp) 索引"""
+    print("\n📊 開始測試投資者查詢計畫...")
+    db_path = _create_test_db()
+    plan = audit_queries.explain_audit_query(investor_id="INV1", cursor=("2024-01-10 00:00:00", 100), db_path=db_path)
+    print(f"📋 查詢計畫: {plan}")
+    assert _uses_index(plan, "idx_audit_records_investor_time"), f"未使用投資者索引或需要排序: {plan}"
+
+
+def test_audit_type_query_uses_index():
+    """測試審核類型查詢使用 (audit_type, timestamp) 索引"""
+    print("\n📊 開始測試審核類型查詢計畫...")
+    db_path = _create_test_db()
+    plan = audit_queries.explain_audit_query(audit_type="特別審核", audit_date=date(2024, 1, 5), db_path=db_path)
+    print(f"📋 查詢計畫: {plan}")
+    assert _uses_index(plan, "idx_audit_records_type_time"), f"未使用審核類型索引或需要排序: {plan}"
+
+
+def test_keyset_pagination():
+    """測試鍵集分頁依序走完所有記錄且不重複"""
+    print("\n📊 開始測試鍵集分頁...")
+    db_path = _create_test_db()
+    expected = audit_db.query("SELECT id FROM audit_records WHERE investor_id = 'INV2' "
+                              "ORDER BY timestamp DESC, id DESC", db_path=db_path)
+    seen = _read_all_pages(7, db_path, investor_id="INV2")
+    print(f"📋 分頁讀取 {len(seen)} 筆，預期 {len(expected)} 筆")
+    assert seen == [row[0] for row in expected], "分頁結果與單次查詢的順序不同"
+
+
+def test_pagination_edges():
+    """測試同一時間戳跨頁不漏不重、剛好一頁時沒有下一頁，以及日期篩選的午夜邊界"""
+    print("\n📊 開始測試分頁與日期邊界...")
+    db_path = _create_test_db()
+    # 同一秒寫入的多筆記錄只能以 id 區分先後
+    tied = [("2024-02-01 09:00:00", "TIE", "例行審核")] * 5
+    audit_db.run_write(lambda cursor: cursor.executemany(INSERT_SQL, tied), db_path)
+    tied_ids = [row[0] for row in audit_db.query(
+        "SELECT id FROM audit_records WHERE investor_id = 'TIE' ORDER BY id DESC", db_path=db_path)]
+    pages = {size: _read_all_pages(size, db_path, investor_id="TIE") for size in (1, 2, 4, 5)}
+    exact = audit_queries.query_audit_records(investor_id="TIE", page_size=5, db_path=db_path)
+    empty = audit_queries.query_audit_records(investor_id="NOBODY", db_path=db_path)
+
+    midnight = [("2024-03-05 00:00:00", "EDGE", "例行審核"), ("2024-03-05 23:59:59", "EDGE", "例行審核"),
+                ("2024-03-06 00:00:00", "EDGE", "例行審核"), ("2024-03-04 23:59:59", "EDGE", "例行審核")]
+    audit_db.run_write(lambda cursor: cursor.executemany(INSERT_SQL, midnight), db_path)
+    day = audit_queries.query_audit_records(investor_id="EDGE", audit_date=date(2024, 3, 5), db_path=db_path)
+    count = audit_queries.count_audit_records(investor_id="EDGE", audit_date=date(2024, 3, 5), db_path=db_path)
+    print(f"📋 同時間戳分頁 {pages}，當日 {[row['timestamp'] for row in day['rows']]}")
+
+    for size, seen in pages.items():
+        assert seen == tied_ids, f"每頁 {size} 筆時同時間戳記錄漏讀或重複: {seen}"
+    assert exact["next_cursor"] is None, "剛好一頁時不應回傳下一頁游標"
+    assert empty == {"rows": [], "next_cursor": None}, f"無符合資料時應回傳空頁: {empty}"
+    assert [row["timestamp"] for row in day["rows"]] == ["2024-03-05 23:59:59", "2024-03-05 00:00:00"], \
+        "日期篩選應包含當日 00:00:00、排除隔日 00:00:00"
+    assert count == 2, f"筆數 {count} 與當日記錄數不符"
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("📊 審核記錄查詢測試")
+    print("=" * 60)
+
+    tests = [
+        ("🔍 投資者索引測試", test_investor_query_uses_index),
+        ("🔍 審核類型索引測試", test_audit_type_query_uses_index),
+        ("📄 鍵集分頁測試", test_keyset_pagination),
+        ("📐 分頁與日期邊界測試", test_pagination_edges)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+審核記錄全文檢索 - 大戶投資審核系統
+以 FTS5 trigram 索引搜尋審核發現與建議，由 SQLite 以 BM25 排序並產生標示關鍵字的摘要
+"""
+
+import argparse
+import html
+import json
+import math
+import re
+import sys
+import time
+from contextlib import closing
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import audit_db
+import audit_partitions
+import audit_queries
+import instrumentation
+
+DEFAULT_LIMIT = 20
+# 排序的候選數：命中較多時只在最新的候選記錄中排序，避免常見詞掃描整個命中集合
+CANDIDATE_LIMIT = 500
+# trigram 索引可比對的最短關鍵字長度，較短的關鍵字改為逐筆比對
+MIN_TERM_LENGTH = 3
+SNIPPET_CHARS = 40
+# 索引摘要的關鍵字標記（控制字元不會被 HTML 跳脫，跳脫後再換成 <mark>）
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+SEARCH_COLUMNS = ["id", "timestamp", "investor_id", "audit_type", "risk_level", "findings", "recommendations"]
+# 各欄位排序權重（BM25，順序與全文檢索索引的欄位相同）
+FIELD_WEIGHTS = {"findings": 1.0, "recommendations": 0.5}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SEARCH_OPTIMIZE = "INSERT INTO {schema}.audit_records_fts (audit_records_fts) VALUES ('optimize')"
+
+
+def parse_terms(keywords: str) -> List[str]:
+    """以空白切分關鍵字（去除重複，全部須符合）"""
+    return list(dict.fromkeys(keywords.split()))
+
+
+def _match_expression(terms: List[str]) -> str:
+    """FTS5 查詢式：每個關鍵字作為片語，避免 AND / OR / * 等語法字元被解讀"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + re.sub(r"([\\%_])", r"\\\1", term) + "%"
+
+
+def _has_index(conn, schema: str) -> bool:
+    """資料庫（或附加的分區）是否已建立全文檢索索引"""
+    row = conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'audit_records_fts'").fetchone()
+    return row is not None
+
+
+def _candidate_query(terms: List[str], investor_id: Optional[str], audit_date: Optional[date],
+                     audit_type: Optional[str], schema: str, use_index: bool, limit: int,
+                     ranked: bool = False, since: int = 0) -> Tuple[str, list, str]:
+    """單一來源的查詢，回傳 (語句, 參數, 模式)
+
+    有投資者或日期篩選時符合的記錄很少，直接以篩選索引由新到舊讀取後逐筆比對；否則使用全文檢索索引：
+    ranked=False 時由新到舊回傳命中的 id，ranked=True 時由 SQLite 以 BM25 排序 id >= since 的命中，
+    取前 limit 筆後才附上分數與兩個欄位的摘要（摘要需重新讀取並切分全文，不為其餘候選產生）。
+    """
+    conditions, params = audit_queries.filter_conditions(investor_id, audit_date, audit_type)
+    indexed = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    mode = "fts" if use_index and indexed and not (investor_id or audit_date) else "scan"
+    scanned = [term for term in terms if mode == "scan" or term not in indexed]
+    for term in scanned:
+        conditions.append("(r.findings LIKE ? ESCAPE '\\' OR r.recommendations LIKE ? ESCAPE '\\')")
+        params.extend([_like_pattern(term)] * 2)
+
+    columns = ", ".join(f"r.{column}" for column in SEARCH_COLUMNS)
+    if mode == "fts":
+        if ranked:
+            weights = ", ".join(str(weight) for weight in FIELD_WEIGHTS.values())
+            conditions[:0] = [f"f.rank MATCH 'bm25({weights})'", "f.rowid >= ?"]
+            params.insert(0, since)
+            sql_columns, order = "f.rowid AS id, -f.rank AS score", "f.rank"
+        else:
+            sql_columns, order = "f.rowid", "f.rowid DESC"
+        sql = (f"SELECT {sql_columns} FROM {schema}.audit_records_fts(?) AS f "
+               f"JOIN {schema}.audit_records AS r ON r.id = f.rowid")
+        params.insert(0, _match_expression(indexed))
+    else:
+        sql = f"SELECT {columns} FROM {schema}.audit_records AS r"
+        order = "r.id DESC"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {order} LIMIT ?"
+    params.append(limit)
+
+    if mode == "fts" and ranked:
+        # 再掃描一次同一段候選，只為排序後的前 limit 筆產生摘要；同分時新的在前
+        markers = f"char({ord(MARK_START)}), char({ord(MARK_END)})"
+        snippets = ", ".join(f"snippet(audit_records_fts, {index}, {markers}, '…', {SNIPPET_CHARS})"
+                             for index in range(len(FIELD_WEIGHTS)))
+        sql = (f"SELECT {columns}, p.score, {snippets} FROM {schema}.audit_records_fts(?) AS f "
+               f"JOIN ({sql}) AS p ON p.id = f.rowid JOIN {schema}.audit_records AS r ON r.id = f.rowid "
+               f"WHERE f.rowid >= ? ORDER BY p.score DESC, p.id DESC")
+        params = [_match_expression(indexed)] + params + [since]
+    return sql, params, mode
+
+
+def _each_source(audit_date: Optional[date], db_path: Optional[str]):
+    """依序產生熱資料庫與涉及的封存分區（新到舊）的 (連線, 別名)"""
+    yield audit_db.get_connection(db_path), "main"
+    for batch in audit_partitions.batches(audit_queries.touched_partitions(audit_date, db_path=db_path)):
+        with audit_partitions.attached(batch, db_path) as (conn, aliases):
+            for alias in aliases:
+                yield conn, alias
+
+
+def _fetch(conn, schema: str, terms: List[str], filters: Tuple, limit: int, candidate_limit: int,
+           use_index: bool = True) -> Tuple[List[tuple], str, int, bool]:
+    """查詢單一來源最新的 candidate_limit 筆命中，回傳 (資料列, 模式, 候選數, 是否還有更多命中)
+
+    逐筆比對時回傳候選記錄（由新到舊）；使用索引時只對這些候選以 BM25 排序，回傳前 limit 筆。
+    常見詞只對最新的 candidate_limit 筆計算分數並排序（IDF 仍由 SQLite 取自整個索引）。
+    """
+    def run(sql: str, params: list) -> List[tuple]:
+        return audit_db.with_retry(lambda: conn.execute(sql, params).fetchall())
+
+    use_index = use_index and _has_index(conn, schema)
+    sql, params, mode = _candidate_query(terms, *filters, schema, use_index, candidate_limit + 1)
+    rows = run(sql, params)
+    truncated = len(rows) > candidate_limit
+    rows = rows[:candidate_limit]
+    if mode == "scan" or not rows:
+        return rows, mode, len(rows), truncated
+    sql, params, _ = _candidate_query(terms, *filters, schema, use_index, limit, ranked=True, since=rows[-1][0])
+    return run(sql, params), mode, len(rows), truncated
+
+
+def _term_pattern(terms: List[str]) -> re.Pattern:
+    # 較長的關鍵字優先，重疊時標示完整詞
+    return re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+
+
+def _rank(records: List[Dict], terms: List[str]) -> List[Dict]:
+    """以 BM25 計算候選記錄的相關分數（文件頻率取自候選集合），同分時新的在前"""
+    if not records:
+        return records
+    pattern = {term: re.compile(re.escape(term), re.IGNORECASE) for term in terms}
+    lengths = {field: [len(record[field] or "") for record in records] for field in FIELD_WEIGHTS}
+    average = {field: max(sum(values) / len(values), 1) for field, values in lengths.items()}
+    counts = [{(term, field): len(pattern[term].findall(record[field] or ""))
+               for term in terms for field in FIELD_WEIGHTS} for record in records]
+
+    total = len(records)
+    idf = {}
+    for term in terms:
+        frequency = sum(any(count[(term, field)] for field in FIELD_WEIGHTS) for count in counts)
+        idf[term] = math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+
+    for index, record in enumerate(records):
+        score = 0.0
+        for term in terms:
+            for field, weight in FIELD_WEIGHTS.items():
+                tf = counts[index][(term, field)]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[field][index] / average[field])
+                score += idf[term] * weight * tf * (BM25_K1 + 1) / (tf + norm)
+        record["score"] = round(score, 4)
+    return sorted(records, key=lambda record: (record["score"], record["id"]), reverse=True)
+
+
+def _mark_terms(text: str, pattern: Optional[re.Pattern]) -> str:
+    """跳脫 HTML 後以 <mark> 標示符合 pattern 的關鍵字"""
+    if pattern is None:
+        return html.escape(text)
+    parts = []
+    position = 0
+    for match in pattern.finditer(text):
+        parts += [html.escape(text[position:match.start()]), f"<mark>{html.escape(match.group())}</mark>"]
+        position = match.end()
+    parts.append(html.escape(text[position:]))
+    return "".join(parts)
+
+
+def highlight(text: Optional[str], terms: List[str], width: int = SNIPPET_CHARS) -> str:
+    """擷取第一個關鍵字附近的摘要，跳脫 HTML 後以 <mark> 標示關鍵字"""
+    text = text or ""
+    pattern = _term_pattern(terms)
+    first = pattern.search(text)
+    start = max(0, first.start() - width // 4) if first else 0
+    end = min(len(text), start + width)
+    return ("…" if start > 0 else "") + _mark_terms(text[start:end], pattern) + ("…" if end < len(text) else "")
+
+
+def mark_snippet(snippet: Optional[str], terms: List[str]) -> str:
+    """FTS5 摘要（關鍵字以控制字元標記）跳脫 HTML 後換成 <mark>，索引未涵蓋的短關鍵字於其餘片段另行標示"""
+    short = [term for term in terms if len(term) < MIN_TERM_LENGTH]
+    pattern = _term_pattern(short) if short else None
+    segments = re.split(f"[{MARK_START}{MARK_END}]", snippet or "")
+    # 切分後奇數位置為索引標示的關鍵字
+    return "".join(f"<mark>{html.escape(segment)}</mark>" if index % 2 else _mark_terms(segment, pattern)
+                   for index, segment in enumerate(segments))
+
+
+def _records(rows: List[tuple], mode: str, terms: List[str], limit: int) -> List[Dict]:
+    """單一來源的資料列轉為結果：索引查詢已由 SQL 排序並附分數與摘要，逐筆比對的候選以 BM25 排序後擷取摘要"""
+    if mode == "scan":
+        records = _rank([dict(zip(SEARCH_COLUMNS, row)) for row in rows], terms)[:limit]
+        for record in records:
+            record["findings"] = highlight(record["findings"], terms)
+            record["recommendations"] = highlight(record["recommendations"], terms)
+        return records
+    records = []
+    for row in rows[:limit]:
+        record = dict(zip(SEARCH_COLUMNS, row))
+        score, findings, recommendations = row[len(SEARCH_COLUMNS):]
+        record.update(findings=mark_snippet(findings, terms), recommendations=mark_snippet(recommendations, terms),
+                      score=round(score, 4))
+        records.append(record)
+    return records
+
+
+@instrumentation.instrument("report.search")
+def search_audit_records(keywords: str, investor_id: Optional[str] = None, audit_date: Optional[date] = None,
+                         audit_type: Optional[str] = None, limit: int = DEFAULT_LIMIT,
+                         db_path: Optional[str] = None) -> Dict:
+    """搜尋審核發現與建議包含所有關鍵字的審核記錄（含涉及的封存分區）
+
+    回傳依相關分數排序的前 limit 筆，findings / recommendations 為標示關鍵字的 HTML 摘要；
+    truncated 為 True 時命中超過 CANDIDATE_LIMIT 筆，只在最新的候選中排序。
+    使用索引時各來源由 SQLite 以 BM25 排序，來源之間依熱資料庫、封存分區新到舊接續（各索引的統計不同，
+    分數不跨來源比較）；逐筆比對時由新到舊湊滿候選後一起排序。
+    """
+    try:
+        terms = parse_terms(keywords)
+        if not terms:
+            raise ValueError("請輸入搜尋關鍵字")
+        start = time.perf_counter()
+        filters = (investor_id, audit_date, audit_type)
+        with closing(_each_source(audit_date, db_path)) as sources:
+            conn, schema = next(sources)
+            rows, mode, candidates, truncated = _fetch(conn, schema, terms, filters, limit, CANDIDATE_LIMIT)
+            if mode == "fts":
+                ranked = _records(rows, mode, terms, limit)
+                for conn, schema in sources:
+                    if len(ranked) >= limit:
+                        break
+                    remaining = limit - len(ranked)
+                    rows, source_mode, count, more = _fetch(conn, schema, terms, filters, remaining, CANDIDATE_LIMIT)
+                    ranked += _records(rows, source_mode, terms, remaining)
+                    candidates += count
+                    truncated = truncated or more
+            else:
+                for conn, schema in sources:
+                    if truncated or len(rows) >= CANDIDATE_LIMIT:
+                        truncated = True
+                        break
+                    fetched, _, _, truncated = _fetch(conn, schema, terms, filters, limit,
+                                                      CANDIDATE_LIMIT - len(rows), use_index=False)
+                    rows += fetched
+                candidates = len(rows)
+                ranked = _records(rows, mode, terms, limit)
+        return {
+            "rows": ranked,
+            "terms": terms,
+            "mode": mode,
+            "candidates": candidates,
+            "truncated": truncated,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _each_schema(db_path: Optional[str] = None):
+    """依序產生熱資料庫與每個已附加封存分區的別名"""
+    yield "main"
+    for batch in audit_partitions.batches(audit_partitions.list_partitions(db_path)):
+        with audit_partitions.attached(batch, db_path) as (_, aliases):
+            yield from aliases
+
+
+def maintain_index(rebuild: bool = False, db_path: Optional[str] = None) -> Dict:
+    """合併全文檢索索引的區段（大量寫入後可加快查詢）；rebuild=True 時由資料表全量重建
+
+    較早封存、尚未建立索引的分區會一併建立。
+    """
+    try:
+        audit_db.init_schema(db_path)
+        databases = 0
+        for schema in _each_schema(db_path):
+            def maintain(cursor):
+                if schema != "main":
+                    audit_partitions.prepare_archive(cursor.connection, schema)
+                command = audit_db.SEARCH_REBUILD if rebuild else SEARCH_OPTIMIZE
+                cursor.execute(command.format(schema=schema))
+            audit_db.run_write(maintain, db_path)
+            databases += 1
+        return {"databases": databases, "rebuilt": rebuild}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def main():
+    """命令列：搜尋審核記錄或維護全文檢索索引"""
+    parser = argparse.ArgumentParser(description="審核發現與建議全文檢索")
+    parser.add_argument("keywords", nargs="*", help="搜尋關鍵字（空白分隔，全部須符合）")
+    parser.add_argument("--investor", default=None, help="投資者 ID")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="審核日期（YYYY-MM-DD）")
+    parser.add_argument("--type", choices=audit_db.AUDIT_TYPES, default=None, help="審核類型")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="回傳筆數")
+    parser.add_argument("--optimize", action="store_true", help="合併索引區段")
+    parser.add_argument("--rebuild", action="store_true", help="由審核記錄全量重建索引")
+    parser.add_argument("--db", default=None, help="審核數據庫路徑（預設 investment_audit.db）")
+    args = parser.parse_args()
+
+    if args.optimize or args.rebuild:
+        result = maintain_index(args.rebuild, args.db)
+    else:
+        audit_db.init_schema(args.db)
+        result = search_audit_records(" ".join(args.keywords), args.investor, args.date, args.type, args.limit,
+                                      args.db)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if "error" in result:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+審核記錄全文檢索測試 - 大戶投資審核系統
+驗證關鍵字搜尋的排序與標示、觸發器同步、封存分區搜尋與查詢計畫
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import date
+
+import audit_db
+import audit_partitions
+import audit_search
+from audit_ingest import create_audit_records_bulk
+from benchmarks import make_snapshot
+
+
+def sample_database(rows: int) -> str:
+    """建立含 rows 筆審核記錄的暫存資料庫"""
+    db_path = os.path.join(tempfile.mkdtemp(), "audit.db")
+    audit_db.init_schema(db_path)
+    create_audit_records_bulk(make_snapshot(rows), db_path=db_path)
+    return db_path
+
+
+def add_record(db_path: str, findings: str, recommendations: str = "", timestamp: str = "2024-12-30 10:00:00",
+               investor_id: str = "SEARCH01") -> int:
+    """新增一筆指定內容的審核記錄"""
+    return audit_db.execute_write(
+        "INSERT INTO audit_records (timestamp, investor_id, audit_type, risk_level, findings, recommendations) "
+        "VALUES (?, ?, '特別審核', '高', ?, ?)", (timestamp, investor_id, findings, recommendations), db_path)
+
+
+def ids(result: dict) -> list:
+    return [row["id"] for row in result["rows"]]
+
+
+def test_search_ranking():
+    """測試多關鍵字排序、HTML 跳脫與標示、短關鍵字與篩選條件"""
+    print("\n🔎 開始測試關鍵字搜尋...")
+    db_path = sample_database(3000)
+    once = add_record(db_path, "境外匯款來源不明", "補件說明資金來源")
+    twice = add_record(db_path, "境外匯款來源不明；境外匯款金額異常", "暫停<script>交易</script>並補件")
+    unrelated = add_record(db_path, "資金來源不明")
+    long_text = add_record(db_path, "甲" * 60 + "可疑跨境轉帳" + "<乙>" * 30)
+
+    result = audit_search.search_audit_records("境外匯款 來源不明", db_path=db_path)
+    print(f"📊 {result['mode']} 模式 {ids(result)}，耗時 {result['elapsed_ms']} ms")
+    ranked = audit_search.search_audit_records("境外匯款", db_path=db_path)
+    escaped = audit_search.search_audit_records("暫停 <script>", db_path=db_path)
+    short = audit_search.search_audit_records("補件", db_path=db_path)
+    by_investor = audit_search.search_audit_records("境外匯款", investor_id="SEARCH01", audit_date=date(2024, 12, 30),
+                                                    db_path=db_path)
+    common = audit_search.search_audit_records("投資金額超過", limit=5, db_path=db_path)
+    snippet = audit_search.search_audit_records("可疑跨境轉帳", db_path=db_path)["rows"][0]["findings"]
+    print(f"📊 {escaped['rows'][0]['recommendations']}｜短關鍵字 {short['mode']} {ids(short)}｜"
+          f"常見詞候選 {common['candidates']} 筆")
+    assert sorted(ids(result)) == [once, twice] and result["mode"] == "fts", f"多關鍵字須全部符合: {ids(result)}"
+    assert unrelated not in ids(result)
+    assert ids(ranked) == [twice, once] and ranked["rows"][0]["score"] > ranked["rows"][1]["score"], \
+        "出現次數較多的記錄應排在前面"
+    assert ranked["rows"][0]["findings"] == "<mark>境外匯款</mark>來源不明；<mark>境外匯款</mark>金額異常"
+    assert escaped["rows"][0]["recommendations"] == "<mark>暫停</mark><mark>&lt;script&gt;</mark>交易&lt;/script&gt;並補件", \
+        "摘要須先跳脫 HTML 再標示關鍵字"
+    assert short["mode"] == "scan" and ids(short) == [once, twice], "短關鍵字應改為逐筆比對"
+    assert by_investor["mode"] == "scan" and ids(by_investor) == [twice, once]
+    assert len(common["rows"]) == 5 and common["candidates"] > 5
+    assert snippet.startswith("…") and snippet.endswith("…") and "<mark>可疑跨境轉帳</mark>&lt;乙&gt;" in snippet \
+        and len(snippet) < 200 and "\x02" not in snippet, f"長文字應擷取關鍵字附近的摘要: {snippet}"
+    assert long_text not in ids(result)
+    assert "error" in audit_search.search_audit_records("  ", db_path=db_path), "空白關鍵字應回報錯誤"
+
+
+def test_index_sync():
+    """測試新增、修改與刪除記錄時觸發器同步索引"""
+    print("\n🔁 開始測試索引同步...")
+    db_path = sample_database(200)
+    record = add_record(db_path, "疑似人頭帳戶交易")
+    found = ids(audit_search.search_audit_records("人頭帳戶", db_path=db_path))
+    audit_db.execute_write("UPDATE audit_records SET findings = '已完成身分核對' WHERE id = ?", (record,), db_path)
+    updated = ids(audit_search.search_audit_records("人頭帳戶", db_path=db_path))
+    verified = ids(audit_search.search_audit_records("身分核對", db_path=db_path))
+    audit_db.execute_write("DELETE FROM audit_records WHERE id = ?", (record,), db_path)
+    deleted = ids(audit_search.search_audit_records("身分核對", db_path=db_path))
+    audit_db.execute_write("INSERT INTO audit_records_fts (audit_records_fts, rank) VALUES ('integrity-check', 1)",
+                           db_path=db_path)
+    print(f"📊 新增 {found}，修改後 {updated} / {verified}，刪除後 {deleted}")
+    assert found == [record], "新增記錄未寫入索引"
+    assert updated == [] and verified == [record], "修改記錄後索引仍為舊內容"
+    assert deleted == [], "刪除記錄後索引仍可搜尋到"
+
+
+def test_partition_search():
+    """測試封存後搜尋結果不變，較早建立、無索引的封存檔仍可搜尋並可補建索引"""
+    print("\n🗄️ 開始測試封存分區搜尋...")
+    db_path = sample_database(2000)
+    records = [add_record(db_path, f"第{month}月大額現金存入", timestamp=f"2024-{month:02d}-15 09:00:00")
+               for month in range(1, 13)]
+    before = audit_search.search_audit_records("大額現金存入", db_path=db_path)
+    audit_partitions.archive_old_partitions(keep_months=2, today=date(2025, 1, 15), db_path=db_path)
+    after = audit_search.search_audit_records("大額現金存入", db_path=db_path)
+    march = audit_search.search_audit_records("大額現金存入", audit_date=date(2024, 3, 15), db_path=db_path)
+
+    # 模擬加入全文檢索前封存的分區
+    partition = audit_partitions.list_partitions(db_path)[-1]
+    legacy = sqlite3.connect(audit_partitions.resolve_path(partition["path"], db_path))
+    for name in ("audit_records_fts", "trg_audit_records_fts_insert", "trg_audit_records_fts_delete",
+                 "trg_audit_records_fts_update"):
+        legacy.execute(f"DROP {'TABLE' if name == 'audit_records_fts' else 'TRIGGER'} {name}")
+    legacy.commit()
+    legacy.close()
+    without_index = audit_search.search_audit_records("大額現金存入", db_path=db_path)
+    maintained = audit_search.maintain_index(db_path=db_path)
+    rebuilt = audit_search.search_audit_records("大額現金存入", db_path=db_path)
+    print(f"📊 封存前 {len(before['rows'])} 筆，封存後 {len(after['rows'])} 筆，維護 {maintained}")
+    assert sorted(ids(before)) == sorted(ids(after)) == records, "封存後搜尋結果改變"
+    assert ids(march) == [records[2]], "日期篩選應只搜尋當月分區"
+    assert ids(without_index) == ids(after) == ids(rebuilt), "無索引的舊分區搜尋結果不同"
+    assert maintained["databases"] == len(audit_partitions.list_partitions(db_path)) + 1
+
+
+def query_plan(db_path: str, sql: str, params: list) -> str:
+    """EXPLAIN QUERY PLAN 的各步驟說明"""
+    rows = audit_db.get_connection(db_path).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return "\n".join(row[-1] for row in rows)
+
+
+def test_search_plan():
+    """測試數萬筆記錄下常見詞與罕見詞都經由全文檢索索引查詢，排序與摘要只涵蓋最新的候選"""
+    print("\n⚡ 開始測試搜尋查詢計畫...")
+    db_path = sample_database(50_000)
+    add_record(db_path, "疑似洗錢交易態樣")
+    for keywords in ("投資金額超過大戶定義上限", "洗錢交易", "分散投資 交易記錄"):
+        result = audit_search.search_audit_records(keywords, db_path=db_path)
+        print(f"📊 「{keywords}」{len(result['rows'])} 筆，候選 {result['candidates']} 筆，耗時 {result['elapsed_ms']} ms")
+        assert result["mode"] == "fts" and result["candidates"] <= audit_search.CANDIDATE_LIMIT
+
+        terms = audit_search.parse_terms(keywords)
+        for ranked in (False, True):
+            sql, params, _ = audit_search._candidate_query(terms, None, None, None, "main", True,
+                                                           audit_search.DEFAULT_LIMIT, ranked=ranked)
+            plan = query_plan(db_path, sql, params)
+            assert "VIRTUAL TABLE INDEX" in plan, f"「{keywords}」未使用全文檢索索引:\n{plan}"
+            assert "SCAN r" not in plan, f"「{keywords}」逐筆掃描了 audit_records:\n{plan}"
+            if ranked:
+                # FTS5 的索引描述以 > 表示 rowid 下限：排序與產生摘要時都只讀取候選範圍內的命中
+                scans = [line for line in plan.splitlines() if "VIRTUAL TABLE INDEX" in line]
+                assert len(scans) == 2 and all(line.endswith(">") for line in scans), \
+                    f"「{keywords}」排序或摘要未限制在候選範圍:\n{plan}"
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("🔎 審核記錄全文檢索測試")
+    print("=" * 60)
+
+    tests = [
+        ("🔎 關鍵字搜尋測試", test_search_ranking),
+        ("🔁 索引同步測試", test_index_sync),
+        ("🗄️ 封存分區搜尋測試", test_partition_search),
+        ("⚡ 搜尋查詢計畫測試", test_search_plan)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
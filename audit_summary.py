@@ -0,0 +1,77 @@
+"""
+合規儀表板彙總 - 大戶投資審核系統
+讀取觸發器維護的彙總表，並提供重建命令修正偏差
+"""
+
+import argparse
+import json
+from typing import Dict, Optional
+
+import audit_db
+import audit_partitions
+import instrumentation
+
+DEFAULT_WINDOW_DAYS = 30
+
+
+@instrumentation.instrument("report.dashboard_summary")
+def get_dashboard_summary(window_days: int = DEFAULT_WINDOW_DAYS, db_path: Optional[str] = None) -> Dict:
+    """讀取儀表板指標（僅掃描彙總表的少量資料列）"""
+    risk_rows = audit_db.query(
+        "SELECT risk_level, investor_count, warning_count FROM risk_level_summary", db_path=db_path)
+    risk_counts = {level: 0 for level in audit_db.RISK_LEVELS}
+    warnings = 0
+    for risk_level, investor_count, warning_count in risk_rows:
+        risk_counts[risk_level] = risk_counts.get(risk_level, 0) + investor_count
+        warnings += warning_count
+
+    audit_count, compliant_count = audit_db.query_one(
+        "SELECT COALESCE(SUM(audit_count), 0), COALESCE(SUM(compliant_count), 0) "
+        "FROM daily_audit_summary WHERE day >= date('now', ?)",
+        (f"-{window_days} days",), db_path)
+
+    return {
+        "total_investors": sum(risk_counts.values()),
+        "active_audits": audit_count,
+        "compliance_rate": compliant_count / audit_count * 100 if audit_count else 0.0,
+        "open_warnings": warnings,
+        "risk_distribution": risk_counts,
+        "window_days": window_days,
+    }
+
+
+def rebuild_summaries(db_path: Optional[str] = None):
+    """由 audit_records 全量重建彙總表（含所有封存分區）"""
+    def rebuild(cursor):
+        for statement in audit_db.SUMMARY_REBUILD:
+            cursor.execute(statement)
+    audit_db.init_schema(db_path)
+    audit_db.run_write(rebuild, db_path)
+
+    # 分區需先附加（交易外），每批附加後合併
+    for batch in audit_partitions.batches(audit_partitions.partitions_for(db_path=db_path)):
+        with audit_partitions.attached(batch, db_path) as (_, aliases):
+            def merge(cursor):
+                for alias in aliases:
+                    for statement in audit_db.SUMMARY_MERGE:
+                        cursor.execute(statement.format(source=alias))
+            audit_db.run_write(merge, db_path)
+
+
+def main():
+    """命令列：重建或顯示彙總"""
+    parser = argparse.ArgumentParser(description="合規儀表板彙總表維護")
+    parser.add_argument("--db", default=None, help="審核數據庫路徑（預設 investment_audit.db）")
+    parser.add_argument("--rebuild", action="store_true", help="由 audit_records 與封存分區全量重建彙總表")
+    parser.add_argument("--window-days", type=int, default=DEFAULT_WINDOW_DAYS, help="滾動合規率天數")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rebuild_summaries(args.db)
+    else:
+        audit_db.init_schema(args.db)
+    print(json.dumps(get_dashboard_summary(args.window_days, args.db), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+合規儀表板彙總測試 - 大戶投資審核系統
+驗證觸發器維護的彙總表在新增、修改、刪除與封存後，與全量重建及直接彙總查詢一致
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import audit_db
+import audit_partitions
+import audit_summary
+
+INVESTORS = [f"SUM{i:03d}" for i in range(40)]
+
+INSERT_SQL = '''
+    INSERT INTO audit_records (timestamp, investor_id, audit_type, risk_level, portfolio_value, compliance_score)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+
+def summary_tables(db_path: str) -> dict:
+    """讀取三張彙總表（投資者數為 0 的風險等級與不存在的等級等價，不列入比較）"""
+    return {
+        "daily": audit_db.query("SELECT day, audit_count, compliant_count, score_sum FROM daily_audit_summary "
+                                "ORDER BY day", (), db_path),
+        "investor": audit_db.query("SELECT investor_id, last_timestamp, last_id, risk_level, compliance_score, "
+                                   "warning FROM investor_audit_summary ORDER BY investor_id", (), db_path),
+        "risk": audit_db.query("SELECT risk_level, investor_count, warning_count FROM risk_level_summary "
+                               "WHERE investor_count != 0 OR warning_count != 0 ORDER BY risk_level", (), db_path),
+    }
+
+
+def rebuilt_tables(db_path: str) -> dict:
+    """複製資料庫（含封存分區）後全量重建，回傳重建的彙總表"""
+    copy_dir = tempfile.mkdtemp()
+    audit_db.query("PRAGMA wal_checkpoint(TRUNCATE)", (), db_path)
+    shutil.copytree(os.path.dirname(db_path), copy_dir, dirs_exist_ok=True)
+    copy_path = os.path.join(copy_dir, os.path.basename(db_path))
+    audit_summary.rebuild_summaries(copy_path)
+    return summary_tables(copy_path)
+
+
+def direct_summary(db_path: str, window_days: int = audit_summary.DEFAULT_WINDOW_DAYS) -> dict:
+    """不經彙總表，直接由 audit_records 彙總儀表板指標（未封存時使用）"""
+    latest = audit_db.query('''
+        SELECT risk_level, risk_level = '高' OR COALESCE(compliance_score, 0) < 100 FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY investor_id ORDER BY timestamp DESC, id DESC) AS latest_rank
+            FROM audit_records
+        ) WHERE latest_rank = 1
+    ''', (), db_path)
+    audit_count, compliant_count = audit_db.query_one(
+        "SELECT COUNT(*), COALESCE(SUM(COALESCE(compliance_score, 0) >= 100), 0) FROM audit_records "
+        "WHERE date(timestamp) >= date('now', ?)", (f"-{window_days} days",), db_path)
+    distribution = {level: 0 for level in audit_db.RISK_LEVELS}
+    for risk_level, _ in latest:
+        distribution[risk_level] += 1
+    return {
+        "total_investors": len(latest),
+        "active_audits": audit_count,
+        "compliance_rate": compliant_count / audit_count * 100 if audit_count else 0.0,
+        "open_warnings": sum(warning for _, warning in latest),
+        "risk_distribution": distribution,
+        "window_days": window_days,
+    }
+
+
+def seeded_database(rng: random.Random, rows: int = 600) -> str:
+    """建立含近 90 天隨機審核記錄的暫存資料庫"""
+    db_path = os.path.join(tempfile.mkdtemp(), "audit.db")
+    audit_db.init_schema(db_path)
+
+    def insert(cursor):
+        for _ in range(rows):
+            timestamp = cursor.execute("SELECT datetime('now', ?)",
+                                       (f"-{rng.randrange(90 * 86400)} seconds",)).fetchone()[0]
+            cursor.execute(INSERT_SQL, (timestamp, rng.choice(INVESTORS), rng.choice(audit_db.AUDIT_TYPES),
+                                        rng.choice(audit_db.RISK_LEVELS), rng.uniform(1e6, 3e8),
+                                        rng.choice([60, 80, 100])))
+    audit_db.run_write(insert, db_path)
+    return db_path
+
+
+def assert_consistent(db_path: str, stage: str, direct: bool = True):
+    """檢查觸發器維護的彙總表與全量重建一致，未封存時另與直接彙總查詢比對"""
+    maintained = summary_tables(db_path)
+    rebuilt = rebuilt_tables(db_path)
+    for table in maintained:
+        assert maintained[table] == rebuilt[table], f"{stage}後 {table} 彙總與全量重建不一致"
+    if direct:
+        summary = audit_summary.get_dashboard_summary(db_path=db_path)
+        expected = direct_summary(db_path)
+        assert summary == expected, f"{stage}後儀表板指標與直接彙總不一致: {summary} != {expected}"
+
+
+def test_insert_update_delete():
+    """測試新增、修改各欄位與刪除（含刪除投資者最新一筆與全部記錄）後彙總仍正確"""
+    print("\n🧾 開始測試彙總觸發器...")
+    rng = random.Random(11)
+    db_path = seeded_database(rng)
+    assert_consistent(db_path, "新增")
+
+    ids = [row[0] for row in audit_db.query("SELECT id FROM audit_records", (), db_path)]
+    for record_id in rng.sample(ids, 150):
+        column, value = rng.choice([
+            ("risk_level", rng.choice(audit_db.RISK_LEVELS)),
+            ("compliance_score", rng.choice([40, 80, 100])),
+            ("investor_id", rng.choice(INVESTORS)),
+            ("timestamp", audit_db.query_one("SELECT datetime('now', ?)",
+                                             (f"-{rng.randrange(90 * 86400)} seconds",), db_path)[0]),
+        ])
+        audit_db.execute_write(f"UPDATE audit_records SET {column} = ? WHERE id = ?", (value, record_id), db_path)
+    # 只改發現與建議不影響彙總
+    audit_db.execute_write("UPDATE audit_records SET findings = '補充說明' WHERE id = ?", (ids[0],), db_path)
+    assert_consistent(db_path, "修改")
+
+    latest_ids = [row[0] for row in audit_db.query("SELECT last_id FROM investor_audit_summary", (), db_path)]
+    for record_id in rng.sample(latest_ids, 10) + rng.sample(ids, 100):
+        audit_db.execute_write("DELETE FROM audit_records WHERE id = ?", (record_id,), db_path)
+    audit_db.execute_write("DELETE FROM audit_records WHERE investor_id = ?", (INVESTORS[0],), db_path)
+    summary = audit_summary.get_dashboard_summary(db_path=db_path)
+    print(f"📊 {summary}")
+    assert_consistent(db_path, "刪除")
+    assert audit_db.query_one("SELECT COUNT(*) FROM investor_audit_summary WHERE investor_id = ?",
+                              (INVESTORS[0],), db_path)[0] == 0, "記錄全部刪除的投資者應移出彙總"
+
+
+def test_window_edge():
+    """測試 30 天滾動視窗：邊界當天零點計入，前一天最後一秒不計入，修改時間跨越邊界時即時反映"""
+    print("\n📅 開始測試滾動視窗邊界...")
+    db_path = os.path.join(tempfile.mkdtemp(), "audit.db")
+    audit_db.init_schema(db_path)
+    edge_day, outside_day = audit_db.query_one("SELECT date('now', '-30 days'), date('now', '-31 days')",
+                                               (), db_path)
+    inside = audit_db.execute_write(INSERT_SQL, (f"{edge_day} 00:00:00", "EDGE1", "例行審核", "低", 5e7, 100),
+                                    db_path)
+    outside = audit_db.execute_write(INSERT_SQL, (f"{outside_day} 23:59:59", "EDGE2", "例行審核", "低", 5e7, 60),
+                                     db_path)
+    before = audit_summary.get_dashboard_summary(db_path=db_path)
+    assert before["active_audits"] == 1 and before["compliance_rate"] == 100.0, f"視窗邊界計算錯誤: {before}"
+    assert before == direct_summary(db_path)
+
+    audit_db.execute_write("UPDATE audit_records SET timestamp = ? WHERE id = ?",
+                           (f"{edge_day} 00:00:00", outside), db_path)
+    audit_db.execute_write("UPDATE audit_records SET timestamp = ? WHERE id = ?",
+                           (f"{outside_day} 23:59:59", inside), db_path)
+    after = audit_summary.get_dashboard_summary(db_path=db_path)
+    print(f"📊 修改前 {before}\n📊 修改後 {after}")
+    assert after["active_audits"] == 1 and after["compliance_rate"] == 0.0, "時間移出或移入視窗後應即時反映"
+    assert after == direct_summary(db_path)
+    assert_consistent(db_path, "跨越視窗邊界")
+
+
+def test_archive_keeps_summaries():
+    """測試封存搬移不減少彙總，封存後在熱資料庫的修改與刪除仍與含分區的重建一致"""
+    print("\n🗄️ 開始測試封存與彙總...")
+    rng = random.Random(5)
+    db_path = seeded_database(rng)
+    before = summary_tables(db_path)
+    period = audit_db.query_one("SELECT strftime('%Y-%m', MIN(timestamp)) FROM audit_records", (), db_path)[0]
+    result = audit_partitions.archive_period(period, db_path)
+    print(f"📊 封存 {result['period']} 共 {result['moved']} 筆")
+    assert result["moved"] > 0
+    assert summary_tables(db_path) == before, "封存搬移不應改變彙總表"
+    assert audit_db.query_one("SELECT archiving FROM audit_maintenance", (), db_path)[0] == 0, "封存後應恢復觸發器"
+
+    hot_ids = [row[0] for row in audit_db.query("SELECT id FROM audit_records", (), db_path)]
+    for record_id in rng.sample(hot_ids, 20):
+        audit_db.execute_write("UPDATE audit_records SET compliance_score = 40 WHERE id = ?", (record_id,), db_path)
+    for record_id in rng.sample(hot_ids, 20):
+        audit_db.execute_write("DELETE FROM audit_records WHERE id = ?", (record_id,), db_path)
+    assert_consistent(db_path, "封存後修改與刪除", direct=False)
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("📊 合規儀表板彙總測試")
+    print("=" * 60)
+
+    tests = [
+        ("🧾 新增修改刪除測試", test_insert_update_delete),
+        ("📅 滾動視窗邊界測試", test_window_edge),
+        ("🗄️ 封存彙總測試", test_archive_keeps_summaries)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+效能基準測試 - 大戶投資審核系統
+以 1k / 100k / 1M 筆合成資料量測風險計算、合規檢查、審核寫入與報告查詢的耗時與記憶體高峰，
+輸出 JSON 並與基準檔比較（不需 Streamlit 或網路）
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import audit_core
+import audit_db
+import audit_queries
+from audit_ingest import create_audit_records_bulk
+from compliance import evaluate_compliance, generate_compliance_check
+from risk_engine import calculate_risk_metrics_batch
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_SIZES = ["1k", "100k"]
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.25
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+# 逐筆呼叫的項目以固定次數量測單次成本（避免 1M 筆時耗時過久）
+MAX_SINGLE_INSERTS = 2_000
+MAX_SINGLE_CHECKS = 200
+DAYS_PER_INVESTOR = 50
+SEED = 42
+
+
+# --- 合成資料產生器（固定種子，結果可重現） ---
+
+def make_values(rows: int, days: int = DAYS_PER_INVESTOR, seed: int = SEED) -> pd.DataFrame:
+    """長格式市值序列（investor_id, date, current_value），共 rows 筆"""
+    rng = np.random.default_rng(seed)
+    investors = max(1, rows // days)
+    ids = np.array([f"B{i:07d}" for i in range(investors)])
+    returns = rng.normal(0.0003, rng.uniform(0.002, 0.04, investors)[:, None], (investors, days))
+    values = rng.uniform(1e6, 2e8, investors)[:, None] * np.cumprod(1 + returns, axis=1)
+    return pd.DataFrame({"investor_id": np.repeat(ids, days),
+                         "date": np.tile(pd.bdate_range("2024-01-01", periods=days), investors),
+                         "current_value": values.ravel()}).head(rows)
+
+
+def make_snapshot(rows: int, seed: int = SEED) -> pd.DataFrame:
+    """投資者快照（合規規則所需欄位）"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "investor_id": [f"B{i:07d}" for i in range(rows)],
+        "audit_type": rng.choice(audit_db.AUDIT_TYPES, rows),
+        "risk_level": rng.choice(audit_db.RISK_LEVELS, rows),
+        "portfolio_value": rng.uniform(1e6, 2e8, rows),
+        "max_position_weight": rng.uniform(0.05, 0.5, rows),
+        "risk_disclosure_signed": rng.random(rows) > 0.05,
+        "trade_records_complete": rng.random(rows) > 0.02,
+        "days_since_last_audit": rng.integers(1, 400, rows),
+        "timestamp": (pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365 * 86400, rows), unit="s"))
+                     .strftime("%Y-%m-%d %H:%M:%S"),
+    })
+
+
+def _temp_database() -> str:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_"), "audit.db")
+    audit_db.init_schema(db_path)
+    return db_path
+
+
+def _drop_database(db_path: str):
+    audit_db.close_all()
+    shutil.rmtree(os.path.dirname(db_path), ignore_errors=True)
+
+
+# --- 基準項目：setup(筆數) -> 狀態，run(狀態) 為量測範圍，teardown(狀態) 清理 ---
+
+class Benchmark:
+    """單一基準項目"""
+
+    def __init__(self, name: str, setup: Callable[[int], Dict], run: Callable[[Dict], object],
+                 teardown: Optional[Callable[[Dict], None]] = None, reuse_setup: bool = False,
+                 max_rows: Optional[int] = None):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.teardown = teardown or (lambda state: None)
+        # reuse_setup：唯讀項目只準備一次資料；寫入項目每次重複都重建
+        self.reuse_setup = reuse_setup
+        # max_rows：逐筆呼叫的項目只量測固定次數
+        self.max_rows = max_rows
+
+
+def _setup_audit_db(rows: int) -> Dict:
+    db_path = _temp_database()
+    create_audit_records_bulk(make_snapshot(rows), db_path=db_path)
+    audit_db.close_all()
+    return {"db_path": db_path, "investor": "B0000007", "day": date(2024, 6, 3)}
+
+
+def _run_report_queries(state: Dict):
+    db_path = state["db_path"]
+    audit_queries.query_audit_records(db_path=db_path)
+    audit_queries.query_audit_records(investor_id=state["investor"], db_path=db_path)
+    audit_queries.query_audit_records(audit_type="合規檢查", audit_date=state["day"], db_path=db_path)
+    cursor = None
+    for _ in range(20):
+        page = audit_queries.query_audit_records(cursor=cursor, db_path=db_path)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+
+def _run_single_inserts(state: Dict):
+    for row in state["rows"]:
+        audit_core.create_audit_record(*row, db_path=state["db_path"])
+
+
+def _setup_single_inserts(rows: int) -> Dict:
+    snapshot = make_snapshot(rows)
+    return {"db_path": _temp_database(), "rows": [
+        (row.investor_id, row.audit_type, row.risk_level, float(row.portfolio_value), 100, "", "", "基準測試")
+        for row in snapshot.itertuples()
+    ]}
+
+
+BENCHMARKS: List[Benchmark] = [
+    Benchmark("risk_metrics_batch",
+              lambda rows: {"values": make_values(rows)},
+              lambda state: calculate_risk_metrics_batch(state["values"]), reuse_setup=True),
+    Benchmark("risk_metrics_single",
+              lambda rows: {"portfolio": make_values(rows, days=rows)},
+              lambda state: audit_core.calculate_risk_metrics(state["portfolio"]), reuse_setup=True),
+    Benchmark("compliance_batch",
+              lambda rows: {"snapshot": make_snapshot(rows)},
+              lambda state: evaluate_compliance(state["snapshot"]), reuse_setup=True),
+    Benchmark("generate_compliance_check",
+              lambda rows: {"values": make_snapshot(rows)["portfolio_value"].tolist()},
+              lambda state: [generate_compliance_check(value) for value in state["values"]], reuse_setup=True,
+              max_rows=MAX_SINGLE_CHECKS),
+    Benchmark("create_audit_record", _setup_single_inserts, _run_single_inserts,
+              teardown=lambda state: _drop_database(state["db_path"]), max_rows=MAX_SINGLE_INSERTS),
+    Benchmark("bulk_ingest",
+              lambda rows: {"snapshot": make_snapshot(rows), "db_path": _temp_database()},
+              lambda state: create_audit_records_bulk(state["snapshot"], db_path=state["db_path"]),
+              teardown=lambda state: _drop_database(state["db_path"])),
+    Benchmark("report_queries", _setup_audit_db, _run_report_queries, reuse_setup=True,
+              teardown=lambda state: _drop_database(state["db_path"])),
+]
+
+
+def _measure(benchmark: Benchmark, rows: int, repeat: int) -> Dict:
+    """執行 1 次暖機與 repeat 次計時，另以 tracemalloc 量測一次記憶體高峰"""
+    rows = min(rows, benchmark.max_rows or rows)
+    timings = []
+    state = benchmark.setup(rows) if benchmark.reuse_setup else None
+    try:
+        for iteration in range(repeat + 2):
+            current = state if benchmark.reuse_setup else benchmark.setup(rows)
+            gc.collect()
+            try:
+                if iteration == repeat + 1:
+                    tracemalloc.start()
+                    baseline = tracemalloc.get_traced_memory()[0]
+                    benchmark.run(current)
+                    peak = tracemalloc.get_traced_memory()[1] - baseline
+                    tracemalloc.stop()
+                else:
+                    gc.disable()
+                    started = time.perf_counter()
+                    benchmark.run(current)
+                    elapsed = time.perf_counter() - started
+                    gc.enable()
+                    if iteration:
+                        timings.append(elapsed)
+            finally:
+                gc.enable()
+                if not benchmark.reuse_setup:
+                    benchmark.teardown(current)
+    finally:
+        if benchmark.reuse_setup:
+            benchmark.teardown(state)
+    return {
+        "rows": rows,
+        "median_s": round(statistics.median(timings), 6),
+        "min_s": round(min(timings), 6),
+        "stdev_s": round(statistics.stdev(timings), 6) if len(timings) > 1 else 0.0,
+        "peak_mb": round(peak / 1e6, 3),
+    }
+
+
+def run_benchmarks(sizes: List[str] = DEFAULT_SIZES, repeat: int = DEFAULT_REPEAT,
+                   only: Optional[List[str]] = None, verbose: bool = True) -> Dict:
+    """執行基準測試，回傳 {"meta": 環境資訊, "results": {"名稱@規模": 統計}}"""
+    results = {}
+    for size in sizes:
+        for benchmark in BENCHMARKS:
+            if only and benchmark.name not in only:
+                continue
+            key = f"{benchmark.name}@{size}"
+            results[key] = _measure(benchmark, SIZES[size], repeat)
+            if verbose:
+                stats = results[key]
+                print(f"⏱️ {key:<36} 中位數 {stats['median_s'] * 1000:>10.2f} ms  "
+                      f"±{stats['stdev_s'] * 1000:.2f}  高峰 {stats['peak_mb']:.1f} MB", file=sys.stderr)
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sqlite": audit_db.sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float = DEFAULT_TOLERANCE) -> List[Dict]:
+    """與基準比較，回傳超出容許範圍的退步項目（耗時取中位數，記憶體取高峰；基準為 0 時 ratio 為 None）"""
+    regressions = []
+    for key, stats in current["results"].items():
+        reference = baseline.get("results", {}).get(key)
+        if reference is None:
+            continue
+        for metric in ("median_s", "peak_mb"):
+            limit = reference[metric] * (1 + tolerance)
+            if stats[metric] > limit and stats[metric] - reference[metric] > (0.001 if metric == "median_s" else 0.5):
+                ratio = round(stats[metric] / reference[metric], 3) if reference[metric] else None
+                regressions.append({"benchmark": key, "metric": metric, "baseline": reference[metric],
+                                    "current": stats[metric], "ratio": ratio})
+    return regressions
+
+
+def main():
+    """命令列執行"""
+    parser = argparse.ArgumentParser(description="審核熱路徑效能基準測試")
+    parser.add_argument("--sizes", default=",".join(DEFAULT_SIZES), help="資料規模：1k,100k,1m")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="每項計時次數（另含一次暖機）")
+    parser.add_argument("--only", default="", help="只執行指定項目（逗號分隔）")
+    parser.add_argument("--output", default=None, help="結果 JSON 輸出路徑（預設印出）")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基準 JSON 路徑")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="容許退步比例（0.25 = 25%%）")
+    parser.add_argument("--update-baseline", action="store_true", help="以本次結果更新基準檔")
+    args = parser.parse_args()
+
+    sizes = [size for size in args.sizes.split(",") if size]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"不支援的規模: {', '.join(unknown)}")
+    only = [name for name in args.only.split(",") if name]
+
+    current = run_benchmarks(sizes, args.repeat, only)
+    payload = json.dumps(current, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    if args.update_baseline:
+        baseline = {"meta": current["meta"], "results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline["results"] = json.load(f).get("results", {})
+        baseline["results"].update(current["results"])
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            f.write(json.dumps(baseline, ensure_ascii=False, indent=2) + "\n")
+        print(f"📌 已更新基準檔 {args.baseline}", file=sys.stderr)
+        return
+
+    if not os.path.exists(args.baseline):
+        print("⚠️ 找不到基準檔，略過比較（可加上 --update-baseline 建立）", file=sys.stderr)
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        regressions = compare(current, json.load(f), args.tolerance)
+    if regressions:
+        print(f"❌ {len(regressions)} 項超出容許範圍 ({args.tolerance:.0%})：", file=sys.stderr)
+        for item in regressions:
+            ratio = f" (x{item['ratio']})" if item["ratio"] is not None else ""
+            print(f"   {item['benchmark']} {item['metric']}: {item['baseline']} → {item['current']}{ratio}",
+                  file=sys.stderr)
+        sys.exit(1)
+    print(f"✅ 全部項目在容許範圍內 ({args.tolerance:.0%})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
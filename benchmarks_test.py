@@ -0,0 +1,91 @@
+"""
+效能基準測試工具測試 - 大戶投資審核系統
+驗證合成資料、基準量測輸出格式與退步判定
+"""
+
+import sys
+
+import benchmarks
+
+
+def test_synthetic_data():
+    """測試合成資料筆數正確且可重現"""
+    print("\n🧪 開始測試合成資料...")
+    values = benchmarks.make_values(1000)
+    snapshot = benchmarks.make_snapshot(1000)
+    print(f"📊 市值序列 {len(values)} 筆，投資者 {values['investor_id'].nunique()} 位；快照 {len(snapshot)} 筆")
+    assert len(values) == 1000 and len(snapshot) == 1000, "合成資料筆數不符"
+    assert values.equals(benchmarks.make_values(1000)), "相同規模的合成資料應可重現"
+    assert snapshot["investor_id"].is_unique, "快照的投資者 ID 應不重複"
+
+
+def test_run_benchmarks():
+    """測試量測結果包含耗時與記憶體高峰，逐筆項目依上限截斷"""
+    print("\n⏱️ 開始測試基準量測...")
+    report = benchmarks.run_benchmarks(["1k"], repeat=2, verbose=False,
+                                       only=["risk_metrics_batch", "risk_metrics_single", "generate_compliance_check",
+                                             "report_queries"])
+    results = report["results"]
+    for key, stats in results.items():
+        print(f"📊 {key}: {stats}")
+    assert set(results) == {"risk_metrics_batch@1k", "risk_metrics_single@1k", "generate_compliance_check@1k",
+                            "report_queries@1k"}, \
+        f"量測項目不符: {sorted(results)}"
+    assert all(stats["median_s"] > 0 and stats["peak_mb"] >= 0 for stats in results.values()), "耗時或記憶體高峰無效"
+    assert results["generate_compliance_check@1k"]["rows"] == benchmarks.MAX_SINGLE_CHECKS, "逐筆項目未依上限截斷"
+    assert report["meta"]["repeat"] == 2
+
+
+def test_compare():
+    """測試超出容許範圍才判定為退步：剛好等於上限、極小差距與基準沒有的項目都不算"""
+    print("\n📉 開始測試退步判定...")
+    baseline = {"results": {"a@1k": {"median_s": 1.0, "peak_mb": 10.0},
+                            "b@1k": {"median_s": 0.0001, "peak_mb": 1.0}}}
+    current = {"results": {"a@1k": {"median_s": 1.25, "peak_mb": 20.0},
+                           "b@1k": {"median_s": 0.0005, "peak_mb": 1.2},
+                           "c@1k": {"median_s": 9.0, "peak_mb": 9.0}}}
+    regressions = benchmarks.compare(current, baseline, tolerance=0.25)
+    print(f"📊 退步項目: {regressions}")
+    assert [(item["benchmark"], item["metric"]) for item in regressions] == [("a@1k", "peak_mb")], \
+        f"退步判定不符: {regressions}"
+    assert regressions[0]["ratio"] == 2.0
+
+    # 基準為 0（例如記憶體高峰量不到）時不可除以零，仍依絕對差距判定
+    zero = {"results": {"a@1k": {"median_s": 0.0, "peak_mb": 0.0}}}
+    grown = benchmarks.compare({"results": {"a@1k": {"median_s": 0.0005, "peak_mb": 2.0}}}, zero)
+    print(f"📊 基準為 0 的退步項目: {grown}")
+    assert [(item["metric"], item["ratio"]) for item in grown] == [("peak_mb", None)], f"基準為 0 時判定不符: {grown}"
+    assert benchmarks.compare(zero, zero) == []
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("⏱️ 效能基準測試工具測試")
+    print("=" * 60)
+
+    tests = [
+        ("🧪 合成資料測試", test_synthetic_data),
+        ("⏱️ 基準量測測試", test_run_benchmarks),
+        ("📉 退步判定測試", test_compare)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
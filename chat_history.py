@@ -0,0 +1,87 @@
+"""
+對話紀錄保存 - Google 開發計畫整合
+依登入者 email 將對話存入 SQLite，工作階段只保留最近視窗，較早訊息按需分頁載入
+"""
+
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import audit_db
+
+HISTORY_PATH = os.environ.get("CHAT_HISTORY_PATH", "chat_history.db")
+
+# 畫面預設顯示的訊息數、每次往前載入的訊息數、工作階段最多保留的訊息數
+RENDER_WINDOW = 30
+LOAD_MORE_SIZE = 30
+SESSION_CAP = 200
+# 送給 FinGPT 的最近對話則數
+CONTEXT_MESSAGES = 20
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS chat_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_email TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        metrics TEXT,
+        created_at REAL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_chat_messages_user ON chat_messages (user_email, id)",
+]
+
+
+def _to_message(row: tuple) -> Dict:
+    message_id, role, content, metrics = row
+    message = {"id": message_id, "role": role, "content": content}
+    if metrics:
+        message["metrics"] = json.loads(metrics)
+    return message
+
+
+class ChatHistory:
+    """每位使用者的對話紀錄（資料存於 SQLite）"""
+
+    def __init__(self, db_path: str = HISTORY_PATH):
+        self.db_path = db_path
+
+        def create(cursor):
+            for statement in SCHEMA:
+                cursor.execute(statement)
+        audit_db.run_write(create, db_path)
+
+    def append(self, user_email: str, message: Dict) -> int:
+        """保存一則訊息，回傳訊息 id"""
+        metrics = message.get("metrics")
+        return audit_db.execute_write('''
+            INSERT INTO chat_messages (user_email, role, content, metrics, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_email, message["role"], message["content"],
+              json.dumps(metrics) if metrics else None, time.time()), self.db_path)
+
+    def recent(self, user_email: str, limit: int = RENDER_WINDOW,
+               before_id: Optional[int] = None) -> List[Dict]:
+        """讀取最近的訊息（可指定只取某 id 之前），依時間由舊到新排列"""
+        rows = audit_db.query('''
+            SELECT id, role, content, metrics FROM chat_messages
+            WHERE user_email = ? AND id < ?
+            ORDER BY id DESC LIMIT ?
+        ''', (user_email, before_id if before_id is not None else 2 ** 63 - 1, limit), self.db_path)
+        return [_to_message(row) for row in reversed(rows)]
+
+    def has_older(self, user_email: str, before_id: int) -> bool:
+        """某 id 之前是否還有訊息"""
+        return audit_db.query_one("SELECT 1 FROM chat_messages WHERE user_email = ? AND id < ? LIMIT 1",
+                                  (user_email, before_id), self.db_path) is not None
+
+    def clear(self, user_email: str):
+        """刪除使用者的所有對話"""
+        audit_db.execute_write("DELETE FROM chat_messages WHERE user_email = ?", (user_email,), self.db_path)
+
+
+def cap_messages(messages: List[Dict], cap: int = SESSION_CAP) -> List[Dict]:
+    """限制工作階段保留的訊息數（丟棄最舊者，需要時可再由資料庫載入）"""
+    return messages[-cap:] if len(messages) > cap else messages
@@ -0,0 +1,76 @@
+"""
+對話紀錄保存測試 - Google 開發計畫整合
+驗證依使用者保存、最近視窗讀取、往前分頁與工作階段上限
+"""
+
+import os
+import sys
+import tempfile
+
+from chat_history import ChatHistory, cap_messages
+
+
+def test_history_window():
+    """測試最近視窗與往前分頁、使用者隔離與清除"""
+    print("\n💬 開始測試對話視窗...")
+    history = ChatHistory(os.path.join(tempfile.mkdtemp(), "chat.db"))
+    for i in range(50):
+        history.append("a@example.com", {"role": "user", "content": f"訊息 {i}"})
+    history.append("b@example.com", {"role": "user", "content": "其他使用者"})
+    history.append("a@example.com", {"role": "assistant", "content": "回覆", "metrics": {"total_latency": 1.5}})
+
+    recent = history.recent("a@example.com", 10)
+    older = history.recent("a@example.com", 45, before_id=recent[0]["id"])
+    print(f"📊 最近 {len(recent)} 則，往前載入 {len(older)} 則")
+    assert [m["content"] for m in recent[:2]] == ["訊息 41", "訊息 42"], "最近視窗應依時間由舊到新"
+    assert recent[-1]["metrics"] == {"total_latency": 1.5}, "附帶的效能指標未保存"
+    assert len(older) == 41 and older[0]["content"] == "訊息 0", "往前分頁應只取 before_id 之前的訊息"
+    assert not history.has_older("a@example.com", older[0]["id"])
+    assert history.has_older("a@example.com", recent[0]["id"])
+    assert [m["content"] for m in history.recent("b@example.com")] == ["其他使用者"], "不同使用者的紀錄應互相隔離"
+    history.clear("a@example.com")
+    assert history.recent("a@example.com") == [] and len(history.recent("b@example.com")) == 1, \
+        "清除只應影響該使用者"
+
+
+def test_session_cap():
+    """測試工作階段訊息上限只保留最新訊息"""
+    print("\n📦 開始測試工作階段上限...")
+    messages = [{"role": "user", "content": str(i)} for i in range(250)]
+    capped = cap_messages(messages, 200)
+    print(f"📊 保留 {len(capped)} 則，最舊為 {capped[0]['content']}")
+    assert len(capped) == 200 and capped[0]["content"] == "50", "超過上限時應保留最新訊息"
+    assert cap_messages(messages[:5], 200) == messages[:5]
+    assert cap_messages(messages[:200], 200) == messages[:200], "剛好等於上限時不應截斷"
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("💬 對話紀錄保存測試")
+    print("=" * 60)
+
+    tests = [
+        ("💬 對話視窗測試", test_history_window),
+        ("📦 工作階段上限測試", test_session_cap)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+合規規則引擎測試 - 大戶投資審核系統
+驗證各規則門檻邊界、設定檔覆寫與重新載入，以及單筆合規檢查維持原有回傳格式
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import compliance
+
+RULE_NAMES = ["投資者適當性", "分散投資", "風險揭露", "交易記錄", "定期審核"]
+
+
+def write_config(config: dict) -> str:
+    """寫入暫存規則設定檔"""
+    path = os.path.join(tempfile.mkdtemp(), "rules.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False)
+    return path
+
+
+def default_config() -> dict:
+    """讀取預設設定檔的原始內容（含停用的規則）"""
+    with open(compliance.RULES_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_rule_boundaries():
+    """測試每條規則門檻本身符合、超過即不符合，選填欄位缺值視為符合"""
+    print("\n📏 開始測試規則邊界...")
+    cases = [
+        # (說明, 欄位, 預期不符合的規則)
+        ("市值等於上限", {"portfolio_value": 10_000_000}, []),
+        ("市值超過上限", {"portfolio_value": 10_000_000.01}, ["投資者適當性"]),
+        ("市值無法解析", {"portfolio_value": "abc"}, ["投資者適當性"]),
+        ("持股比重等於上限", {"max_position_weight": 0.3}, []),
+        ("持股比重超過上限", {"max_position_weight": 0.3001}, ["分散投資"]),
+        ("持股比重缺值", {"max_position_weight": np.nan}, []),
+        ("未簽風險揭露", {"risk_disclosure_signed": False}, ["風險揭露"]),
+        ("風險揭露缺值", {"risk_disclosure_signed": None}, []),
+        ("交易記錄不完整", {"trade_records_complete": False}, ["交易記錄"]),
+        ("審核間隔等於期限", {"days_since_last_audit": 365}, []),
+        ("審核間隔超過期限", {"days_since_last_audit": 366}, ["定期審核"]),
+        ("全部不符合", {"portfolio_value": 2e8, "max_position_weight": 0.9, "risk_disclosure_signed": False,
+                   "trade_records_complete": False, "days_since_last_audit": 1000}, RULE_NAMES),
+    ]
+    data = pd.DataFrame([{"portfolio_value": 5e6, "max_position_weight": 0.1, "risk_disclosure_signed": True,
+                          "trade_records_complete": True, "days_since_last_audit": 30, **fields}
+                         for _, fields, _ in cases])
+    result = compliance.evaluate_compliance(data)
+    config = compliance.load_rule_config()
+
+    for index, (label, _, failed) in enumerate(cases):
+        row = result.iloc[index]
+        print(f"📊 {label}: {row['compliance_score']:.0f} 分 {list(row['findings'])}")
+        assert [name for name in RULE_NAMES if not row[name]] == failed, f"{label}: 不符合的規則不正確"
+        assert row["compliance_score"] == (5 - len(failed)) / 5 * 100, f"{label}: 分數不正確"
+        assert row["findings"] == tuple(config[name]["finding"] for name in failed), f"{label}: 發現順序應依設定檔"
+        assert row["recommendations"] == tuple(config[name]["recommendation"] for name in failed)
+
+    # 選填欄位整欄不存在時視為符合
+    bare = compliance.evaluate_compliance(pd.DataFrame({"portfolio_value": [5e6]}))
+    assert bare.iloc[0]["compliance_score"] == 100 and bare.iloc[0][RULE_NAMES].all()
+
+
+def test_config_override():
+    """測試設定檔覆寫門檻、停用規則與訊息，修改後自動重新載入，並拒絕未註冊的規則"""
+    print("\n⚙️ 開始測試設定檔覆寫...")
+    config = default_config()
+    config["投資者適當性"]["params"]["max_portfolio_value"] = 5e7
+    config["投資者適當性"]["finding"] = "超過自訂上限"
+    config["交易記錄"]["enabled"] = False
+    path = write_config(config)
+    data = pd.DataFrame({"portfolio_value": [5e7, 5e7 + 1], "trade_records_complete": [False, False]})
+
+    loaded = compliance.load_rule_config(path)
+    result = compliance.evaluate_compliance(data, loaded)
+    print(f"📊 覆寫後: {result[['compliance_score', 'findings']].to_dict('records')}")
+    assert list(loaded) == [name for name in RULE_NAMES if name != "交易記錄"], "停用的規則不應載入"
+    assert "交易記錄" not in result.columns
+    assert list(result["compliance_score"]) == [100.0, 75.0], "停用規則後分母應為啟用的規則數"
+    assert result.iloc[1]["findings"] == ("超過自訂上限",)
+    assert compliance.load_rule_config(path) is loaded, "設定檔未變動時應使用快取"
+
+    config["投資者適當性"]["params"]["max_portfolio_value"] = 1e8
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    reloaded = compliance.load_rule_config(path)
+    assert reloaded["投資者適當性"]["params"]["max_portfolio_value"] == 1e8, "設定檔修改後應重新載入"
+    assert list(compliance.evaluate_compliance(data, reloaded)["compliance_score"]) == [100.0, 100.0]
+
+    try:
+        compliance.load_rule_config(write_config({**default_config(), "未知規則": {"finding": "", "recommendation": ""}}))
+        raise AssertionError("未註冊的規則應拋出 ValueError")
+    except ValueError as e:
+        assert "未知規則" in str(e)
+
+    # COMPLIANCE_RULES_PATH 於匯入時決定預設設定檔
+    output = subprocess.run(
+        [sys.executable, "-c", "import json, compliance; print(json.dumps(compliance.generate_compliance_check(5e7 + 1),"
+                               " ensure_ascii=False))"],
+        env={**os.environ, "COMPLIANCE_RULES_PATH": path}, capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(compliance.__file__)))
+    assert json.loads(output.stdout)["compliance_score"] == 100.0, "環境變數指定的設定檔未生效"
+
+
+def test_baseline_shape():
+    """測試 generate_compliance_check 與規則引擎導入前的回傳內容、型別與鍵順序完全相同"""
+    print("\n🧾 開始測試單筆回傳格式...")
+    unsuitable = {
+        "compliance_score": 80.0,
+        "findings": ["投資金額超過大戶定義上限"],
+        "recommendations": ["建議降低投資金額或取得大戶投資者資格"],
+        "details": {"投資者適當性": False, "分散投資": True, "風險揭露": True, "交易記錄": True, "定期審核": True},
+    }
+    suitable = {"compliance_score": 100.0, "findings": [], "recommendations": [],
+                "details": {name: True for name in RULE_NAMES}}
+    for value, expected in ((5e7, unsuitable), (1e7, suitable), (np.int64(9_999_999), suitable)):
+        result = compliance.generate_compliance_check(value)
+        print(f"📊 {value}: {result}")
+        assert result == expected, f"市值 {value} 的合規檢查與原格式不同"
+        assert list(result) == list(expected) and list(result["details"]) == RULE_NAMES, "鍵順序應與原格式相同"
+        assert type(result["compliance_score"]) is float
+        assert type(result["findings"]) is list and type(result["recommendations"]) is list
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("⚖️ 合規規則引擎測試")
+    print("=" * 60)
+
+    tests = [
+        ("📏 規則邊界測試", test_rule_boundaries),
+        ("⚙️ 設定檔覆寫測試", test_config_override),
+        ("🧾 回傳格式測試", test_baseline_shape)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,56 +3,57 @@ FinGPT API 本地測試 - Google 開發計畫整合
 驗證 FinGPT API 連線與功能
 """
 
-import requests
+import argparse
 import json
 import sys
 import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-# FinGPT API 配置
-FINGPT_API_KEY = "your_fingpt_api_key_here"
-FINGPT_BASE_URL = "https://api.fingpt.com/v1"
+from fingpt_client import FINGPT_API_KEY, FINGPT_BASE_URL, FinGPTClient, FinGPTError
+from fingpt_mock_server import MockFinGPTServer, add_mock_arguments, state_from_args
+from llm_cache import ResponseCache
+from prompt_context import build_context, estimate_messages_tokens, with_context
+
+_client = None
+
+def get_client() -> FinGPTClient:
+    """共用連線池與回應快取的 FinGPT 客戶端（第一次使用時建立）
+
+    快取放在本次執行的暫存目錄，匯入或收集測試時不會在工作目錄建立 llm_cache.db，
+    各次執行也不會沿用上次的快取回應。
+    """
+    global _client
+    if _client is None:
+        _client = FinGPTClient(cache=ResponseCache(os.path.join(tempfile.mkdtemp(), "llm_cache.db")))
+    return _client
 
 def test_fingpt_connection():
     """測試 FinGPT API 連線"""
     print("🧠 開始測試 FinGPT API 連線...")
     
     try:
-        headers = {
-            "Authorization": f"Bearer {FINGPT_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
         # 測試基本連線
-        test_data = {
-            "model": "fingpt-pro",
-            "messages": [
-                {"role": "system", "content": "你是頂尖的台股AI分析師，請回應連線測試。"},
-                {"role": "user", "content": "請回應「FinGPT API 連線成功」確認連線正常。"}
-            ],
-            "max_tokens": 100,
-            "temperature": 0.7
-        }
+        messages = [
+            {"role": "system", "content": "你是頂尖的台股AI分析師，請回應連線測試。"},
+            {"role": "user", "content": "請回應「FinGPT API 連線成功」確認連線正常。"}
+        ]
         
         print("📡 正在發送測試請求...")
-        response = requests.post(f"{FINGPT_BASE_URL}/chat/completions", 
-                              headers=headers, 
-                              json=test_data, 
-                              timeout=30)
+        reply = get_client().complete(messages, max_tokens=100, temperature=0.7, timeout=30,
+                                      prompt_class="connection_test")
         
-        print(f"📊 回應狀態碼: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            reply = result["choices"][0]["message"]["content"]
-            print(f"✅ FinGPT API 連線成功！")
-            print(f"🤖 FinGPT 回應: {reply}")
-            return True
-        else:
-            print(f"❌ FinGPT API 連線失敗: {response.status_code}")
-            print(f"📄 錯誤內容: {response.text}")
-            return False
+        print(f"✅ FinGPT API 連線成功！")
+        print(f"🤖 FinGPT 回應: {reply}")
+        return True
             
+    except FinGPTError as e:
+        print(f"❌ FinGPT API 連線失敗: {e.status_code or e}")
+        if e.body:
+            print(f"📄 錯誤內容: {e.body}")
+        return False
     except Exception as e:
         print(f"❌ FinGPT API 連線異常: {str(e)}")
         return False
@@ -64,40 +65,18 @@ def test_stock_analysis():
     test_symbol = "0050.TW"
     
     try:
-        headers = {
-            "Authorization": f"Bearer {FINGPT_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        # 股票分析測試
-        analysis_data = {
-            "model": "fingpt-pro",
-            "messages": [
-                {"role": "system", "content": "你是頂尖的台股AI分析師，擅長技術分析和基本面分析。"},
-                {"role": "user", "content": f"請分析 {test_symbol} 的投資機會，包括：1.技術指標分析 2.基本面評估 3.風險評估 4.投資建議"}
-            ],
-            "max_tokens": 500,
-            "temperature": 0.7
-        }
-        
         print(f"📊 正在分析 {test_symbol}...")
-        response = requests.post(f"{FINGPT_BASE_URL}/chat/completions", 
-                              headers=headers, 
-                              json=analysis_data, 
-                              timeout=45)
+        context = build_context(f"{test_symbol} 技術指標", tickers=[test_symbol])
+        print(f"🧩 參考資料約 {context['tokens']} tokens，建構 {context['build_ms']:.1f} ms")
+        analysis = get_client().analyze_stock(test_symbol, context=context["text"])
         
-        print(f"📊 分析狀態碼: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            analysis = result["choices"][0]["message"]["content"]
-            print(f"✅ {test_symbol} 分析成功！")
-            print(f"🤖 FinGPT 分析結果:\n{analysis}")
-            return True
-        else:
-            print(f"❌ {test_symbol} 分析失敗: {response.status_code}")
-            return False
+        print(f"✅ {test_symbol} 分析成功！")
+        print(f"🤖 FinGPT 分析結果:\n{analysis}")
+        return True
             
+    except FinGPTError as e:
+        print(f"❌ {test_symbol} 分析失敗: {e.status_code or e}")
+        return False
     except Exception as e:
         print(f"❌ {test_symbol} 分析異常: {str(e)}")
         return False
@@ -107,46 +86,143 @@ def test_risk_assessment():
     print("\n🎯 開始測試風險評估功能...")
     
     try:
-        headers = {
-            "Authorization": f"Bearer {FINGPT_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        # 風險評估測試
-        risk_data = {
-            "model": "fingpt-pro",
-            "messages": [
-                {"role": "system", "content": "你是專業的投資風險評估師，請提供詳細的風險分析。"},
-                {"role": "user", "content": "請評估當前台股市場的整體風險，包括：1.市場風險 2.政策風險 3.流動性風險 4.投資建議"}
-            ],
-            "max_tokens": 800,
-            "temperature": 0.5
-        }
+        # 風險評估測試（以大盤 ETF 與權值股指標作為參考資料）
+        question = "請評估當前台股市場的整體風險，包括：1.市場風險 2.政策風險 3.流動性風險 4.投資建議"
+        context = build_context(question, tickers=["0050.TW", "2330.TW"])
+        messages = [
+            {"role": "system", "content": with_context("你是專業的投資風險評估師，請提供詳細的風險分析。", context)},
+            {"role": "user", "content": question}
+        ]
+        print(f"🧩 提示約 {estimate_messages_tokens(messages)} tokens，建構 {context['build_ms']:.1f} ms")
         
         print("🎯 正在進行風險評估...")
-        response = requests.post(f"{FINGPT_BASE_URL}/chat/completions", 
-                              headers=headers, 
-                              json=risk_data, 
-                              timeout=60)
-        
-        print(f"🎯 風險評估狀態碼: {response.status_code}")
+        risk_analysis = get_client().complete(messages, max_tokens=800, temperature=0.5, timeout=60,
+                                              prompt_class="risk_assessment")
         
-        if response.status_code == 200:
-            result = response.json()
-            risk_analysis = result["choices"][0]["message"]["content"]
-            print(f"✅ 風險評估成功！")
-            print(f"🎯 FinGPT 風險分析:\n{risk_analysis}")
-            return True
-        else:
-            print(f"❌ 風險評估失敗: {response.status_code}")
-            return False
+        print(f"✅ 風險評估成功！")
+        print(f"🎯 FinGPT 風險分析:\n{risk_analysis}")
+        return True
             
+    except FinGPTError as e:
+        print(f"❌ 風險評估失敗: {e.status_code or e}")
+        return False
     except Exception as e:
         print(f"❌ 風險評估異常: {str(e)}")
         return False
 
+def test_watchlist_analysis():
+    """測試觀察清單併發分析"""
+    print("\n📋 開始測試觀察清單併發分析...")
+    
+    watchlist = ["0050.TW", "2330.TW", "2317.TW", "2454.TW"]
+    
+    print(f"📊 正在併發分析 {len(watchlist)} 檔股票...")
+    results = get_client().analyze_many(watchlist)
+    
+    failed = [symbol for symbol, result in results.items() if "error" in result]
+    for symbol, result in results.items():
+        print(f"{'✅' if 'analysis' in result else '❌'} {symbol}: {result.get('analysis', result.get('error'))[:60]}")
+    return not failed
+
+def percentile(sorted_values, p: float):
+    """最近排名法百分位數"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def run_benchmark(base_url: str, api_key: str, total_requests: int, concurrency: int,
+                  stream: bool = False, retries: int = 0, timeout: float = 60) -> dict:
+    """以 N 個請求、C 個併發壓測 chat completions，回傳延遲百分位、吞吐量與錯誤分類"""
+    bench_client = FinGPTClient(api_key=api_key, base_url=base_url, max_retries=retries,
+                                timeout=timeout, pool_size=concurrency)
+    messages = [
+        {"role": "system", "content": "你是頂尖的台股AI分析師，擅長技術分析和基本面分析。"},
+        {"role": "user", "content": "請分析 0050.TW 的投資機會"}
+    ]
+    
+    def one_request(_):
+        start = time.perf_counter()
+        try:
+            if stream:
+                chat_stream = bench_client.stream_chat(messages)
+                for _ in chat_stream:
+                    pass
+                return time.perf_counter() - start, chat_stream.first_token_latency, None
+            bench_client.complete(messages)
+            return time.perf_counter() - start, None, None
+        except FinGPTError as e:
+            return time.perf_counter() - start, None, str(e.status_code or type(e.__cause__).__name__)
+        except Exception as e:
+            return time.perf_counter() - start, None, type(e).__name__
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one_request, range(total_requests)))
+    elapsed = time.perf_counter() - start
+    bench_client.close()
+    
+    latencies = sorted(latency for latency, _, error in results if error is None)
+    first_tokens = sorted(ttft for _, ttft, error in results if error is None and ttft is not None)
+    errors = {}
+    for _, _, error in results:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+    
+    def summary(values):
+        return {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+    
+    report = {
+        "base_url": base_url,
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "stream": stream,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": total_requests / elapsed if elapsed else 0,
+        "succeeded": len(latencies),
+        "failed": total_requests - len(latencies),
+        "error_breakdown": errors,
+        "latency_seconds": summary(latencies),
+    }
+    if stream:
+        report["time_to_first_token_seconds"] = summary(first_tokens)
+    return report
+
+def benchmark_main(args):
+    """壓測模式：輸出 JSON 報告"""
+    server = None
+    base_url = args.base_url
+    if args.mock:
+        server = MockFinGPTServer(state_from_args(args)).start()
+        base_url = server.base_url
+    try:
+        report = run_benchmark(base_url, FINGPT_API_KEY, args.requests, args.concurrency,
+                               stream=args.stream, retries=args.retries, timeout=args.timeout)
+        if server is not None:
+            report["mock_server"] = server.state.stats()
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    finally:
+        if server is not None:
+            server.stop()
+
 def main():
     """主測試程式"""
+    parser = argparse.ArgumentParser(description="FinGPT API 本地測試與壓測")
+    parser.add_argument("--benchmark", action="store_true", help="壓測模式，輸出 JSON 延遲報告")
+    parser.add_argument("--requests", type=int, default=200, help="壓測請求總數 N")
+    parser.add_argument("--concurrency", type=int, default=8, help="壓測併發數")
+    parser.add_argument("--stream", action="store_true", help="以 SSE 串流請求並量測首字延遲")
+    parser.add_argument("--retries", type=int, default=0, help="壓測時每個請求的重試次數")
+    parser.add_argument("--timeout", type=float, default=60, help="請求逾時秒數")
+    parser.add_argument("--base-url", default=FINGPT_BASE_URL, help="API 端點")
+    parser.add_argument("--mock", action="store_true", help="啟動本機 FinGPT 模擬伺服器作為端點")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    
+    if args.benchmark:
+        benchmark_main(args)
+        return
+    
     print("=" * 60)
     print("🧠 FinGPT API 本地測試 - Google 開發計畫整合")
     print("=" * 60)
@@ -159,7 +235,8 @@ def main():
     tests = [
         ("🔗 基本連線測試", test_fingpt_connection),
         ("📊 股票分析測試", test_stock_analysis),
-        ("🎯 風險評估測試", test_risk_assessment)
+        ("🎯 風險評估測試", test_risk_assessment),
+        ("📋 觀察清單併發測試", test_watchlist_analysis)
     ]
     
     results = []
@@ -183,12 +260,15 @@ def main():
     for test_name, result in results:
         print(f"{test_name}: {result}")
     
+    print(f"\n📦 回應快取統計: {get_client().cache.stats()}")
+    
     print(f"\n{'='*60}")
     print("💡 使用說明:")
     print("1. 請將 FINGPT_API_KEY 替換為真實的 API 金鑰")
     print("2. 在 PyCharm 中運行此檔案進行測試")
     print("3. 測試成功後，可在 dashboard_secure.py 中使用 FinGPT API")
     print("4. 確保網路連線正常")
+    print("5. 離線壓測: python fin_gpt_test.py --benchmark --mock --requests 200 --concurrency 8")
     print(f"{'='*60}")
 
 if __name__ == "__main__":
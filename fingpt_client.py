@@ -0,0 +1,292 @@
+"""
+FinGPT API 客戶端 - Google 開發計畫整合
+共用連線池的 Session、可設定逾時與抖動退避重試，並支援觀察清單併發分析
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrumentation
+from llm_cache import ResponseCache, cache_key
+
+# FinGPT API 配置
+FINGPT_API_KEY = os.environ.get("FINGPT_API_KEY", "your_fingpt_api_key_here")
+FINGPT_BASE_URL = os.environ.get("FINGPT_BASE_URL", "https://api.fingpt.com/v1")
+FINGPT_MODEL = "fingpt-pro"
+
+# 連線參數
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+POOL_SIZE = 16
+MAX_CONCURRENCY = 4
+
+# 可重試的 HTTP 狀態碼
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+ANALYST_PROMPT = "你是頂尖的台股AI分析師，擅長技術分析和基本面分析。"
+
+
+class FinGPTError(Exception):
+    """FinGPT API 呼叫失敗"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, body: str = ""):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+class ChatStream:
+    """串流 chat completions 回覆
+
+    迭代時逐段產生回覆文字；可由其他執行緒呼叫 cancel() 中止並關閉連線。
+    完成後記錄首個 token 延遲與總延遲（秒）。
+    """
+
+    def __init__(self, client: "FinGPTClient", payload: Dict, timeout=None,
+                 prompt_class: str = "default"):
+        self.client = client
+        self.payload = payload
+        self.timeout = timeout
+        self.prompt_class = prompt_class
+        self.text = ""
+        self.first_token_latency: Optional[float] = None
+        self.total_latency: Optional[float] = None
+        self.finished = False
+        self.cancelled = False
+        self._response: Optional[requests.Response] = None
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def cancel(self):
+        """中止串流並關閉底層連線"""
+        with self._lock:
+            self.cancelled = True
+            if self._response is not None:
+                self._response.close()
+
+    def metrics(self) -> Dict:
+        """回傳延遲統計"""
+        return {
+            "time_to_first_token": self.first_token_latency,
+            "total_latency": self.total_latency,
+            "cancelled": self.cancelled,
+        }
+
+    def _emit(self, delta: str) -> str:
+        if self.first_token_latency is None:
+            self.first_token_latency = time.perf_counter() - self._started
+            instrumentation.observe("fingpt.first_token", self.first_token_latency)
+        self.text += delta
+        return delta
+
+    def _deltas(self, response: requests.Response) -> Iterator[str]:
+        """解析 SSE（data: ...）事件；伺服器未串流時直接回傳完整內容"""
+        if "text/event-stream" not in response.headers.get("Content-Type", ""):
+            yield response.json()["choices"][0]["message"]["content"]
+            return
+        # SSE 規範固定使用 UTF-8
+        response.encoding = "utf-8"
+        lines = response.iter_lines(decode_unicode=True)
+        for line in lines:
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                # 讀完剩餘內容，讓連線可放回連線池重用
+                for _ in lines:
+                    pass
+                return
+            delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+    def __iter__(self) -> Iterator[str]:
+        cache = self.client.cache
+        key = None
+        if cache is not None and cache.ttl_for(self.prompt_class) > 0:
+            key = cache_key(self.payload["model"], self.payload["messages"],
+                            self.payload["temperature"], self.payload["max_tokens"])
+            cached = cache.get(key)
+            if cached is not None:
+                instrumentation.increment("fingpt.cache_hit")
+                yield self._emit(cached["choices"][0]["message"]["content"])
+                self.finished = True
+                self.total_latency = time.perf_counter() - self._started
+                return
+
+        response = self.client.post("/chat/completions", {**self.payload, "stream": True},
+                                    timeout=self.timeout, stream=True)
+        with self._lock:
+            self._response = response
+            if self.cancelled:
+                response.close()
+                return
+        try:
+            for delta in self._deltas(response):
+                if self.cancelled:
+                    return
+                yield self._emit(delta)
+            self.finished = True
+        except (requests.RequestException, ValueError, AttributeError, KeyError, IndexError, TypeError) as e:
+            # cancel() 關閉連線後讀取會失敗，視為中止；其餘連線中斷或格式異常統一以 FinGPTError 回報
+            if not self.cancelled:
+                raise FinGPTError(f"FinGPT API 串流中斷: {e}") from e
+        finally:
+            self.total_latency = time.perf_counter() - self._started
+            response.close()
+            instrumentation.observe("fingpt.stream", self.total_latency, not (self.finished or self.cancelled))
+
+        if self.finished and key is not None:
+            cache.put(key, {"choices": [{"message": {"role": "assistant", "content": self.text}}]},
+                      self.prompt_class)
+
+
+class FinGPTClient:
+    """FinGPT API 客戶端（執行緒安全，可於多個工作階段間共用）"""
+
+    def __init__(self, api_key: str = FINGPT_API_KEY, base_url: str = FINGPT_BASE_URL,
+                 model: str = FINGPT_MODEL,
+                 timeout: Union[float, Tuple[float, float]] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+                 max_retries: int = MAX_RETRIES, backoff_base: float = BACKOFF_BASE,
+                 pool_size: int = POOL_SIZE, cache: Optional[ResponseCache] = None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def close(self):
+        """關閉連線池"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """計算退避秒數（指數退避加完整抖動，尊重 Retry-After）"""
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_MAX, self.backoff_base * (2 ** attempt)))
+
+    @instrumentation.instrument("fingpt.post")
+    def post(self, path: str, payload: Dict, timeout: Union[float, Tuple[float, float], None] = None,
+             stream: bool = False) -> requests.Response:
+        """送出 POST 請求，連線錯誤、逾時與可重試狀態碼會以退避重試"""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(url, json=payload, timeout=timeout or self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise FinGPTError(f"FinGPT API 連線異常: {e}") from e
+                instrumentation.increment("fingpt.retry")
+                time.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code == 200:
+                return response
+            if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+                instrumentation.increment("fingpt.retry")
+                time.sleep(self._backoff(attempt, retry_after))
+                continue
+            raise FinGPTError(f"FinGPT API 回應錯誤: {response.status_code}",
+                              status_code=response.status_code, body=response.text)
+
+    def chat(self, messages: List[Dict], max_tokens: int = 500, temperature: float = 0.7,
+             timeout: Union[float, Tuple[float, float], None] = None, prompt_class: str = "default") -> Dict:
+        """呼叫 chat completions，回傳完整 JSON（設定快取時先查快取）"""
+        key = None
+        if self.cache is not None and self.cache.ttl_for(prompt_class) > 0:
+            key = cache_key(self.model, messages, temperature, max_tokens)
+            cached = self.cache.get(key)
+            if cached is not None:
+                instrumentation.increment("fingpt.cache_hit")
+                return cached
+
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        result = self.post("/chat/completions", payload, timeout=timeout).json()
+        if key is not None:
+            self.cache.put(key, result, prompt_class)
+        return result
+
+    def complete(self, messages: List[Dict], max_tokens: int = 500, temperature: float = 0.7,
+                 timeout: Union[float, Tuple[float, float], None] = None, prompt_class: str = "default") -> str:
+        """呼叫 chat completions，僅回傳助理回覆文字"""
+        result = self.chat(messages, max_tokens=max_tokens, temperature=temperature, timeout=timeout,
+                           prompt_class=prompt_class)
+        return result["choices"][0]["message"]["content"]
+
+    def stream_chat(self, messages: List[Dict], max_tokens: int = 500, temperature: float = 0.7,
+                    timeout: Union[float, Tuple[float, float], None] = None,
+                    prompt_class: str = "default") -> ChatStream:
+        """以 SSE 串流呼叫 chat completions，回傳可迭代的 ChatStream"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        return ChatStream(self, payload, timeout=timeout, prompt_class=prompt_class)
+
+    def analyze_stock(self, symbol: str, max_tokens: int = 500, context: str = "") -> str:
+        """分析單一股票（可附上技術指標等參考資料）"""
+        question = f"請分析 {symbol} 的投資機會，包括：1.技術指標分析 2.基本面評估 3.風險評估 4.投資建議"
+        if context:
+            question += f"\n\n參考資料：\n{context}"
+        messages = [
+            {"role": "system", "content": ANALYST_PROMPT},
+            {"role": "user", "content": question}
+        ]
+        return self.complete(messages, max_tokens=max_tokens, temperature=0.7, prompt_class="stock_analysis")
+
+    def analyze_many(self, symbols: Iterable[str], max_concurrency: int = MAX_CONCURRENCY,
+                     max_tokens: int = 500) -> Dict[str, Dict]:
+        """併發分析整份觀察清單（同時進行的請求數有上限）
+
+        回傳 {symbol: {"analysis": str}} 或 {symbol: {"error": str}}，順序與輸入相同。
+        """
+        symbols = list(dict.fromkeys(symbols))
+
+        def analyze(symbol: str) -> Dict:
+            try:
+                return {"analysis": self.analyze_stock(symbol, max_tokens=max_tokens)}
+            except Exception as e:
+                return {"error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(symbols) or 1))) as executor:
+            return dict(zip(symbols, executor.map(analyze, symbols)))
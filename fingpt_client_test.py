@@ -0,0 +1,228 @@
+"""
+FinGPT 客戶端本地測試 - Google 開發計畫整合
+以本機模擬伺服器驗證連線重用、重試、併發上限、快取與串流，不需網路與 API 金鑰
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import audit_db
+from fingpt_client import FinGPTClient, FinGPTError
+from fingpt_mock_server import MockFinGPTServer, MockState, mock_reply
+from llm_cache import ResponseCache
+
+
+def start_stub_server(**options):
+    """啟動本機 FinGPT 模擬伺服器，回傳 (server, base_url)"""
+    server = MockFinGPTServer(MockState(**options)).start()
+    return server, server.base_url
+
+
+def test_connection_reuse():
+    """測試連續請求重用同一條 keep-alive 連線"""
+    print("\n🔗 開始測試連線重用...")
+    server, base_url = start_stub_server()
+    state = server.state
+    try:
+        with FinGPTClient(api_key="test", base_url=base_url) as client:
+            for _ in range(5):
+                client.complete([{"role": "user", "content": "連線測試"}])
+        print(f"📊 請求 {state.requests} 次，使用 {len(state.client_ports)} 條連線")
+        assert state.requests == 5
+        assert len(state.client_ports) == 1, f"使用了 {len(state.client_ports)} 條連線，未重用 keep-alive 連線"
+    finally:
+        server.stop()
+
+
+def test_retry_on_server_error():
+    """測試 503 錯誤會以退避重試後成功"""
+    print("\n🔁 開始測試錯誤重試...")
+    server, base_url = start_stub_server(fail_first=2)
+    state = server.state
+    try:
+        with FinGPTClient(api_key="test", base_url=base_url, backoff_base=0.01) as client:
+            reply = client.complete([{"role": "user", "content": "重試測試"}])
+        print(f"📊 請求 {state.requests} 次，回覆: {reply}")
+        assert state.requests == 3, f"兩次 503 後應於第三次成功，實際請求 {state.requests} 次"
+        assert reply == mock_reply([{"role": "user", "content": "重試測試"}])
+    finally:
+        server.stop()
+
+
+def test_analyze_many_bounded():
+    """測試觀察清單併發分析不超過併發上限"""
+    print("\n📋 開始測試觀察清單併發上限...")
+    server, base_url = start_stub_server(latency="constant:0.1")
+    state = server.state
+    watchlist = [f"{code}.TW" for code in range(2301, 2309)]
+    try:
+        with FinGPTClient(api_key="test", base_url=base_url) as client:
+            start = time.perf_counter()
+            results = client.analyze_many(watchlist, max_concurrency=3)
+            elapsed = time.perf_counter() - start
+        print(f"📊 {len(results)} 檔完成，最大同時請求 {state.max_in_flight}，耗時 {elapsed:.2f} 秒")
+        assert list(results) == watchlist, "結果應依觀察清單順序"
+        assert all("analysis" in result for result in results.values())
+        assert 1 < state.max_in_flight <= 3, f"最大同時請求 {state.max_in_flight}，超出併發上限或未併發"
+    finally:
+        server.stop()
+
+
+def test_response_cache():
+    """測試相同請求命中快取、容量超出時淘汰最久未使用項目"""
+    print("\n📦 開始測試回應快取...")
+    server, base_url = start_stub_server()
+    state = server.state
+    cache = ResponseCache(db_path=os.path.join(tempfile.mkdtemp(), "llm_cache_test.db"), max_entries=2)
+    try:
+        with FinGPTClient(api_key="test", base_url=base_url, cache=cache) as client:
+            first = client.analyze_stock("0050.TW")
+            second = client.analyze_stock("0050.TW")
+            client.analyze_stock("2330.TW")
+            client.analyze_stock("0050.TW")
+            client.analyze_stock("2317.TW")
+            client.analyze_stock("2330.TW")
+        stats = cache.stats()
+        print(f"📊 伺服器請求 {state.requests} 次，快取統計: {stats}")
+        assert first == second
+        assert state.requests == 4 and stats["hits"] == 2, f"快取命中不符: 請求 {state.requests} 次，{stats}"
+        # 容量 2：0050 在 2330 之後再被讀取，2317 寫入時淘汰的是 2330
+        assert stats["entries"] == 2 and stats["evictions"] == 2, f"淘汰不符: {stats}"
+    finally:
+        server.stop()
+
+
+def test_cache_budget():
+    """測試容量以觸發器維護的總計判斷、節流期間的命中於下次寫入時補記，以及超出大小上限時的淘汰"""
+    print("\n📏 開始測試快取容量...")
+    cache = ResponseCache(db_path=os.path.join(tempfile.mkdtemp(), "llm_cache_test.db"), max_bytes=1000)
+
+    def stored(column: str) -> list:
+        return [row[0] for row in audit_db.query(f"SELECT {column} FROM llm_cache ORDER BY key", (), cache.db_path)]
+
+    for index in range(3):
+        cache.put(f"k{index}", {"text": "x" * 290})
+    cache.get("k0")
+    assert stored("hits") == [0, 0, 0], "節流期間的命中不應立即寫入"
+    cache.put("k3", {"text": "x" * 290})
+    stats = cache.stats()
+    direct = audit_db.query_one("SELECT COUNT(*), SUM(size_bytes) FROM llm_cache", (), cache.db_path)
+    print(f"📊 快取統計: {stats}，剩餘 {stored('key')}")
+    assert stored("key") == ["k0", "k2", "k3"], "超出大小上限時應淘汰最久未使用的項目"
+    assert stored("hits")[0] == 1, "暫存的命中應於寫入時補記"
+    assert (stats["entries"], stats["total_bytes"]) == tuple(direct) and stats["evictions"] == 1
+
+    cache.put("k2", {"text": "y"})
+    direct = audit_db.query_one("SELECT COUNT(*), SUM(size_bytes) FROM llm_cache", (), cache.db_path)
+    assert (cache.stats()["entries"], cache.stats()["total_bytes"]) == tuple(direct), "覆寫後總計應一致"
+    cache.clear()
+    assert cache.stats()["entries"] == 0 and cache.stats()["total_bytes"] == 0, "清空後總計應歸零"
+
+
+def test_streaming_reply():
+    """測試串流回覆逐段產生並記錄首字延遲"""
+    print("\n🌊 開始測試串流回覆...")
+    server, base_url = start_stub_server(chunk_size=4)
+    expected = mock_reply([{"role": "user", "content": "串流測試"}])
+    try:
+        with FinGPTClient(api_key="test", base_url=base_url) as client:
+            stream = client.stream_chat([{"role": "user", "content": "串流測試"}])
+            chunks = list(stream)
+        metrics = stream.metrics()
+        print(f"📊 收到 {len(chunks)} 段，全文: {stream.text}，延遲: {metrics}")
+        assert len(chunks) == -(-len(expected) // 4), f"收到 {len(chunks)} 段，與分段大小不符"
+        assert stream.text == expected and stream.finished
+        assert metrics["time_to_first_token"] <= metrics["total_latency"]
+    finally:
+        server.stop()
+
+
+def test_stream_cancel():
+    """測試由其他執行緒中止串流後迭代立即結束"""
+    print("\n🛑 開始測試串流中止...")
+    server, base_url = start_stub_server(chunk_interval=0.2)
+    try:
+        with FinGPTClient(api_key="test", base_url=base_url) as client:
+            stream = client.stream_chat([{"role": "user", "content": "中止測試"}])
+            received = []
+            first_chunk = threading.Event()
+
+            def consume():
+                for delta in stream:
+                    received.append(delta)
+                    first_chunk.set()
+
+            consumer = threading.Thread(target=consume)
+            consumer.start()
+            first_chunk.wait(timeout=5)
+            stream.cancel()
+            consumer.join(timeout=5)
+        print(f"📊 中止前收到 {len(received)} 段: {stream.text}")
+        assert not consumer.is_alive(), "中止後迭代未結束"
+        assert stream.cancelled and not stream.finished
+        assert len(received) < 3, f"中止後仍收到 {len(received)} 段"
+    finally:
+        server.stop()
+
+
+def test_stream_broken():
+    """測試串流中途斷線時以 FinGPTError 回報，且不寫入快取"""
+    print("\n💥 開始測試串流中斷...")
+    server, base_url = start_stub_server(break_stream_after=2)
+    cache = ResponseCache(db_path=os.path.join(tempfile.mkdtemp(), "llm_cache_test.db"))
+    received, error = [], None
+    try:
+        with FinGPTClient(api_key="test", base_url=base_url, cache=cache) as client:
+            stream = client.stream_chat([{"role": "user", "content": "斷線測試"}], prompt_class="chat")
+            try:
+                for delta in stream:
+                    received.append(delta)
+            except FinGPTError as e:
+                error = e
+        print(f"📊 斷線前收到 {len(received)} 段，錯誤: {error}")
+        assert error is not None, "串流中斷應以 FinGPTError 回報，而非底層的 requests 例外"
+        assert len(received) == 2 and not stream.finished and not stream.cancelled
+        assert cache.stats()["entries"] == 0, "不完整的回覆不應寫入快取"
+    finally:
+        server.stop()
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("🧠 FinGPT 客戶端本地測試")
+    print("=" * 60)
+
+    tests = [
+        ("🔗 連線重用測試", test_connection_reuse),
+        ("🔁 錯誤重試測試", test_retry_on_server_error),
+        ("📋 併發上限測試", test_analyze_many_bounded),
+        ("📦 回應快取測試", test_response_cache),
+        ("📏 快取容量測試", test_cache_budget),
+        ("🌊 串流回覆測試", test_streaming_reply),
+        ("🛑 串流中止測試", test_stream_cancel),
+        ("💥 串流中斷測試", test_stream_broken)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+FinGPT 本機模擬伺服器 - Google 開發計畫整合
+模擬 /chat/completions，可設定延遲分布、錯誤率與 SSE 串流，供離線測試與壓測使用
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """解析延遲分布設定（秒）
+
+    支援 constant:S、uniform:LOW,HIGH、normal:MEAN,STD、lognormal:MEDIAN,SIGMA。
+    """
+    kind, _, args = spec.partition(":")
+    params = [float(value) for value in args.split(",") if value]
+    if kind == "constant":
+        return lambda rng: params[0] if params else 0.0
+    if kind == "uniform":
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(params[0]), params[1])
+    raise ValueError(f"不支援的延遲分布: {spec}")
+
+
+class MockState:
+    """模擬伺服器設定與統計"""
+
+    def __init__(self, latency: str = "constant:0", chunk_interval: float = 0.0,
+                 error_rates: Optional[Dict[int, float]] = None, fail_first: int = 0,
+                 chunk_size: int = 4, seed: Optional[int] = None, break_stream_after: Optional[int] = None):
+        self.latency = parse_latency(latency)
+        self.chunk_interval = chunk_interval
+        self.error_rates = error_rates or {}
+        self.fail_first = fail_first
+        self.chunk_size = chunk_size
+        # 串流送出此段數後直接斷線（不送結束區塊），模擬上游中斷
+        self.break_stream_after = break_stream_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors: Dict[int, int] = {}
+        self.client_ports = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def admit(self, client_port: int):
+        """登記一筆請求並決定延遲與是否回應錯誤，回傳 (延遲秒數, 錯誤狀態碼或 None)"""
+        with self.lock:
+            self.requests += 1
+            self.client_ports.add(client_port)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = self.latency(self.rng)
+            status = 503 if self.requests <= self.fail_first else None
+            if status is None:
+                draw = self.rng.random()
+                for code, rate in self.error_rates.items():
+                    if draw < rate:
+                        status = code
+                        break
+                    draw -= rate
+            if status is not None:
+                self.errors[status] = self.errors.get(status, 0) + 1
+            return delay, status
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": dict(self.errors),
+                "connections": len(self.client_ports),
+                "max_in_flight": self.max_in_flight,
+            }
+
+
+def mock_reply(messages) -> str:
+    """依最後一則使用者訊息產生固定格式的模擬回覆"""
+    question = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    return f"【模擬 FinGPT】針對「{question[:30]}」：技術面中性偏多，基本面穩健，建議分批佈局並控制部位風險。"
+
+
+def make_handler(state: MockState):
+    """建立綁定狀態的請求處理類別"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def handle(self):
+            try:
+                super().handle()
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+
+        def send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_stream(self, content: str):
+            """以 chunked 傳輸逐段送出 SSE 事件"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            pieces = [content[i:i + state.chunk_size] for i in range(0, len(content), state.chunk_size)]
+            events = [json.dumps({"choices": [{"delta": {"content": piece}}]}, ensure_ascii=False)
+                      for piece in pieces] + ["[DONE]"]
+            for index, event in enumerate(events):
+                if index == state.break_stream_after:
+                    self.close_connection = True
+                    return
+                if index and state.chunk_interval:
+                    time.sleep(state.chunk_interval)
+                chunk = f"data: {event}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            delay, status = state.admit(self.client_address[1])
+            try:
+                time.sleep(delay)
+                if not self.path.endswith("/chat/completions"):
+                    self.send_json(404, {"error": "not found"})
+                elif status is not None:
+                    headers = {"Retry-After": "0"} if status == 429 else None
+                    self.send_json(status, {"error": f"mock error {status}"}, headers)
+                elif payload.get("stream"):
+                    self.send_stream(mock_reply(payload.get("messages", [])))
+                else:
+                    content = mock_reply(payload.get("messages", []))
+                    self.send_json(200, {
+                        "model": payload.get("model"),
+                        "choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]
+                    })
+            finally:
+                state.release()
+
+    return Handler
+
+
+class MockFinGPTServer(ThreadingHTTPServer):
+    """FinGPT 模擬伺服器"""
+
+    daemon_threads = True
+
+    def __init__(self, state: Optional[MockState] = None, host: str = "127.0.0.1", port: int = 0):
+        self.state = state or MockState()
+        super().__init__((host, port), make_handler(self.state))
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockFinGPTServer":
+        """於背景執行緒啟動"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """停止並釋放連接埠"""
+        self.shutdown()
+        self.server_close()
+
+
+def parse_error_rates(spec: str) -> Dict[int, float]:
+    """解析錯誤率設定，例如 503:0.05,429:0.02"""
+    rates = {}
+    for item in filter(None, spec.split(",")):
+        code, _, rate = item.partition(":")
+        rates[int(code)] = float(rate)
+    return rates
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """加入模擬伺服器命令列參數"""
+    parser.add_argument("--latency", default="lognormal:0.2,0.5",
+                        help="延遲分布：constant:S、uniform:LOW,HIGH、normal:MEAN,STD、lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--chunk-interval", type=float, default=0.02, help="串流每段間隔秒數")
+    parser.add_argument("--error-rates", default="", help="錯誤率，例如 503:0.05,429:0.02")
+    parser.add_argument("--seed", type=int, default=None, help="亂數種子")
+
+
+def state_from_args(args) -> MockState:
+    """由命令列參數建立模擬狀態"""
+    return MockState(latency=args.latency, chunk_interval=args.chunk_interval,
+                     error_rates=parse_error_rates(args.error_rates), seed=args.seed)
+
+
+def main():
+    """啟動模擬伺服器"""
+    parser = argparse.ArgumentParser(description="FinGPT 本機模擬伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockFinGPTServer(state_from_args(args), host=args.host, port=args.port)
+    print(f"🧪 FinGPT 模擬伺服器啟動: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 統計: {server.state.stats()}")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
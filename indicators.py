@@ -0,0 +1,244 @@
+"""
+技術指標引擎 - 大戶投資審核系統
+對整個股票清單一次計算 RSI、MACD、布林通道、ATR 與均線，依代號快取並每日只補算最新K棒
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+import instrumentation
+import market_data
+
+CACHE_DIR = os.environ.get("INDICATOR_CACHE", "indicator_cache")
+
+# 預設指標設定（欄位命名與 pandas_ta 相同，如 RSI_14、MACD_12_26_9、BBL_20_2.0、ATRr_14）
+DEFAULT_INDICATORS = {
+    "rsi": {"length": 14},
+    "macd": {"fast": 12, "slow": 26, "signal": 9},
+    "bbands": {"length": 20, "std": 2.0},
+    "atr": {"length": 14},
+    "sma": {"lengths": [20, 60]},
+    "ema": {"lengths": [20]},
+}
+
+# 增量計算時往前取的K棒數，使指數平滑結果與全量計算一致
+WARMUP_MULTIPLIER = 10
+MIN_WARMUP = 250
+
+
+def config_signature(config: Dict) -> str:
+    """指標設定的雜湊，用於區分快取"""
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def warmup_bars(config: Dict) -> int:
+    """增量計算所需的前置K棒數"""
+    lengths = [1]
+    for params in config.values():
+        for key, value in params.items():
+            if key in ("length", "fast", "slow", "signal"):
+                lengths.append(value)
+            elif key == "lengths":
+                lengths.extend(value)
+    if "macd" in config:
+        lengths.append(config["macd"]["slow"] + config["macd"]["signal"])
+    return max(MIN_WARMUP, WARMUP_MULTIPLIER * max(lengths))
+
+
+def compute_indicators(bars: pd.DataFrame, config: Optional[Dict] = None) -> pd.DataFrame:
+    """對長格式K線（ticker, Date, High, Low, Close）一次計算所有代號的指標
+
+    以 groupby 的向量化 rolling / ewm 運算，每種指標對整個清單只執行一次。
+    """
+    config = config or DEFAULT_INDICATORS
+    bars = bars.sort_values(["ticker", "Date"], kind="mergesort").reset_index(drop=True)
+    grouped = bars.groupby("ticker", sort=False)
+    close = bars["Close"]
+    out = pd.DataFrame({"ticker": bars["ticker"], "Date": bars["Date"], "Close": close})
+
+    def rolling(series: pd.Series, length: int, how: str) -> pd.Series:
+        result = getattr(series.groupby(bars["ticker"], sort=False).rolling(length, min_periods=length), how)
+        return (result(ddof=0) if how == "std" else result()).reset_index(level=0, drop=True).sort_index()
+
+    def ewm(series: pd.Series, **params) -> pd.Series:
+        result = series.groupby(bars["ticker"], sort=False).ewm(adjust=False, **params).mean()
+        return result.reset_index(level=0, drop=True).sort_index()
+
+    def rma(series: pd.Series, length: int) -> pd.Series:
+        return ewm(series, alpha=1 / length, min_periods=length)
+
+    if "sma" in config:
+        for length in config["sma"]["lengths"]:
+            out[f"SMA_{length}"] = rolling(close, length, "mean")
+    if "ema" in config:
+        for length in config["ema"]["lengths"]:
+            out[f"EMA_{length}"] = ewm(close, span=length, min_periods=length)
+
+    if "rsi" in config:
+        length = config["rsi"]["length"]
+        change = grouped["Close"].diff()
+        gain = rma(change.clip(lower=0), length)
+        loss = rma(-change.clip(upper=0), length)
+        out[f"RSI_{length}"] = 100 * gain / (gain + loss)
+
+    if "macd" in config:
+        fast, slow, signal = config["macd"]["fast"], config["macd"]["slow"], config["macd"]["signal"]
+        suffix = f"{fast}_{slow}_{signal}"
+        macd = ewm(close, span=fast, min_periods=fast) - ewm(close, span=slow, min_periods=slow)
+        macd_signal = ewm(macd, span=signal, min_periods=signal)
+        out[f"MACD_{suffix}"] = macd
+        out[f"MACDh_{suffix}"] = macd - macd_signal
+        out[f"MACDs_{suffix}"] = macd_signal
+
+    if "bbands" in config:
+        length, std = config["bbands"]["length"], float(config["bbands"]["std"])
+        middle = rolling(close, length, "mean")
+        deviation = rolling(close, length, "std")
+        out[f"BBL_{length}_{std}"] = middle - std * deviation
+        out[f"BBM_{length}_{std}"] = middle
+        out[f"BBU_{length}_{std}"] = middle + std * deviation
+
+    if "atr" in config:
+        length = config["atr"]["length"]
+        previous_close = grouped["Close"].shift(1)
+        true_range = pd.concat([bars["High"] - bars["Low"], (bars["High"] - previous_close).abs(),
+                                (bars["Low"] - previous_close).abs()], axis=1).max(axis=1, skipna=False)
+        true_range = true_range.fillna(bars["High"] - bars["Low"])
+        out[f"ATRr_{length}"] = rma(true_range, length)
+
+    return out
+
+
+def _cache_path(ticker: str, config: Dict, cache_dir: str) -> str:
+    return os.path.join(cache_dir, config_signature(config), f"{ticker}.parquet")
+
+
+def cache_version(ticker: str, config: Optional[Dict] = None, cache_dir: str = CACHE_DIR) -> Optional[float]:
+    """指標快取的修改時間，供下游判斷是否需要重建（無快取時為 None）"""
+    path = _cache_path(ticker, config or DEFAULT_INDICATORS, cache_dir)
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def read_cached_indicators(ticker: str, config: Optional[Dict] = None, cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """讀取單一代號的指標快取，無快取時回傳空表"""
+    path = _cache_path(ticker, config or DEFAULT_INDICATORS, cache_dir)
+    return pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame()
+
+
+@instrumentation.instrument("indicators.update")
+def update_indicators(tickers: Iterable[str], config: Optional[Dict] = None, cache_dir: str = CACHE_DIR,
+                      price_cache_dir: str = market_data.CACHE_DIR) -> Dict[str, int]:
+    """以價格快取增量更新指標快取，回傳每個代號新增的列數
+
+    已有快取的代號只取最新K棒與前置暖機區間計算，並只附加新日期。
+    最後快取日的K棒若已被收盤後的完整資料覆寫（收盤價不同），該日指標一併重算取代。
+    """
+    config = config or DEFAULT_INDICATORS
+    warmup = warmup_bars(config)
+    pieces, last_dates, refresh_from = [], {}, {}
+
+    for ticker in dict.fromkeys(tickers):
+        prices = market_data.read_cached(ticker, price_cache_dir)
+        if prices.empty:
+            continue
+        cached = read_cached_indicators(ticker, config, cache_dir)
+        last_date = cached["Date"].max() if not cached.empty else None
+        if last_date is not None:
+            cached_close = cached.loc[cached["Date"] == last_date, "Close"].iloc[-1]
+            price_close = prices["Close"].get(last_date, cached_close)
+            rewritten = price_close != cached_close and not (pd.isna(price_close) and pd.isna(cached_close))
+            new_positions = ((prices.index >= last_date) if rewritten else (prices.index > last_date)).nonzero()[0]
+            if not len(new_positions):
+                continue
+            refresh_from[ticker] = prices.index[new_positions[0]]
+            prices = prices.iloc[max(0, new_positions[0] - warmup):]
+        last_dates[ticker] = last_date
+        pieces.append(pd.DataFrame({"ticker": ticker, "Date": prices.index, "High": prices["High"].to_numpy(),
+                                    "Low": prices["Low"].to_numpy(), "Close": prices["Close"].to_numpy()}))
+
+    if not pieces:
+        return {}
+
+    computed = compute_indicators(pd.concat(pieces, ignore_index=True), config)
+    added = {}
+    for ticker, frame in computed.groupby("ticker", sort=False):
+        last_date = last_dates[ticker]
+        if last_date is not None:
+            first = refresh_from[ticker]
+            cached = read_cached_indicators(ticker, config, cache_dir)
+            frame = pd.concat([cached[cached["Date"] < first], frame[frame["Date"] >= first]], ignore_index=True)
+            added[ticker] = int((frame["Date"] > last_date).sum())
+        else:
+            added[ticker] = len(frame)
+        path = _cache_path(ticker, config, cache_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        frame.reset_index(drop=True).to_parquet(path + ".tmp")
+        os.replace(path + ".tmp", path)
+    return added
+
+
+def load_indicators(tickers: Iterable[str], start=None, end=None, config: Optional[Dict] = None,
+                    cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """讀取多檔指標快取並依日期區間切片（長格式）"""
+    frames = [read_cached_indicators(ticker, config, cache_dir) for ticker in dict.fromkeys(tickers)]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    result = pd.concat(frames, ignore_index=True)
+    if start is not None:
+        result = result[result["Date"] >= pd.Timestamp(start)]
+    if end is not None:
+        result = result[result["Date"] <= pd.Timestamp(end)]
+    return result.reset_index(drop=True)
+
+
+def indicator_snapshot(tickers: Iterable[str], config: Optional[Dict] = None,
+                       cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """各代號最新一日的指標快照（每代號一列）"""
+    frames = [read_cached_indicators(ticker, config, cache_dir).tail(1) for ticker in dict.fromkeys(tickers)]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames).set_index("ticker")
+
+
+def format_snapshot(snapshot: pd.DataFrame, columns: Optional[List[str]] = None) -> str:
+    """將指標快照轉為精簡文字表格，供提示詞使用"""
+    if snapshot.empty:
+        return ""
+    frame = snapshot.drop(columns=["Date"]) if "Date" in snapshot else snapshot
+    if columns:
+        frame = frame[[column for column in columns if column in frame]]
+    header = "代號|日期|" + "|".join(frame.columns)
+    lines = [header]
+    for ticker, row in frame.iterrows():
+        day = snapshot.loc[ticker, "Date"].strftime("%Y-%m-%d") if "Date" in snapshot else ""
+        lines.append(f"{ticker}|{day}|" + "|".join(f"{value:.2f}" for value in row))
+    return "\n".join(lines)
+
+
+def main():
+    """同步行情並增量更新指標快取（每日排程用）"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="技術指標增量更新")
+    parser.add_argument("tickers", nargs="+", help="股票代號")
+    parser.add_argument("--offline", action="store_true", help="不下載行情，只用既有價格快取")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="指標快取目錄")
+    args = parser.parse_args()
+
+    if not args.offline:
+        report = market_data.sync_prices(args.tickers)
+        for ticker, error in report["errors"].items():
+            print(f"⚠️ {ticker} 行情同步失敗: {error}")
+    added = update_indicators(args.tickers, cache_dir=args.cache_dir)
+    print(f"📈 新增指標列數: {added}")
+    print(format_snapshot(indicator_snapshot(args.tickers, cache_dir=args.cache_dir)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+技術指標引擎測試 - 大戶投資審核系統
+以固定的假行情驗證批次計算、增量更新與快照
+"""
+
+import sys
+import tempfile
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import indicators
+import market_data
+from market_data_test import FixtureDownloader
+
+TICKERS = ["0050.TW", "2330.TW", "AAPL"]
+
+
+def test_batch_matches_single():
+    """測試整批計算與逐檔計算結果一致"""
+    print("\n📐 開始測試批次指標計算...")
+    cache_dir = tempfile.mkdtemp()
+    market_data.sync_prices(TICKERS, today=date(2024, 12, 31), history_days=400,
+                            cache_dir=cache_dir, downloader=FixtureDownloader())
+    frames = []
+    for ticker in TICKERS:
+        prices = market_data.read_cached(ticker, cache_dir)
+        frames.append(pd.DataFrame({"ticker": ticker, "Date": prices.index, "High": prices["High"].to_numpy(),
+                                    "Low": prices["Low"].to_numpy(), "Close": prices["Close"].to_numpy()}))
+    batch = indicators.compute_indicators(pd.concat(frames, ignore_index=True))
+    single = indicators.compute_indicators(frames[1]).drop(columns=["ticker", "Date"]).to_numpy()
+    subset = batch[batch["ticker"] == "2330.TW"].drop(columns=["ticker", "Date"]).to_numpy()
+
+    rsi = batch["RSI_14"].dropna()
+    print(f"📊 指標欄位: {list(batch.columns[3:])}")
+    assert np.allclose(subset, single, equal_nan=True), "整批計算結果與逐檔計算不一致"
+    assert rsi.between(0, 100).all(), "RSI 超出 0~100 範圍"
+    assert {"MACD_12_26_9", "BBU_20_2.0", "ATRr_14"} <= set(batch.columns)
+    # 各檔暖機期互不影響：每檔第一根 K 棒不得沿用前一檔的資料
+    first_rows = batch.groupby("ticker", sort=False).head(1)
+    assert first_rows["RSI_14"].isna().all(), "跨檔位的指標計算發生資料串接"
+
+
+def test_incremental_update():
+    """測試每日只補算最新K棒，且結果與全量重算一致"""
+    print("\n🔄 開始測試增量更新...")
+    price_dir, cache_dir, full_dir = tempfile.mkdtemp(), tempfile.mkdtemp(), tempfile.mkdtemp()
+    downloader = FixtureDownloader()
+    # 短週期設定使暖機區間小於歷史長度，確保真的只補算尾端
+    config = {"rsi": {"length": 5}, "macd": {"fast": 3, "slow": 6, "signal": 3}, "bbands": {"length": 5, "std": 2.0},
+              "atr": {"length": 5}, "sma": {"lengths": [5]}, "ema": {"lengths": [5]}}
+
+    market_data.sync_prices(TICKERS, today=date(2025, 3, 28), history_days=800,
+                            cache_dir=price_dir, downloader=downloader)
+    indicators.update_indicators(TICKERS, config, cache_dir, price_dir)
+    market_data.sync_prices(TICKERS, today=date(2025, 4, 4), cache_dir=price_dir, downloader=downloader)
+    added = indicators.update_indicators(TICKERS, config, cache_dir, price_dir)
+    unchanged = indicators.update_indicators(TICKERS, config, cache_dir, price_dir)
+    indicators.update_indicators(TICKERS, config, full_dir, price_dir)
+
+    incremental = indicators.load_indicators(TICKERS, config=config, cache_dir=cache_dir)
+    full = indicators.load_indicators(TICKERS, config=config, cache_dir=full_dir)
+    print(f"📊 第二次更新: {added}，第三次更新: {unchanged}")
+    assert added == {ticker: 5 for ticker in TICKERS}, f"應只補算 5 根新 K 棒，實際 {added}"
+    assert unchanged == {}, "無新行情時不應重算"
+    assert np.allclose(incremental.iloc[:, 2:].to_numpy(), full.iloc[:, 2:].to_numpy(), equal_nan=True), \
+        "增量結果與全量重算不一致"
+
+
+def test_rewritten_last_bar():
+    """測試最後一天的K棒被收盤後的完整資料覆寫時，該日指標重算而不新增列"""
+    print("\n🕯️ 開始測試最後一天重算...")
+    price_dir, cache_dir, full_dir = tempfile.mkdtemp(), tempfile.mkdtemp(), tempfile.mkdtemp()
+    config = {"rsi": {"length": 5}, "atr": {"length": 5}, "sma": {"lengths": [5]}, "ema": {"lengths": [5]}}
+
+    def intraday(tickers, start, end):
+        frames = FixtureDownloader()(tickers, start, end)
+        for frame in frames.values():
+            frame.iloc[-1] = frame.iloc[-1] * 0.9
+        return frames
+
+    market_data.sync_prices(TICKERS, today=date(2025, 3, 28), history_days=200, cache_dir=price_dir,
+                            downloader=intraday)
+    indicators.update_indicators(TICKERS, config, cache_dir, price_dir)
+    market_data.sync_prices(TICKERS, today=date(2025, 3, 28), cache_dir=price_dir, downloader=FixtureDownloader())
+    refreshed = indicators.update_indicators(TICKERS, config, cache_dir, price_dir)
+    unchanged = indicators.update_indicators(TICKERS, config, cache_dir, price_dir)
+    indicators.update_indicators(TICKERS, config, full_dir, price_dir)
+
+    incremental = indicators.load_indicators(TICKERS, config=config, cache_dir=cache_dir)
+    full = indicators.load_indicators(TICKERS, config=config, cache_dir=full_dir)
+    print(f"📊 覆寫後更新: {refreshed}，再次更新: {unchanged}")
+    assert refreshed == {ticker: 0 for ticker in TICKERS} and unchanged == {}, "覆寫最後一天不應新增列"
+    assert incremental.shape == full.shape and np.allclose(incremental.iloc[:, 2:].to_numpy(),
+                                                           full.iloc[:, 2:].to_numpy(), equal_nan=True), \
+        "最後一天的指標應以覆寫後的K棒重算"
+
+
+def test_snapshot_prompt():
+    """測試指標快照與提示詞文字"""
+    print("\n🧾 開始測試指標快照...")
+    price_dir, cache_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    market_data.sync_prices(TICKERS, today=date(2024, 12, 31), history_days=400,
+                            cache_dir=price_dir, downloader=FixtureDownloader())
+    indicators.update_indicators(TICKERS, cache_dir=cache_dir, price_cache_dir=price_dir)
+    snapshot = indicators.indicator_snapshot(TICKERS + ["MISSING"], cache_dir=cache_dir)
+    text = indicators.format_snapshot(snapshot, ["Close", "RSI_14", "MACD_12_26_9"])
+    print(text)
+    assert list(snapshot.index) == TICKERS, "缺少快取的代號應被略過"
+    assert (snapshot["Date"] == pd.Timestamp(2024, 12, 31)).all()
+    assert text.splitlines()[0] == "代號|日期|Close|RSI_14|MACD_12_26_9"
+    assert len(text.splitlines()) == 4
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("📈 技術指標引擎測試")
+    print("=" * 60)
+
+    tests = [
+        ("📐 批次計算測試", test_batch_matches_single),
+        ("🔄 增量更新測試", test_incremental_update),
+        ("🕯️ 最後一天重算測試", test_rewritten_last_bar),
+        ("🧾 指標快照測試", test_snapshot_prompt)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+效能量測 - 大戶投資審核系統
+記錄資料庫、FinGPT 與風險／合規計算的耗時直方圖、次數與錯誤數，並以 Prometheus 文字格式匯出
+"""
+
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+# 預設啟用；設為 0 時量測點只剩一次旗標判斷
+ENABLED = os.environ.get("AUDIT_METRICS", "1") != "0"
+# 設定時於本機此埠提供 /metrics（0 為不啟動）
+EXPORT_PORT = int(os.environ.get("AUDIT_METRICS_PORT", "0") or 0)
+EXPORT_HOST = os.environ.get("AUDIT_METRICS_HOST", "127.0.0.1")
+METRIC_PREFIX = "audit"
+
+# 直方圖上界（秒）
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class OperationStats:
+    """單一操作的耗時直方圖與錯誤數"""
+
+    __slots__ = ("buckets", "count", "errors", "total", "max")
+
+    def __init__(self):
+        # 最後一格為超過最大上界（+Inf）
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float, error: bool):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.errors += error
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """由直方圖估計分位數（桶內線性內插，超過最大上界時以最大值估計）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+
+_lock = threading.Lock()
+_operations: Dict[str, OperationStats] = {}
+_events: Dict[str, int] = {}
+_servers: Dict[int, ThreadingHTTPServer] = {}
+
+
+def set_enabled(enabled: bool):
+    """啟用或停用量測（已記錄的統計保留）"""
+    global ENABLED
+    ENABLED = bool(enabled)
+
+
+def observe(operation: str, seconds: float, error: bool = False):
+    """記錄一次操作耗時"""
+    if not ENABLED:
+        return
+    with _lock:
+        stats = _operations.get(operation)
+        if stats is None:
+            stats = _operations[operation] = OperationStats()
+        stats.observe(seconds, error)
+
+
+def increment(event: str, amount: int = 1):
+    """累加事件次數（如鎖定重試、快取命中）"""
+    if not ENABLED:
+        return
+    with _lock:
+        _events[event] = _events.get(event, 0) + amount
+
+
+@contextmanager
+def timer(operation: str):
+    """量測區塊耗時，區塊拋出例外時計為錯誤"""
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    error = True
+    try:
+        yield
+        error = False
+    finally:
+        observe(operation, time.perf_counter() - started, error)
+
+
+def instrument(operation: str) -> Callable:
+    """量測函式耗時的裝飾器；拋出例外或回傳含 error 的 dict 時計為錯誤"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                observe(operation, time.perf_counter() - started, True)
+                raise
+            observe(operation, time.perf_counter() - started, isinstance(result, dict) and "error" in result)
+            return result
+        return wrapper
+    return decorator
+
+
+def reset():
+    """清除所有統計"""
+    with _lock:
+        _operations.clear()
+        _events.clear()
+
+
+def snapshot() -> List[Dict]:
+    """各操作的統計摘要（依總耗時由大到小，時間單位為毫秒）"""
+    with _lock:
+        rows = [{
+            "operation": name,
+            "count": stats.count,
+            "errors": stats.errors,
+            "error_rate": stats.errors / stats.count if stats.count else 0.0,
+            "total_ms": stats.total * 1000,
+            "mean_ms": stats.total / stats.count * 1000 if stats.count else 0.0,
+            "p50_ms": stats.quantile(0.5) * 1000,
+            "p95_ms": stats.quantile(0.95) * 1000,
+            "p99_ms": stats.quantile(0.99) * 1000,
+            "max_ms": stats.max * 1000,
+        } for name, stats in _operations.items()]
+    return sorted(rows, key=lambda row: -row["total_ms"])
+
+
+def events() -> Dict[str, int]:
+    """事件次數"""
+    with _lock:
+        return dict(_events)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus() -> str:
+    """以 Prometheus 文字格式（0.0.4）輸出所有統計"""
+    with _lock:
+        operations = {name: (list(stats.buckets), stats.count, stats.errors, stats.total)
+                      for name, stats in sorted(_operations.items())}
+        counters = dict(sorted(_events.items()))
+
+    duration = f"{METRIC_PREFIX}_operation_duration_seconds"
+    lines = [f"# HELP {duration} 操作耗時（秒）", f"# TYPE {duration} histogram"]
+    for name, (buckets, count, _, total) in operations.items():
+        label = _label(name)
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS + (float("inf"),), buckets):
+            cumulative += bucket
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            lines.append(f'{duration}_bucket{{operation="{label}",le="{le}"}} {cumulative}')
+        lines.append(f'{duration}_sum{{operation="{label}"}} {_number(total)}')
+        lines.append(f'{duration}_count{{operation="{label}"}} {count}')
+
+    errors = f"{METRIC_PREFIX}_operation_errors_total"
+    lines += [f"# HELP {errors} 操作錯誤次數", f"# TYPE {errors} counter"]
+    lines += [f'{errors}{{operation="{_label(name)}"}} {values[2]}' for name, values in operations.items()]
+
+    event_total = f"{METRIC_PREFIX}_events_total"
+    lines += [f"# HELP {event_total} 事件次數", f"# TYPE {event_total} counter"]
+    lines += [f'{event_total}{{event="{_label(name)}"}} {count}' for name, count in counters.items()]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str) -> str:
+    """寫入 Prometheus 文字檔（供 node_exporter textfile collector 讀取），先寫暫存檔再替換"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(render_prometheus())
+    os.replace(temp_path, path)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics 回傳 Prometheus 文字格式"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_exporter(port: Optional[int], host: str = EXPORT_HOST) -> Optional[ThreadingHTTPServer]:
+    """於背景執行緒提供 /metrics（同一埠只啟動一次），port 為 None 時不啟動
+
+    port 為 0 時由系統指派可用埠，實際埠號由回傳服務的 server_address[1] 取得。
+    """
+    if port is None:
+        return None
+    with _lock:
+        server = _servers.get(port) if port else None
+        if server is None:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            port = server.server_address[1]
+            _servers[port] = server
+            threading.Thread(target=server.serve_forever, daemon=True, name=f"metrics-{port}").start()
+    return server
+
+
+def stop_exporters():
+    """停止所有 /metrics 服務"""
+    with _lock:
+        servers = list(_servers.values())
+        _servers.clear()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
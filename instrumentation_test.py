@@ -0,0 +1,148 @@
+"""
+效能量測測試 - 大戶投資審核系統
+驗證直方圖統計、錯誤計數、停用時的開銷與 Prometheus 匯出
+"""
+
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+
+import instrumentation
+
+
+@instrumentation.instrument("test.work")
+def work(fail: bool = False, error_result: bool = False):
+    """測試用操作"""
+    if fail:
+        raise ValueError("失敗")
+    return {"error": "失敗"} if error_result else {"ok": True}
+
+
+def test_histogram():
+    """測試次數、錯誤（例外與 error 結果）與分位數"""
+    print("\n⏱️ 開始測試耗時統計...")
+    instrumentation.reset()
+    for _ in range(8):
+        work()
+    work(error_result=True)
+    try:
+        work(fail=True)
+    except ValueError:
+        pass
+    for seconds in (0.002, 0.002, 0.2):
+        instrumentation.observe("test.sleep", seconds)
+    rows = {row["operation"]: row for row in instrumentation.snapshot()}
+    print(f"📊 {rows}")
+    sleep = rows["test.sleep"]
+    assert rows["test.work"]["count"] == 10, "例外呼叫也應計次"
+    assert rows["test.work"]["errors"] == 2, "例外與 error 結果都應計為錯誤"
+    assert 1.0 <= sleep["p50_ms"] <= 2.5 and 100 <= sleep["p99_ms"] <= 200, f"分位數超出桶界: {sleep}"
+    assert sleep["max_ms"] == 200, "最大值應為實測值而非桶上界"
+    assert list(rows)[0] == "test.sleep", "快照應依總耗時由大到小排序"
+
+
+def test_disabled_overhead():
+    """測試停用時不記錄，且每次呼叫的額外開銷極小"""
+    print("\n🔕 開始測試停用開銷...")
+    instrumentation.reset()
+    calls = 200_000
+
+    def plain():
+        return None
+    wrapped = instrumentation.instrument("test.disabled")(plain)
+
+    instrumentation.set_enabled(False)
+    try:
+        started = time.perf_counter()
+        for _ in range(calls):
+            plain()
+        baseline = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(calls):
+            wrapped()
+        disabled = time.perf_counter() - started
+    finally:
+        instrumentation.set_enabled(True)
+    started = time.perf_counter()
+    for _ in range(calls):
+        wrapped()
+    enabled = time.perf_counter() - started
+
+    overhead_ns = (disabled - baseline) / calls * 1e9
+    print(f"📊 停用每次額外 {overhead_ns:.0f} ns，啟用每次額外 {(enabled - baseline) / calls * 1e9:.0f} ns")
+    assert instrumentation.snapshot()[0]["count"] == calls, "停用期間不應記錄"
+    assert overhead_ns < 1000, f"停用時每次額外開銷 {overhead_ns:.0f} ns 過高"
+
+
+def test_prometheus_export():
+    """測試 Prometheus 文字格式、檔案輸出與 /metrics 服務"""
+    print("\n📈 開始測試 Prometheus 匯出...")
+    instrumentation.reset()
+    instrumentation.observe('db."query"', 0.003)
+    instrumentation.observe('db."query"', 100.0, error=True)
+    instrumentation.increment("db.busy_retry", 2)
+    text = instrumentation.render_prometheus()
+    print(text[:400])
+
+    path = os.path.join(tempfile.mkdtemp(), "audit.prom")
+    instrumentation.write_prometheus(path)
+    with open(path, encoding="utf-8") as f:
+        written = f.read()
+
+    server = instrumentation.start_exporter(port=None)
+    exporter = instrumentation.start_exporter(port=0)
+    port = exporter.server_address[1]
+    try:
+        again = instrumentation.start_exporter(port=port)
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            served = response.read().decode("utf-8")
+            content_type = response.headers["Content-Type"]
+    finally:
+        instrumentation.stop_exporters()
+
+    label = 'operation="db.\\"query\\""'
+    assert server is None and exporter is not None and port > 0
+    assert again is exporter, "同一埠應重用已啟動的服務"
+    # 100 秒超出所有桶界，只能落在 +Inf
+    assert f'audit_operation_duration_seconds_bucket{{{label},le="0.005"}} 1' in text
+    assert f'audit_operation_duration_seconds_bucket{{{label},le="+Inf"}} 2' in text
+    assert f'audit_operation_duration_seconds_count{{{label}}} 2' in text
+    assert f'audit_operation_errors_total{{{label}}} 1' in text
+    assert 'audit_events_total{event="db.busy_retry"} 2' in text
+    assert written == text and served == text, "檔案輸出與 /metrics 內容應一致"
+    assert content_type.startswith("text/plain; version=0.0.4")
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("📈 效能量測測試")
+    print("=" * 60)
+
+    tests = [
+        ("⏱️ 耗時統計測試", test_histogram),
+        ("🔕 停用開銷測試", test_disabled_overhead),
+        ("📈 Prometheus 匯出測試", test_prometheus_export)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
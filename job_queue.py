@@ -0,0 +1,161 @@
+"""
+背景作業佇列 - 大戶投資審核系統
+作業保存於審核數據庫的 jobs 表，支援冪等鍵、失敗退避重試、進度回報與逾時回收
+完成、失敗與進度回報都以領取時的執行次數 attempt 作為租約，逾時被回收後原工作程序的更新一律捨棄
+"""
+
+import hashlib
+import json
+import time
+from typing import Dict, List, Optional
+
+import audit_db
+
+JOB_KINDS = ["risk_sweep", "compliance_sweep", "bulk_import", "llm_summary"]
+JOB_STATUSES = ["queued", "running", "done", "failed"]
+
+DEFAULT_MAX_ATTEMPTS = 3
+# 寫入審核記錄的作業以分段交易寫入，中途失敗重試會重複寫入已提交的段落，預設不重試
+MAX_ATTEMPTS_BY_KIND = {"risk_sweep": 1, "compliance_sweep": 1, "bulk_import": 1}
+RETRY_DELAY = 5.0
+# 執行中作業超過此秒數未回報心跳即視為工作程序中斷，重新排入佇列
+LEASE_SECONDS = 300
+
+JOB_COLUMNS = ["id", "kind", "payload", "idempotency_key", "status", "attempts", "max_attempts", "progress",
+               "message", "result", "error", "worker", "created_at", "run_after", "started_at",
+               "heartbeat_at", "finished_at"]
+
+
+def default_idempotency_key(kind: str, payload: Dict, day: Optional[str] = None) -> str:
+    """以作業類型、內容與日期產生冪等鍵（同一天重複送出視為同一作業）"""
+    canonical = json.dumps({"kind": kind, "payload": payload, "day": day or time.strftime("%Y-%m-%d")},
+                           ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def _to_job(row: tuple) -> Dict:
+    job = dict(zip(JOB_COLUMNS, row))
+    for name in ("payload", "result"):
+        job[name] = json.loads(job[name]) if job[name] else None
+    if job["started_at"] is not None:
+        job["elapsed_seconds"] = round((job["finished_at"] or time.time()) - job["started_at"], 3)
+    return job
+
+
+def enqueue(kind: str, payload: Optional[Dict] = None, idempotency_key: Optional[str] = None,
+            max_attempts: Optional[int] = None, db_path: Optional[str] = None) -> int:
+    """加入作業並回傳作業 id；冪等鍵已存在時回傳原作業 id
+
+    原作業已失敗時重新排入佇列並給予新一輪的執行次數，讓使用者可重新送出同一作業；執行次數不歸零，
+    先前被回收的工作程序以舊的 attempt 更新時仍會被捨棄。待執行、執行中與已完成的作業不變。
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"不支援的作業類型: {kind}")
+    payload = payload or {}
+    key = idempotency_key or default_idempotency_key(kind, payload)
+    attempts = max_attempts or MAX_ATTEMPTS_BY_KIND.get(kind, DEFAULT_MAX_ATTEMPTS)
+    now = time.time()
+
+    def insert(cursor):
+        cursor.execute('''
+            INSERT INTO jobs (kind, payload, idempotency_key, max_attempts, created_at, run_after)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(idempotency_key) DO UPDATE SET
+                status = 'queued', max_attempts = jobs.attempts + excluded.max_attempts, progress = 0,
+                message = NULL, result = NULL, error = NULL, worker = NULL, run_after = excluded.run_after,
+                started_at = NULL, heartbeat_at = NULL, finished_at = NULL
+            WHERE jobs.status = 'failed'
+        ''', (kind, json.dumps(payload, ensure_ascii=False), key, attempts, now, now))
+        return cursor.execute("SELECT id FROM jobs WHERE idempotency_key = ?", (key,)).fetchone()[0]
+
+    return audit_db.run_write(insert, db_path)
+
+
+def claim(worker: str, db_path: Optional[str] = None) -> Optional[Dict]:
+    """取出最早可執行的作業並標記為執行中（無作業時回傳 None）"""
+    now = time.time()
+    row = audit_db.run_write(lambda cursor: cursor.execute(f'''
+        UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, started_at = ?,
+                        heartbeat_at = ?, finished_at = NULL, progress = 0, message = NULL
+        WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND run_after <= ? ORDER BY id LIMIT 1)
+        RETURNING {', '.join(JOB_COLUMNS)}
+    ''', (worker, now, now, now)).fetchone(), db_path)
+    return _to_job(row) if row else None
+
+
+def _update_leased(sql: str, params: tuple, job_id: int, attempt: int, db_path: Optional[str]) -> bool:
+    """只在作業仍為本次領取（執行中且執行次數相符）時更新，回傳是否生效"""
+    return audit_db.run_write(lambda cursor: cursor.execute(
+        sql + " WHERE id = ? AND status = 'running' AND attempts = ?", params + (job_id, attempt)).rowcount == 1,
+        db_path)
+
+
+def report_progress(job_id: int, attempt: int, progress: float, message: Optional[str] = None,
+                    db_path: Optional[str] = None) -> bool:
+    """更新作業進度（0~1）並回報心跳，租約已失效時回傳 False"""
+    return _update_leased("UPDATE jobs SET progress = ?, message = COALESCE(?, message), heartbeat_at = ?",
+                          (min(max(progress, 0.0), 1.0), message, time.time()), job_id, attempt, db_path)
+
+
+def heartbeat(job_id: int, attempt: int, db_path: Optional[str] = None) -> bool:
+    """回報作業仍在執行，租約已失效時回傳 False"""
+    return _update_leased("UPDATE jobs SET heartbeat_at = ?", (time.time(),), job_id, attempt, db_path)
+
+
+def complete(job_id: int, attempt: int, result: Optional[Dict] = None, db_path: Optional[str] = None) -> bool:
+    """標記作業完成並保存結果；租約已失效（已逾時回收或由其他工作程序接手）時捨棄結果並回傳 False"""
+    return _update_leased("UPDATE jobs SET status = 'done', progress = 1, result = ?, error = NULL, finished_at = ?",
+                          (json.dumps(result, ensure_ascii=False, default=str), time.time()),
+                          job_id, attempt, db_path)
+
+
+def fail(job_id: int, attempt: int, error: str, db_path: Optional[str] = None) -> str:
+    """記錄作業失敗；尚有重試次數時以指數退避重新排入佇列，回傳新狀態（租約已失效時不變更，回傳目前狀態）"""
+    now = time.time()
+
+    def update(cursor):
+        status, attempts, max_attempts = cursor.execute(
+            "SELECT status, attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if status != "running" or attempts != attempt:
+            return status
+        if attempts < max_attempts:
+            cursor.execute("UPDATE jobs SET status = 'queued', error = ?, run_after = ? WHERE id = ?",
+                           (error, now + RETRY_DELAY * 2 ** (attempts - 1), job_id))
+            return "queued"
+        cursor.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                       (error, now, job_id))
+        return "failed"
+
+    return audit_db.run_write(update, db_path)
+
+
+def requeue_stale(lease_seconds: float = LEASE_SECONDS, db_path: Optional[str] = None) -> int:
+    """將心跳逾時的執行中作業重新排入佇列（已用盡重試次數者標記失敗），回傳處理筆數"""
+    stale = audit_db.query("SELECT id, attempts FROM jobs WHERE status = 'running' AND heartbeat_at < ?",
+                           (time.time() - lease_seconds,), db_path)
+    for job_id, attempt in stale:
+        fail(job_id, attempt, "工作程序逾時未回報", db_path)
+    return len(stale)
+
+
+def get_job(job_id: int, db_path: Optional[str] = None) -> Optional[Dict]:
+    """讀取單一作業"""
+    row = audit_db.query_one(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,), db_path)
+    return _to_job(row) if row else None
+
+
+def list_jobs(limit: int = 20, status: Optional[str] = None, db_path: Optional[str] = None) -> List[Dict]:
+    """列出最近的作業（新到舊）"""
+    sql = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+    params: list = []
+    if status:
+        sql += " WHERE status = ?"
+        params.append(status)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    return [_to_job(row) for row in audit_db.query(sql, params, db_path)]
+
+
+def pending_count(db_path: Optional[str] = None) -> int:
+    """尚未結束（排隊或執行中）的作業數"""
+    return audit_db.query_one("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')", (), db_path)[0]
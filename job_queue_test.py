@@ -0,0 +1,207 @@
+"""
+背景作業佇列測試 - 大戶投資審核系統
+驗證冪等鍵、失敗重試、逾時回收與工作程序執行全體掃描
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import audit_db
+import audit_ingest
+import job_queue
+import job_worker
+
+
+def new_database() -> str:
+    """建立暫存審核數據庫"""
+    db_path = os.path.join(tempfile.mkdtemp(), "audit.db")
+    audit_db.init_schema(db_path)
+    return db_path
+
+
+def test_idempotent_enqueue():
+    """測試相同冪等鍵只建立一筆作業，已失敗的作業再次送出時重新排入佇列"""
+    print("\n🔑 開始測試冪等鍵...")
+    db_path = new_database()
+    first = job_queue.enqueue("risk_sweep", {"values": "a.parquet"}, db_path=db_path)
+    second = job_queue.enqueue("risk_sweep", {"values": "a.parquet"}, db_path=db_path)
+    other = job_queue.enqueue("risk_sweep", {"values": "a.parquet"}, idempotency_key="Q3", db_path=db_path)
+    print(f"📊 作業 id: {first}, {second}, {other}")
+    assert first == second, "相同種類與參數應回傳同一作業"
+    assert other != first, "不同冪等鍵應建立新作業"
+    assert len(job_queue.list_jobs(db_path=db_path)) == 2
+    # 寫入審核記錄的作業預設不重試，避免重複寫入；其餘作業沿用預設重試次數
+    summary = job_queue.enqueue("llm_summary", {"investor_ids": ["INV001"]}, db_path=db_path)
+    assert job_queue.get_job(first, db_path)["max_attempts"] == 1, "寫入審核記錄的作業不應自動重試"
+    assert job_queue.get_job(summary, db_path)["max_attempts"] == job_queue.DEFAULT_MAX_ATTEMPTS
+
+    job = job_queue.claim("test", db_path)
+    assert job_queue.fail(job["id"], job["attempts"], "boom", db_path) == "failed"
+    again = job_queue.enqueue("risk_sweep", {"values": "a.parquet"}, db_path=db_path)
+    retried = job_queue.get_job(first, db_path)
+    assert again == first and retried["status"] == "queued" and retried["error"] is None, \
+        "同日已失敗的作業再次送出時應重新排入佇列"
+    job = job_queue.claim("test", db_path)
+    assert job["id"] == first and job["attempts"] == 2, "重新送出後執行次數應接續，不可重用前一輪的 attempt"
+    assert not job_queue.complete(first, 1, db_path=db_path), "前一輪工作程序的完成更新應被捨棄"
+    assert job_queue.complete(first, job["attempts"], {"ok": True}, db_path)
+    job_queue.enqueue("risk_sweep", {"values": "a.parquet"}, db_path=db_path)
+    assert job_queue.get_job(first, db_path)["status"] == "done", "已完成的作業不應重新排入佇列"
+
+
+def test_retry_and_stale():
+    """測試失敗退避重試、用盡次數後失敗，以及心跳逾時回收"""
+    print("\n🔁 開始測試重試與逾時回收...")
+    db_path = new_database()
+    job_id = job_queue.enqueue("risk_sweep", {"values": "missing.parquet"}, max_attempts=2, db_path=db_path)
+
+    job = job_queue.claim("test", db_path)
+    retried = job_queue.fail(job["id"], job["attempts"], "boom", db_path)
+    not_ready = job_queue.claim("test", db_path)
+    audit_db.execute_write("UPDATE jobs SET run_after = 0 WHERE id = ?", (job_id,), db_path)
+    job = job_queue.claim("test", db_path)
+    failed = job_queue.fail(job["id"], job["attempts"], "boom", db_path)
+
+    stale_id = job_queue.enqueue("bulk_import", {"source": "x.csv"}, max_attempts=2, db_path=db_path)
+    job_queue.claim("crashed", db_path)
+    audit_db.execute_write("UPDATE jobs SET heartbeat_at = 0 WHERE id = ?", (stale_id,), db_path)
+    recovered = job_queue.requeue_stale(db_path=db_path)
+
+    print(f"📊 第一次失敗: {retried}，第二次失敗: {failed}，逾時回收 {recovered} 筆")
+    assert retried == "queued", "未用盡次數時應重新排入佇列"
+    assert not_ready is None, "退避期間不應被領取"
+    assert failed == "failed" and job_queue.get_job(job_id, db_path)["attempts"] == 2
+    assert recovered == 1 and job_queue.get_job(stale_id, db_path)["status"] == "queued", "心跳逾時的作業未被回收"
+
+
+def test_stale_worker_discarded():
+    """測試逾時被回收後，原工作程序的進度、完成與失敗更新都不影響新一輪執行"""
+    print("\n🔒 開始測試租約失效...")
+    db_path = new_database()
+    job_id = job_queue.enqueue("llm_summary", {"investor_ids": ["INV001"]}, db_path=db_path)
+    stale = job_queue.claim("slow", db_path)
+    audit_db.execute_write("UPDATE jobs SET heartbeat_at = 0 WHERE id = ?", (job_id,), db_path)
+    job_queue.requeue_stale(db_path=db_path)
+    audit_db.execute_write("UPDATE jobs SET run_after = 0 WHERE id = ?", (job_id,), db_path)
+    current = job_queue.claim("fresh", db_path)
+
+    stale_progress = job_queue.report_progress(job_id, stale["attempts"], 0.9, "舊進度", db_path)
+    stale_beat = job_queue.heartbeat(job_id, stale["attempts"], db_path)
+    stale_done = job_queue.complete(job_id, stale["attempts"], {"summaries": "舊結果"}, db_path)
+    stale_fail = job_queue.fail(job_id, stale["attempts"], "舊錯誤", db_path)
+    job = job_queue.get_job(job_id, db_path)
+    print(f"📊 舊租約更新: 進度 {stale_progress}，心跳 {stale_beat}，完成 {stale_done}，失敗 {stale_fail}")
+    assert current["attempts"] == stale["attempts"] + 1
+    assert not stale_progress and not stale_beat and not stale_done, "舊租約的更新應被捨棄"
+    assert stale_fail == "running", "舊租約回報失敗不應改變新一輪執行的狀態"
+    assert job["status"] == "running" and job["worker"] == "fresh" and job["progress"] == 0
+    assert job["result"] is None and job["message"] is None
+
+    assert job_queue.report_progress(job_id, current["attempts"], 0.5, "新進度", db_path)
+    assert job_queue.complete(job_id, current["attempts"], {"summaries": "新結果"}, db_path)
+    assert not job_queue.complete(job_id, current["attempts"], {"summaries": "重複"}, db_path), "已完成的作業不應再被覆寫"
+    assert job_queue.get_job(job_id, db_path)["result"] == {"summaries": "新結果"}
+
+
+class RecordingContext:
+    """記錄進度回報的作業執行環境（不經過資料庫與節流）"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.reports = []
+
+    def progress(self, fraction: float, message=None):
+        self.reports.append((fraction, message))
+
+
+def test_bulk_import_progress():
+    """測試批次匯入依預估列數回報遞增進度，且 CSV 與 Parquet 列數估計正確"""
+    print("\n📥 開始測試批次匯入進度...")
+    db_path = new_database()
+    root = os.path.dirname(db_path)
+    n = 1200
+    records = pd.DataFrame({"investor_id": [f"B{i:04d}" for i in range(n)], "audit_type": "例行審核",
+                            "risk_level": "中", "portfolio_value": 6e7})
+    csv_path, parquet_path = os.path.join(root, "import.csv"), os.path.join(root, "import.parquet")
+    records.to_csv(csv_path, index=False)
+    records.to_parquet(parquet_path)
+    no_trailing_newline = os.path.join(root, "short.csv")
+    with open(no_trailing_newline, "w", encoding="utf-8") as f:
+        f.write("investor_id,portfolio_value\nA,1\nB,2")
+
+    context = RecordingContext(db_path)
+    result = job_worker.bulk_import({"source": csv_path, "batch_size": 500}, context)
+    fractions = [fraction for fraction, _ in context.reports]
+    print(f"📊 進度 {context.reports}")
+    assert audit_ingest.count_rows(csv_path) == n and audit_ingest.count_rows(parquet_path) == n
+    assert audit_ingest.count_rows(no_trailing_newline) == 2, "最後一列沒有換行也應計入"
+    assert result["inserted"] == n
+    assert fractions == sorted(fractions) and 0 < fractions[0] < 1, "進度應遞增且不為 0"
+    assert fractions[-1] == 1 and context.reports[-1][1] == f"已寫入 {n}/{n} 筆"
+
+
+def test_worker_sweep():
+    """測試工作程序以程序池完成全體合規掃描並記錄進度與耗時"""
+    print("\n🛠️ 開始測試工作程序...")
+    db_path = new_database()
+    root = os.path.dirname(db_path)
+    n, days = 2000, 30
+    rng = np.random.default_rng(7)
+    ids = np.array([f"W{i:05d}" for i in range(n)])
+    values = 1e7 * np.cumprod(1 + rng.normal(0, rng.uniform(0.002, 0.05, n)[:, None], (n, days)), axis=1)
+    pd.DataFrame({"investor_id": np.repeat(ids, days), "date": np.tile(pd.bdate_range("2024-07-01", periods=days), n),
+                  "current_value": values.ravel()}).to_parquet(os.path.join(root, "values.parquet"))
+    pd.DataFrame({"investor_id": ids, "portfolio_value": values[:, -1],
+                  "days_since_last_audit": rng.integers(1, 400, n)}).to_csv(os.path.join(root, "snapshot.csv"), index=False)
+
+    job_id = job_queue.enqueue("compliance_sweep", {"source": os.path.join(root, "snapshot.csv"),
+                                                    "values": os.path.join(root, "values.parquet"),
+                                                    "chunk_size": 500}, db_path=db_path)
+    started = time.perf_counter()
+    job_worker.run_worker(db_path, processes=2, poll_interval=0.1, drain=True)
+    job = job_queue.get_job(job_id, db_path)
+    count = audit_db.query_one("SELECT COUNT(*) FROM audit_records WHERE audit_type = '合規檢查'", (), db_path)[0]
+    print(f"📊 狀態 {job['status']}，寫入 {count} 筆，作業耗時 {job['elapsed_seconds']} 秒，"
+          f"總耗時 {time.perf_counter() - started:.2f} 秒")
+    assert job["status"] == "done" and job["progress"] == 1, f"作業未完成: {job['status']} {job['progress']}"
+    assert count == n and job["result"]["inserted"] == n, f"寫入 {count} 筆，預期 {n} 筆"
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("📦 背景作業佇列測試")
+    print("=" * 60)
+
+    tests = [
+        ("🔑 冪等鍵測試", test_idempotent_enqueue),
+        ("🔁 重試與逾時回收測試", test_retry_and_stale),
+        ("🔒 租約失效測試", test_stale_worker_discarded),
+        ("📥 批次匯入進度測試", test_bulk_import_progress),
+        ("🛠️ 工作程序測試", test_worker_sweep)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+背景作業工作程序 - 大戶投資審核系統
+由 jobs 表取出作業執行：全體風險與合規掃描、FinGPT 摘要與批次匯入，運算密集的部分交給程序池
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import audit_db
+import instrumentation
+import job_queue
+from audit_ingest import count_rows, create_audit_records_bulk
+from risk_engine import calculate_risk_metrics_batch
+
+POLL_INTERVAL = 1.0
+RISK_CHUNK_SIZE = 5000
+PROGRESS_INTERVAL = 0.5
+HEARTBEAT_INTERVAL = job_queue.LEASE_SECONDS / 5
+
+# 作業類型 -> 處理函式 (payload, context) -> 結果 dict
+JOB_HANDLERS: Dict[str, Callable[[Dict, "JobContext"], Dict]] = {}
+
+
+def register_job(kind: str):
+    """註冊作業處理函式"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+class JobContext:
+    """作業執行環境：程序池、資料庫路徑與節流的進度回報"""
+
+    def __init__(self, job: Dict, pool: ProcessPoolExecutor, db_path: Optional[str] = None):
+        self.job = job
+        self.pool = pool
+        self.db_path = db_path
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def progress(self, fraction: float, message: Optional[str] = None):
+        """回報進度（每 PROGRESS_INTERVAL 秒最多寫入一次，完成時必定寫入）"""
+        now = time.monotonic()
+        with self._lock:
+            if fraction < 1 and now - self._last_report < PROGRESS_INTERVAL:
+                return
+            self._last_report = now
+        job_queue.report_progress(self.job["id"], self.job["attempts"], fraction, message, self.db_path)
+
+
+def _read_table(path: str) -> pd.DataFrame:
+    """讀取 CSV 或 Parquet"""
+    if path.lower().endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, dtype={"investor_id": str})
+
+
+def _risk_chunk(values: pd.DataFrame) -> pd.DataFrame:
+    """於子程序計算一段投資者的風險指標"""
+    metrics = calculate_risk_metrics_batch(values)
+    # 時間序列下總市值取最新一日
+    metrics["total_value"] = values.groupby("investor_id", sort=False)["current_value"].last()
+    return metrics
+
+
+def risk_metrics_parallel(values: pd.DataFrame, context: JobContext, chunk_size: int = RISK_CHUNK_SIZE,
+                          weight: float = 1.0) -> pd.DataFrame:
+    """依投資者切段，以程序池平行計算風險指標（長格式：investor_id, date, current_value）"""
+    values = values.sort_values(["investor_id", "date"], kind="mergesort")
+    investor_ids = values["investor_id"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, investor_ids[1:] != investor_ids[:-1]])
+    bounds = list(starts[::chunk_size]) + [len(values)]
+    futures = [context.pool.submit(_risk_chunk, values.iloc[start:end])
+               for start, end in zip(bounds[:-1], bounds[1:])]
+    results = []
+    for done, future in enumerate(as_completed(futures), start=1):
+        results.append(future.result())
+        context.progress(weight * done / len(futures), f"風險計算 {done}/{len(futures)} 段")
+    if not results:
+        return pd.DataFrame()
+    return pd.concat(results)
+
+
+def _import_progress(context: JobContext, total: int, start: float, weight: float):
+    def report(rows: int):
+        context.progress(start + weight * rows / max(total, 1), f"已寫入 {rows}/{total} 筆")
+    return report
+
+
+def _import_error(result: Dict) -> str:
+    """匯入錯誤訊息附上已寫入筆數與失敗批次的起始列（bulk_import 可於 payload 以 start_row 接續）"""
+    return f"{result['error']}（已寫入 {result['inserted']} 筆，自第 {result['failed_offset']} 列起未寫入）"
+
+
+def _write_audits(records: pd.DataFrame, context: JobContext, auditor: str, start: float) -> Dict:
+    result = create_audit_records_bulk(records, auditor=auditor, db_path=context.db_path,
+                                       progress=_import_progress(context, len(records), start, 1 - start))
+    if "error" in result:
+        raise RuntimeError(_import_error(result))
+    return result
+
+
+@register_job("risk_sweep")
+def risk_sweep(payload: Dict, context: JobContext) -> Dict:
+    """全體風險掃描：由市值時間序列計算風險等級並寫入「風險評估」審核記錄"""
+    values = _read_table(payload["values"])
+    metrics = risk_metrics_parallel(values, context, payload.get("chunk_size", RISK_CHUNK_SIZE), weight=0.5)
+    records = pd.DataFrame({
+        "investor_id": metrics.index.astype(str),
+        "audit_type": "風險評估",
+        "risk_level": metrics["risk_level"].to_numpy(),
+        "portfolio_value": metrics["total_value"].to_numpy(),
+    })
+    result = _write_audits(records, context, payload.get("auditor", "風險掃描"), 0.5)
+    result["risk_distribution"] = metrics["risk_level"].value_counts().to_dict()
+    return result
+
+
+@register_job("compliance_sweep")
+def compliance_sweep(payload: Dict, context: JobContext) -> Dict:
+    """全體合規掃描（季度審核）：以投資者快照評估合規規則，可同時由市值序列更新風險等級"""
+    snapshot = _read_table(payload["source"])
+    start = 0.0
+    if payload.get("values"):
+        metrics = risk_metrics_parallel(_read_table(payload["values"]), context,
+                                        payload.get("chunk_size", RISK_CHUNK_SIZE), weight=0.4)
+        risk_level = snapshot["investor_id"].astype(str).map(metrics["risk_level"])
+        if "risk_level" in snapshot:
+            risk_level = risk_level.fillna(snapshot["risk_level"])
+        snapshot = snapshot.assign(risk_level=risk_level)
+        start = 0.4
+    snapshot = snapshot.assign(audit_type=payload.get("audit_type", "合規檢查"))
+    return _write_audits(snapshot, context, payload.get("auditor", "季度審核"), start)
+
+
+@register_job("bulk_import")
+def bulk_import(payload: Dict, context: JobContext) -> Dict:
+    """批次匯入審核記錄檔（進度以預先估計的檔案列數計算，start_row 可接續先前失敗的匯入）"""
+    total = count_rows(payload["source"])
+    result = create_audit_records_bulk(payload["source"], batch_size=payload.get("batch_size", 5000),
+                                       auditor=payload.get("auditor", "批次匯入"), db_path=context.db_path,
+                                       progress=_import_progress(context, total, 0.0, 1.0),
+                                       start_row=payload.get("start_row", 0))
+    if "error" in result:
+        raise RuntimeError(_import_error(result))
+    return result
+
+
+@register_job("llm_summary")
+def llm_summary(payload: Dict, context: JobContext) -> Dict:
+    """以 FinGPT 為多位投資者產生審核摘要（併發數有上限）"""
+    from fingpt_client import ANALYST_PROMPT, FinGPTClient
+    from llm_cache import ResponseCache
+    from prompt_context import build_context, with_context
+
+    client = FinGPTClient(cache=ResponseCache())
+    investor_ids: List[str] = list(dict.fromkeys(payload["investor_ids"]))
+
+    def summarize(investor_id: str) -> str:
+        question = f"請以三點摘要投資者 {investor_id} 的審核紀錄與風險狀況，並提出後續建議"
+        # 作業由審核人員指定投資者送出，摘要需要審核發現與建議
+        built = build_context(question, investor_id=investor_id, db_path=context.db_path, redact=False)
+        messages = [{"role": "system", "content": with_context(ANALYST_PROMPT, built)},
+                    {"role": "user", "content": question}]
+        return client.complete(messages, max_tokens=400, temperature=0.3, prompt_class="risk_assessment")
+
+    summaries, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=payload.get("max_concurrency", 4)) as executor:
+        futures = {executor.submit(summarize, investor_id): investor_id for investor_id in investor_ids}
+        for done, future in enumerate(as_completed(futures), start=1):
+            investor_id = futures[future]
+            try:
+                summaries[investor_id] = future.result()
+            except Exception as e:
+                errors[investor_id] = str(e)
+            context.progress(done / len(futures), f"已摘要 {done}/{len(futures)} 位")
+    if investor_ids and not summaries:
+        raise RuntimeError(f"全部摘要失敗: {next(iter(errors.values()))}")
+    return {"summaries": summaries, "errors": errors}
+
+
+def run_job(job: Dict, pool: ProcessPoolExecutor, db_path: Optional[str] = None) -> str:
+    """執行單一作業並記錄結果，回傳最終狀態；執行期間定期回報心跳"""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            job_queue.heartbeat(job["id"], job["attempts"], db_path)
+
+    threading.Thread(target=beat, daemon=True).start()
+    try:
+        handler = JOB_HANDLERS.get(job["kind"])
+        if handler is None:
+            raise ValueError(f"沒有對應的處理函式: {job['kind']}")
+        started = time.perf_counter()
+        with instrumentation.timer(f"job.{job['kind']}"):
+            result = handler(job["payload"] or {}, JobContext(job, pool, db_path))
+        result["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        if not job_queue.complete(job["id"], job["attempts"], result, db_path):
+            current = job_queue.get_job(job["id"], db_path)
+            print(f"⚠️ 作業 {job['id']} 第 {job['attempts']} 次執行的租約已失效，捨棄結果")
+            return current["status"] if current else "failed"
+        return "done"
+    except Exception as e:
+        return job_queue.fail(job["id"], job["attempts"], f"{type(e).__name__}: {e}", db_path)
+    finally:
+        stop.set()
+
+
+def run_worker(db_path: Optional[str] = None, processes: Optional[int] = None, max_jobs: int = 2,
+               poll_interval: float = POLL_INTERVAL, drain: bool = False, worker_id: Optional[str] = None):
+    """工作程序主迴圈：同時最多執行 max_jobs 個作業，drain=True 時佇列清空即結束"""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    audit_db.init_schema(db_path)
+    # 以 spawn 建立子程序，避免 fork 複製資料庫連線與執行緒狀態
+    pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn"))
+    runners = ThreadPoolExecutor(max_jobs)
+    running: List[Future] = []
+    try:
+        while True:
+            job_queue.requeue_stale(db_path=db_path)
+            running = [future for future in running if not future.done()]
+            while len(running) < max_jobs:
+                job = job_queue.claim(worker_id, db_path)
+                if job is None:
+                    break
+                print(f"▶️ 作業 {job['id']} ({job['kind']}) 第 {job['attempts']} 次執行")
+                running.append(runners.submit(run_job, job, pool, db_path))
+            if drain and not running and job_queue.pending_count(db_path) == 0:
+                break
+            if running:
+                wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(poll_interval)
+    finally:
+        runners.shutdown(wait=True)
+        pool.shutdown(wait=True)
+
+
+def main():
+    """啟動工作程序或加入作業"""
+    parser = argparse.ArgumentParser(description="背景作業工作程序")
+    parser.add_argument("--db", default=None, help="審核數據庫路徑（預設 investment_audit.db）")
+    parser.add_argument("--processes", type=int, default=None, help="程序池大小（預設 CPU 數）")
+    parser.add_argument("--max-jobs", type=int, default=2, help="同時執行的作業數")
+    parser.add_argument("--drain", action="store_true", help="佇列清空後結束")
+    parser.add_argument("--enqueue", choices=job_queue.JOB_KINDS, help="加入作業後結束")
+    parser.add_argument("--payload", default="{}", help="作業內容 JSON")
+    parser.add_argument("--key", default=None, help="冪等鍵")
+    parser.add_argument("--metrics-port", type=int, default=instrumentation.EXPORT_PORT,
+                        help="於本機此埠提供 Prometheus /metrics（0 為不啟動）")
+    args = parser.parse_args()
+
+    if args.enqueue:
+        audit_db.init_schema(args.db)
+        job_id = job_queue.enqueue(args.enqueue, json.loads(args.payload), args.key, db_path=args.db)
+        print(f"📥 已加入作業 {job_id}")
+        return
+
+    print(f"🛠️ 工作程序啟動（程序池 {args.processes or os.cpu_count()}，同時 {args.max_jobs} 個作業）")
+    exporter = instrumentation.start_exporter(args.metrics_port or None)
+    if exporter is not None:
+        print(f"📈 效能指標：http://{instrumentation.EXPORT_HOST}:{exporter.server_address[1]}/metrics")
+    try:
+        run_worker(args.db, args.processes, args.max_jobs, drain=args.drain)
+    except KeyboardInterrupt:
+        print("\n⏹️ 工作程序停止，執行中的作業將於租約逾時後重新排入佇列")
+
+
+if __name__ == "__main__":
+    main()
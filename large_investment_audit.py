@@ -4,15 +4,46 @@
 """
 
 import streamlit as st
-import pandas as pd
-from datetime import datetime, timedelta
-import json
+from datetime import datetime
+import html
 import sys
 import os
 import io
-import requests
-from typing import Dict, List, Optional
-import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Optional
+
+# pandas、行情與風險引擎等重型函式庫只在使用的頁面或函式內載入，首次渲染不需等待
+import audit_core
+import audit_db
+import audit_partitions
+import audit_queries
+import audit_search
+import audit_summary
+import instrumentation
+import job_queue
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# 本次重新執行的起點與各區段耗時（秒）
+RERUN_STARTED = time.perf_counter()
+RERUN_TIMINGS: Dict[str, float] = {}
+
+# 查詢結果快取秒數（其他程序寫入時的最長延遲）
+QUERY_CACHE_TTL = 60
+
+@contextmanager
+def timed_section(name: str):
+    """記錄區段耗時，供重新執行耗時面板顯示"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        RERUN_TIMINGS[name] = RERUN_TIMINGS.get(name, 0.0) + elapsed
+        instrumentation.observe(f"ui.{name}", elapsed)
 
 # 解決 Windows 編碼問題
 if sys.platform == 'win32':
@@ -27,6 +58,7 @@ st.set_page_config(
 )
 
 # 大戶審核深色主題 CSS
+CSS_STARTED = time.perf_counter()
 st.markdown("""
 <style>
 /* 大戶審核深色主題 */
@@ -138,6 +170,14 @@ st.markdown("""
     color: #ffffff;
 }
 
+/* 搜尋結果關鍵字 */
+.audit-report mark {
+    background: #ff6b35;
+    color: #1a1a1a;
+    padding: 0 2px;
+    border-radius: 3px;
+}
+
 /* 警告狀態 */
 .warning-status {
     background: linear-gradient(135deg, #cc0000 0%, #990000 100%);
@@ -154,6 +194,7 @@ st.markdown("""
 }
 </style>
 """, unsafe_allow_html=True)
+RERUN_TIMINGS["CSS 樣式"] = time.perf_counter() - CSS_STARTED
 
 # 頂部標題
 st.markdown('<div class="audit-card">', unsafe_allow_html=True)
@@ -161,150 +202,72 @@ st.markdown('<h1 style="color: #ff6b35; text-align: center;">🏛 大戶投資
 st.markdown('<h2 style="color: #ff6b35; text-align: center;">Google 開發計畫整合 v2.8</h2>', unsafe_allow_html=True)
 st.markdown('</div>', unsafe_allow_html=True)
 
-# 初始化審核數據庫
+# 初始化審核數據庫（每個程序只執行一次結構建立與遷移）
+@st.cache_resource
+def audit_database(db_path: str) -> str:
+    """建立資料表並回傳資料庫路徑；失敗時拋出例外，不會被快取"""
+    audit_db.init_schema(db_path)
+    return db_path
+
+@st.cache_resource
+def metrics_exporter(port: int):
+    """啟動 Prometheus /metrics 服務（每個程序一次）"""
+    return instrumentation.start_exporter(port)
+
 def init_audit_database():
     """初始化審核數據庫"""
     try:
-        conn = sqlite3.connect('investment_audit.db')
-        cursor = conn.cursor()
-        
-        # 創建審核記錄表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS audit_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                investor_id TEXT,
-                audit_type TEXT,
-                risk_level TEXT,
-                portfolio_value REAL,
-                compliance_score INTEGER,
-                findings TEXT,
-                recommendations TEXT,
-                auditor TEXT
-            )
-        ''')
-        
-        # 創建投資者表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS investors (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                investor_id TEXT UNIQUE,
-                name TEXT,
-                registration_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-                risk_profile TEXT,
-                max_investment REAL,
-                status TEXT DEFAULT 'active'
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        audit_database(audit_db.DB_PATH)
         return True
     except Exception as e:
         st.error(f"數據庫初始化失敗: {e}")
         return False
 
+@st.cache_data(ttl=QUERY_CACHE_TTL, show_spinner=False)
+def cached_audit_page(investor_id: Optional[str], audit_date, audit_type: Optional[str], cursor) -> Dict:
+    """快取的審核記錄分頁查詢"""
+    return audit_queries.query_audit_records(investor_id=investor_id, audit_date=audit_date,
+                                             audit_type=audit_type, cursor=cursor)
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, show_spinner=False)
+def cached_dashboard_summary() -> Dict:
+    """快取的合規儀表板彙總"""
+    return audit_summary.get_dashboard_summary()
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, show_spinner=False)
+def cached_indicator_snapshot(tickers: tuple) -> "pd.DataFrame":
+    """快取的技術指標快照"""
+    import indicators
+    return indicators.indicator_snapshot(tickers)
+
+def invalidate_query_cache():
+    """審核記錄寫入後清除查詢快取"""
+    cached_audit_page.clear()
+    cached_dashboard_summary.clear()
+
 def create_audit_record(investor_id: str, audit_type: str, risk_level: str, 
                      portfolio_value: float, compliance_score: int, 
-                     findings: str, recommendations: str, auditor: str):
+                     findings: str, recommendations: str, auditor: str,
+                     tail_var: Optional[float] = None, tail_cvar: Optional[float] = None):
     """創建審核記錄"""
-    try:
-        conn = sqlite3.connect('investment_audit.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO audit_records 
-            (investor_id, audit_type, risk_level, portfolio_value, compliance_score, findings, recommendations, auditor)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (investor_id, audit_type, risk_level, portfolio_value, compliance_score, findings, recommendations, auditor))
-        
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        st.error(f"創建審核記錄失敗: {e}")
+    result = audit_core.create_audit_record(investor_id, audit_type, risk_level, portfolio_value, compliance_score,
+                                            findings, recommendations, auditor, tail_var, tail_cvar)
+    if "error" in result:
+        st.error(f"創建審核記錄失敗: {result['error']}")
         return False
+    invalidate_query_cache()
+    return True
 
-def calculate_risk_metrics(portfolio_data: pd.DataFrame) -> Dict:
-    """計算風險指標"""
-    try:
-        if portfolio_data.empty:
-            return {"risk_score": 0, "risk_level": "低", "volatility": 0}
-        
-        # 計算基本指標
-        total_value = portfolio_data['current_value'].sum()
-        weights = portfolio_data['current_value'] / total_value
-        
-        # 模擬波動率計算（簡化版）
-        returns = portfolio_data['current_value'].pct_change().dropna()
-        volatility = returns.std() * (252 ** 0.5) if len(returns) > 0 else 0
-        
-        # 計算夏普比率（假設無風險利率 2%）
-        risk_free_rate = 0.02
-        excess_returns = returns.mean() - risk_free_rate / 252
-        sharpe_ratio = excess_returns / volatility if volatility > 0 else 0
-        
-        # 最大回撤
-        cumulative_returns = (1 + returns).cumprod()
-        rolling_max = cumulative_returns.expanding().max()
-        drawdown = (cumulative_returns - rolling_max) / rolling_max
-        max_drawdown = drawdown.min()
-        
-        # 風險評分
-        risk_score = min(100, max(0, 
-            (volatility * 50) + 
-            (abs(max_drawdown) * 100) + 
-            (100 - sharpe_ratio * 10)
-        ))
-        
-        # 風險等級
-        if risk_score >= 70:
-            risk_level = "高"
-        elif risk_score >= 40:
-            risk_level = "中"
-        else:
-            risk_level = "低"
-        
-        return {
-            "risk_score": risk_score,
-            "risk_level": risk_level,
-            "volatility": volatility,
-            "sharpe_ratio": sharpe_ratio,
-            "max_drawdown": max_drawdown,
-            "total_value": total_value
-        }
-    except Exception as e:
-        return {"error": str(e)}
-
-def generate_compliance_check(portfolio_value: float) -> Dict:
-    """生成合規檢查"""
-    try:
-        # 大戶投資合規檢查項目
-        compliance_items = {
-            "投資者適當性": portfolio_value <= 10000000,  # 1000萬上限
-            "分散投資": True,  # 假設已符合
-            "風險揭露": True,  # 假設已符合
-            "交易記錄": True,  # 假設已符合
-            "定期審核": True   # 假設已符合
-        }
-        
-        compliance_score = sum(compliance_items.values()) / len(compliance_items) * 100
-        
-        findings = []
-        recommendations = []
-        
-        if not compliance_items["投資者適當性"]:
-            findings.append("投資金額超過大戶定義上限")
-            recommendations.append("建議降低投資金額或取得大戶投資者資格")
-        
-        return {
-            "compliance_score": compliance_score,
-            "findings": findings,
-            "recommendations": recommendations,
-            "details": compliance_items
-        }
-    except Exception as e:
-        return {"error": str(e)}
+def show_tail_risk(tail: Dict):
+    """顯示三種方法的 VaR / CVaR"""
+    import pandas as pd
+    methods = {"historical": "歷史模擬", "parametric": "參數法", "monte_carlo": "蒙地卡羅"}
+    st.dataframe(pd.DataFrame({
+        '方法': list(methods.values()),
+        'VaR': [f"{tail[f'{method}_var']:.2%}" for method in methods],
+        'CVaR': [f"{tail[f'{method}_cvar']:.2%}" for method in methods],
+        'VaR 金額': [f"{tail[f'{method}_var_amount']:,.0f}" for method in methods],
+    }), use_container_width=True, hide_index=True)
 
 def show_audit_interface():
     """顯示審核介面"""
@@ -318,11 +281,14 @@ def show_audit_interface():
         
         with col1:
             investor_id = st.text_input("投資者 ID", key="investor_id")
-            audit_type = st.selectbox("審核類型", ["例行審核", "特別審核", "風險評估", "合規檢查"], key="audit_type")
+            audit_type = st.selectbox("審核類型", audit_db.AUDIT_TYPES, key="audit_type")
         
         with col2:
             portfolio_value = st.number_input("投資組合價值", min_value=0.0, step=10000.0, format="%.0f", key="portfolio_value")
-            risk_level = st.selectbox("風險等級", ["低", "中", "高"], key="risk_level")
+            risk_level = st.selectbox("風險等級", audit_db.RISK_LEVELS, key="risk_level")
+        
+        # 持股明細（選填）：以行情快取計算 VaR / CVaR 並納入風險等級
+        holdings_text = st.text_area("持股明細（選填，每行：代號, 股數）", height=100, key="holdings")
         
         # 審核發現和建議
         findings = st.text_area("審核發現", height=100, key="findings")
@@ -332,14 +298,30 @@ def show_audit_interface():
         submitted = st.form_submit_button("🔍 創建審核記錄", use_container_width=True)
         
         if submitted:
+            tail_var = tail_cvar = None
+            holdings = audit_core.parse_holdings(holdings_text)
+            if holdings:
+                tail = audit_core.calculate_tail_risk(holdings)
+                if "error" in tail:
+                    st.warning(f"⚠️ 尾端風險計算失敗: {tail['error']}")
+                else:
+                    from tail_risk import TAIL_RISK_COLUMNS, combine_risk_levels
+                    show_tail_risk(tail)
+                    risk_level = combine_risk_levels(risk_level, tail["risk_level"])
+                    portfolio_value = portfolio_value or tail["portfolio_value"]
+                    findings = "\n".join(filter(None, [findings, audit_core.format_tail_risk(tail)]))
+                    tail_var = max(tail[column] for column in TAIL_RISK_COLUMNS[::2])
+                    tail_cvar = max(tail[column] for column in TAIL_RISK_COLUMNS[1::2])
+            
             if investor_id and portfolio_value:
-                compliance_result = generate_compliance_check(portfolio_value)
+                compliance_result = audit_core.generate_compliance_check(portfolio_value)
                 compliance_score = compliance_result.get("compliance_score", 0)
                 
                 success = create_audit_record(
                     investor_id, audit_type, risk_level,
                     portfolio_value, compliance_score,
-                    findings, recommendations, "系統審核員"
+                    findings, recommendations, "系統審核員",
+                    tail_var=tail_var, tail_cvar=tail_cvar
                 )
                 
                 if success:
@@ -350,6 +332,77 @@ def show_audit_interface():
             else:
                 st.error("❌ 請填寫必要資訊！")
 
+JOB_LABELS = {
+    "compliance_sweep": "⚖️ 全體合規掃描（季度審核）",
+    "risk_sweep": "🎯 全體風險掃描",
+    "bulk_import": "📥 批次匯入審核記錄",
+    "llm_summary": "🤖 FinGPT 審核摘要",
+}
+JOB_STATUS_LABELS = {"queued": "⏳ 排隊中", "running": "⚙️ 執行中", "done": "✅ 完成", "failed": "❌ 失敗"}
+
+def show_job_queue():
+    """顯示批次作業：加入背景作業並追蹤進度（由 job_worker.py 工作程序執行）"""
+    st.markdown('<div class="audit-card">', unsafe_allow_html=True)
+    st.markdown('<h2 style="color: #ff6b35;">📦 批次作業</h2>', unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    kind = st.selectbox("作業類型", job_queue.JOB_KINDS, format_func=JOB_LABELS.get, key="job_kind")
+    with st.form("job_form"):
+        payload = {}
+        if kind in ("compliance_sweep", "bulk_import"):
+            payload["source"] = st.text_input("資料檔路徑（CSV / Parquet）", key="job_source")
+        if kind == "bulk_import":
+            payload["start_row"] = st.number_input("起始列（接續失敗的匯入時填入錯誤訊息中的列數）", min_value=0,
+                                                   value=0, step=1, key="job_start_row")
+        if kind in ("compliance_sweep", "risk_sweep"):
+            payload["values"] = st.text_input("市值時間序列路徑（investor_id, date, current_value）", key="job_values")
+        if kind == "llm_summary":
+            investor_text = st.text_area("投資者 ID（以逗號或換行分隔）", key="job_investors")
+            payload["investor_ids"] = [item.strip() for item in investor_text.replace("\n", ",").split(",") if item.strip()]
+        idempotency_key = st.text_input("冪等鍵（留空則同日相同內容視為同一作業）", key="job_key")
+        submitted = st.form_submit_button("📥 加入佇列", use_container_width=True)
+    
+    if submitted:
+        payload = {name: value for name, value in payload.items() if value}
+        required = {"compliance_sweep": "source", "bulk_import": "source", "risk_sweep": "values",
+                    "llm_summary": "investor_ids"}[kind]
+        if required not in payload:
+            st.error("❌ 請填寫必要資訊！")
+        else:
+            try:
+                job_id = job_queue.enqueue(kind, payload, idempotency_key.strip() or None)
+                st.success(f"✅ 已加入作業 #{job_id}，請確認 job_worker.py 工作程序已啟動")
+            except Exception as e:
+                st.error(f"加入作業失敗: {e}")
+    
+    show_job_progress()
+
+@st.fragment(run_every=3)
+def show_job_progress():
+    """定期更新作業進度（只重新執行此區塊，不阻塞頁面）"""
+    try:
+        jobs = job_queue.list_jobs(limit=10)
+    except Exception as e:
+        st.error(f"讀取作業失敗: {e}")
+        return
+    
+    # 有作業新完成時清除審核查詢快取
+    finished = sum(job["status"] == "done" for job in jobs), max((job["id"] for job in jobs), default=0)
+    if st.session_state.get("jobs_finished") not in (None, finished):
+        invalidate_query_cache()
+    st.session_state.jobs_finished = finished
+    
+    if not jobs:
+        st.info("目前沒有作業")
+        return
+    for job in jobs:
+        elapsed = f"｜{job['elapsed_seconds']:.1f} 秒" if job.get("elapsed_seconds") is not None else ""
+        st.markdown(f"**#{job['id']} {JOB_LABELS.get(job['kind'], job['kind'])}** "
+                    f"{JOB_STATUS_LABELS.get(job['status'], job['status'])}（第 {job['attempts']}/{job['max_attempts']} 次{elapsed}）")
+        st.progress(job["progress"], text=job["message"] or "")
+        if job["error"]:
+            st.caption(f"⚠️ {job['error']}")
+
 def show_audit_reports():
     """顯示審核報告"""
     st.markdown('<div class="audit-card">', unsafe_allow_html=True)
@@ -361,51 +414,155 @@ def show_audit_reports():
     
     with col1:
         search_investor = st.text_input("投資者 ID", key="search_investor")
-        search_date = st.date_input("審核日期", key="search_date")
+        search_date = st.date_input("審核日期", value=None, key="search_date")
     
     with col2:
-        audit_type_filter = st.selectbox("審核類型篩選", ["全部", "例行審核", "特別審核", "風險評估", "合規檢查"], key="audit_type_filter")
+        audit_type_filter = st.selectbox("審核類型篩選", ["全部"] + audit_db.AUDIT_TYPES, key="audit_type_filter")
+    
+    filters = {
+        "investor_id": search_investor.strip() or None,
+        "audit_date": search_date,
+        "audit_type": None if audit_type_filter == "全部" else audit_type_filter
+    }
     
-    # 查詢按鈕
+    # 查詢按鈕：記錄篩選條件並回到第一頁
     if st.button("🔍 查詢審核記錄", use_container_width=True):
-        if search_investor:
-            st.info(f"🔍 正在查詢投資者 {search_investor} 的審核記錄...")
-            # 這裡應該連接數據庫並查詢
-            st.markdown('<div class="audit-report">', unsafe_allow_html=True)
-            st.markdown("<p>📋 查詢結果將顯示在這裡...</p>", unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
+        st.session_state.report_filters = filters
+        st.session_state.report_cursors = [None]
+    
+    if "report_filters" in st.session_state:
+        show_audit_report_page()
+    
+    show_audit_search(filters)
+    show_audit_export(filters)
+
+def show_audit_search(filters: Dict):
+    """以關鍵字搜尋審核發現與建議，依相關分數列出並標示關鍵字"""
+    with st.expander("🔎 關鍵字搜尋審核發現與建議", expanded="search_result" in st.session_state):
+        keywords = st.text_input("關鍵字（空白分隔，全部須符合）", key="search_keywords")
+        if st.button("🔎 搜尋", use_container_width=True):
+            st.session_state.search_result = audit_search.search_audit_records(keywords, **filters)
+        
+        result = st.session_state.get("search_result")
+        if not result:
+            return
+        if "error" in result:
+            st.error(f"搜尋失敗: {result['error']}")
+            return
+        more = f"，命中超過 {audit_search.CANDIDATE_LIMIT} 筆，僅排序最新的記錄" if result["truncated"] else ""
+        st.caption(f"🔎 {len(result['rows'])} 筆（候選 {result['candidates']} 筆{more}），耗時 {result['elapsed_ms']:.1f} ms")
+        if not result["rows"]:
+            st.markdown("<p>📋 查無包含關鍵字的審核記錄</p>", unsafe_allow_html=True)
+            return
+        # 摘要已跳脫 HTML，只保留 <mark> 標示
+        cards = "".join(
+            f"<p><b>#{row['id']}</b> {html.escape(row['timestamp'] or '')}｜{html.escape(row['investor_id'] or '')}｜"
+            f"{html.escape(row['audit_type'] or '')}｜風險 {html.escape(row['risk_level'] or '')}<br>"
+            f"🔍 {row['findings']}<br>💡 {row['recommendations']}</p>"
+            for row in result["rows"])
+        st.markdown(f'<div class="audit-report">{cards}</div>', unsafe_allow_html=True)
+
+def show_audit_export(filters: Dict):
+    """依目前篩選條件分段匯出審核記錄並提供下載"""
+    import audit_export
+    with st.expander("📤 匯出審核記錄", expanded=False):
+        fmt = st.radio("匯出格式", audit_export.EXPORT_FORMATS, format_func=str.upper, horizontal=True,
+                       key="export_format")
+        if st.button("📤 產生匯出檔", use_container_width=True):
+            previous = st.session_state.pop("export_result", None)
+            if previous and os.path.exists(previous["path"]):
+                os.remove(previous["path"])
+            try:
+                total = audit_queries.count_audit_records(**filters)
+            except Exception as e:
+                st.error(f"查詢審核記錄失敗: {e}")
+                return
+            bar = st.progress(0.0, text=f"匯出中（共 {total:,} 筆）")
+            path = os.path.join(tempfile.gettempdir(), f"audit_records_{datetime.now():%Y%m%d_%H%M%S}.{fmt}")
+            result = audit_export.export_audit_records(
+                path, fmt, **filters,
+                progress=lambda rows: bar.progress(min(rows / max(total, 1), 1.0), text=f"已匯出 {rows:,}/{total:,} 筆"))
+            bar.empty()
+            if "error" in result:
+                st.error(f"匯出失敗: {result['error']}")
+                return
+            st.session_state.export_result = result
+        
+        result = st.session_state.get("export_result")
+        if result and os.path.exists(result["path"]):
+            st.caption(f"✅ {result['rows']:,} 筆，{result['bytes'] / 1e6:.1f} MB，耗時 {result['elapsed_seconds']:.1f} 秒")
+            with open(result["path"], "rb") as f:
+                st.download_button("📥 下載匯出檔", f, file_name=os.path.basename(result["path"]),
+                                   mime="text/csv" if result["format"] == "csv" else "application/octet-stream",
+                                   use_container_width=True)
+
+def show_audit_report_page():
+    """以鍵集分頁顯示目前篩選條件的審核記錄"""
+    import pandas as pd
+    cursors = st.session_state.report_cursors
+    try:
+        page = cached_audit_page(cursor=cursors[-1], **st.session_state.report_filters)
+    except Exception as e:
+        st.error(f"查詢審核記錄失敗: {e}")
+        return
+    
+    st.markdown('<div class="audit-report">', unsafe_allow_html=True)
+    if page["rows"]:
+        st.markdown(f"<p>📋 第 {len(cursors)} 頁，共 {len(page['rows'])} 筆</p>", unsafe_allow_html=True)
+        st.dataframe(pd.DataFrame(page["rows"]), use_container_width=True, hide_index=True)
+    else:
+        st.markdown("<p>📋 查無符合條件的審核記錄</p>", unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # 分頁按鈕
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("⬅ 上一頁", disabled=len(cursors) == 1, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if st.button("下一頁 ➡", disabled=page["next_cursor"] is None, use_container_width=True):
+            cursors.append(page["next_cursor"])
+            st.rerun()
 
 def show_compliance_dashboard():
     """顯示合規儀表板"""
+    import pandas as pd
     st.markdown('<div class="audit-card">', unsafe_allow_html=True)
     st.markdown('<h2 style="color: #ff6b35;">⚖️ 合規儀表板</h2>', unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True)
     
+    try:
+        summary = cached_dashboard_summary()
+    except Exception as e:
+        st.error(f"讀取合規彙總失敗: {e}")
+        return
+    
     # 合規狀態指標
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         st.markdown('<div class="compliance-status">', unsafe_allow_html=True)
         st.markdown("<h3>總投資者數</h3>", unsafe_allow_html=True)
-        st.markdown("<h1>156</h1>", unsafe_allow_html=True)
+        st.markdown(f"<h1>{summary['total_investors']}</h1>", unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col2:
         st.markdown('<div class="compliance-status">', unsafe_allow_html=True)
         st.markdown("<h3>活躍審核</h3>", unsafe_allow_html=True)
-        st.markdown("<h1>23</h1>", unsafe_allow_html=True)
+        st.markdown(f"<h1>{summary['active_audits']}</h1>", unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col3:
         st.markdown('<div class="compliance-status">', unsafe_allow_html=True)
         st.markdown("<h3>合規率</h3>", unsafe_allow_html=True)
-        st.markdown("<h1>94.2%</h1>", unsafe_allow_html=True)
+        st.markdown(f"<h1>{summary['compliance_rate']:.1f}%</h1>", unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col4:
         st.markdown('<div class="compliance-status">', unsafe_allow_html=True)
         st.markdown("<h3>風險警示</h3>", unsafe_allow_html=True)
-        st.markdown("<h1 class='risk-medium'>3</h1>", unsafe_allow_html=True)
+        st.markdown(f"<h1 class='risk-medium'>{summary['open_warnings']}</h1>", unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
     
     # 風險分布
@@ -413,19 +570,138 @@ def show_compliance_dashboard():
     st.markdown('<div class="audit-card">', unsafe_allow_html=True)
     st.markdown("<h3>風險等級分布</h3>", unsafe_allow_html=True)
     
+    distribution = summary["risk_distribution"]
+    total = summary["total_investors"]
     risk_data = pd.DataFrame({
-        '風險等級': ['低', '中', '高'],
-        '投資者數量': [89, 54, 13],
-        '佔比': ['57.1%', '34.6%', '8.3%']
+        '風險等級': list(distribution),
+        '投資者數量': list(distribution.values()),
+        '佔比': [f"{count / total * 100:.1f}%" if total else "0.0%" for count in distribution.values()]
     })
     
     st.dataframe(risk_data, use_container_width=True)
     st.markdown('</div>', unsafe_allow_html=True)
+    
+    # 技術指標快照（讀取每日更新的指標快取）
+    st.markdown("---")
+    st.markdown('<div class="audit-card">', unsafe_allow_html=True)
+    st.markdown("<h3>📈 技術指標快照</h3>", unsafe_allow_html=True)
+    
+    watchlist = st.text_input("觀察清單（以逗號分隔）", value="0050.TW, 2330.TW")
+    tickers = [ticker.strip() for ticker in watchlist.split(",") if ticker.strip()]
+    try:
+        snapshot = cached_indicator_snapshot(tuple(tickers))
+    except Exception as e:
+        st.error(f"讀取技術指標失敗: {e}")
+        snapshot = pd.DataFrame()
+    
+    if snapshot.empty:
+        st.info("尚無技術指標快取，請先同步行情並更新指標")
+    else:
+        st.dataframe(snapshot.round(2), use_container_width=True)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+def show_system_settings():
+    """顯示系統設定：各操作耗時、錯誤數與 Prometheus 匯出"""
+    import pandas as pd
+    st.markdown('<div class="audit-card">', unsafe_allow_html=True)
+    st.markdown('<h2 style="color: #ff6b35;">📋 系統設定</h2>', unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    enabled = st.toggle("啟用效能量測", value=instrumentation.ENABLED, key="metrics_enabled")
+    if enabled != instrumentation.ENABLED:
+        instrumentation.set_enabled(enabled)
+    if instrumentation.EXPORT_PORT:
+        st.caption(f"📈 Prometheus：http://{instrumentation.EXPORT_HOST}:{instrumentation.EXPORT_PORT}/metrics")
+    else:
+        st.caption("設定 AUDIT_METRICS_PORT 環境變數即可於本機提供 /metrics")
+    
+    rows = instrumentation.snapshot()
+    if not rows:
+        st.info("尚無量測資料")
+    else:
+        st.markdown("### ⏱️ 操作耗時")
+        st.dataframe(pd.DataFrame({
+            '操作': [row['operation'] for row in rows],
+            '次數': [row['count'] for row in rows],
+            '錯誤': [row['errors'] for row in rows],
+            '錯誤率': [f"{row['error_rate']:.1%}" for row in rows],
+            '總耗時 (ms)': [round(row['total_ms'], 1) for row in rows],
+            '平均 (ms)': [round(row['mean_ms'], 2) for row in rows],
+            'p50 (ms)': [round(row['p50_ms'], 2) for row in rows],
+            'p95 (ms)': [round(row['p95_ms'], 2) for row in rows],
+            'p99 (ms)': [round(row['p99_ms'], 2) for row in rows],
+            '最大 (ms)': [round(row['max_ms'], 2) for row in rows]
+        }), use_container_width=True, hide_index=True)
+    
+    events = instrumentation.events()
+    if events:
+        st.markdown("### 🔁 事件次數")
+        st.dataframe(pd.DataFrame({'事件': list(events), '次數': list(events.values())}),
+                     use_container_width=True, hide_index=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("📥 下載 Prometheus 格式", instrumentation.render_prometheus(),
+                           file_name="audit_metrics.prom", mime="text/plain", use_container_width=True)
+    with col2:
+        if st.button("🔄 重設統計", use_container_width=True):
+            instrumentation.reset()
+            st.rerun()
+    
+    show_partitions()
+
+def show_partitions():
+    """顯示審核記錄月分區，並可將較舊月份移至封存檔"""
+    import pandas as pd
+    st.markdown("### 🗄️ 審核記錄分區")
+    try:
+        partitions = audit_partitions.list_partitions()
+        hot_rows = audit_db.query_one("SELECT COUNT(*) FROM audit_records")[0]
+    except Exception as e:
+        st.error(f"讀取分區失敗: {e}")
+        return
+    
+    archived_rows = sum(partition["row_count"] for partition in partitions)
+    st.caption(f"熱資料庫 {hot_rows:,} 筆，封存分區 {len(partitions)} 個（{archived_rows:,} 筆）")
+    if partitions:
+        st.dataframe(pd.DataFrame({
+            '月份': [partition['period'] for partition in partitions],
+            '筆數': [partition['row_count'] for partition in partitions],
+            '最早': [partition['min_timestamp'] for partition in partitions],
+            '最晚': [partition['max_timestamp'] for partition in partitions],
+            '封存檔': [partition['path'] for partition in partitions]
+        }), use_container_width=True, hide_index=True)
+    
+    keep_months = st.number_input("熱資料庫保留月數（含當月）", min_value=1, max_value=36,
+                                  value=audit_partitions.HOT_MONTHS, key="keep_months")
+    if st.button("🗄️ 封存較舊月份", use_container_width=True):
+        with st.spinner("封存中..."):
+            result = audit_partitions.archive_old_partitions(int(keep_months))
+        if "error" in result:
+            st.error(f"封存失敗: {result['error']}")
+        else:
+            invalidate_query_cache()
+            st.success(f"✅ 已封存 {len(result['archived'])} 個月份，共 {result['moved']:,} 筆")
+
+def show_rerun_timings():
+    """顯示本次重新執行各區段耗時"""
+    RERUN_TIMINGS["總計"] = time.perf_counter() - RERUN_STARTED
+    with st.expander("⏱️ 重新執行耗時", expanded=False):
+        # 每頁都會顯示，以 Markdown 表格呈現，不為此載入 pandas
+        rows = "".join(f"| {name} | {seconds * 1000:.1f} |\n" for name, seconds in RERUN_TIMINGS.items())
+        st.markdown("| 區段 | 耗時 (ms) |\n| --- | ---: |\n" + rows)
 
 def main():
     """主程式"""
     # 初始化數據庫
-    if not init_audit_database():
+    with timed_section("資料庫初始化"):
+        ready = init_audit_database()
+    try:
+        if instrumentation.EXPORT_PORT:
+            metrics_exporter(instrumentation.EXPORT_PORT)
+    except OSError as e:
+        st.warning(f"效能指標服務啟動失敗: {e}")
+    if not ready:
         st.error("❌ 系統初始化失敗，無法啟動審核系統")
         return
     
@@ -439,15 +715,23 @@ def main():
             "🔍 新增審核", 
             "📊 審核報告", 
             "⚖️ 合規儀表板",
+            "📦 批次作業",
             "📋 系統設定"
         ])
         
-        if page == "🔍 新增審核":
-            show_audit_interface()
-        elif page == "📊 審核報告":
-            show_audit_reports()
-        elif page == "⚖️ 合規儀表板":
-            show_compliance_dashboard()
+        with timed_section(page):
+            if page == "🔍 新增審核":
+                show_audit_interface()
+            elif page == "📊 審核報告":
+                show_audit_reports()
+            elif page == "⚖️ 合規儀表板":
+                show_compliance_dashboard()
+            elif page == "📦 批次作業":
+                show_job_queue()
+            elif page == "📋 系統設定":
+                show_system_settings()
+        
+        show_rerun_timings()
     
     # 主要內容區
     if 'selected_page' not in st.session_state:
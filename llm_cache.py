@@ -0,0 +1,202 @@
+"""
+FinGPT 回應快取 - Google 開發計畫整合
+以模型、訊息、溫度與 max_tokens 為內容位址的磁碟快取，依提示類別設定 TTL 並以 LRU 限制容量
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import audit_db
+
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.db")
+
+# 各提示類別的存活秒數（0 表示不快取）
+DEFAULT_TTLS = {
+    "connection_test": 0,
+    "chat": 5 * 60,
+    "stock_analysis": 15 * 60,
+    "risk_assessment": 60 * 60,
+    "default": 10 * 60,
+}
+MAX_BYTES = 50 * 1024 * 1024
+MAX_ENTRIES = 10000
+# 最近存取時間在此秒數內的命中不立即寫入，暫存於記憶體待下次寫入快取時一併更新
+TOUCH_INTERVAL = 60
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        key TEXT PRIMARY KEY,
+        prompt_class TEXT,
+        response TEXT,
+        size_bytes INTEGER,
+        created_at REAL,
+        expires_at REAL,
+        last_access REAL,
+        hits INTEGER DEFAULT 0
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)",
+    "CREATE INDEX IF NOT EXISTS idx_llm_cache_expires_at ON llm_cache (expires_at)",
+    # 以觸發器維護總筆數與大小，寫入時不必掃描全表即可判斷是否超出容量
+    '''
+    CREATE TABLE IF NOT EXISTS llm_cache_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        entries INTEGER NOT NULL,
+        total_bytes INTEGER NOT NULL
+    )
+    ''',
+    "INSERT OR IGNORE INTO llm_cache_totals (id, entries, total_bytes) "
+    "SELECT 1, COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_cache",
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_llm_cache_insert AFTER INSERT ON llm_cache BEGIN
+        UPDATE llm_cache_totals SET entries = entries + 1, total_bytes = total_bytes + NEW.size_bytes;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_llm_cache_delete AFTER DELETE ON llm_cache BEGIN
+        UPDATE llm_cache_totals SET entries = entries - 1, total_bytes = total_bytes - OLD.size_bytes;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_llm_cache_resize AFTER UPDATE OF size_bytes ON llm_cache BEGIN
+        UPDATE llm_cache_totals SET total_bytes = total_bytes - OLD.size_bytes + NEW.size_bytes;
+    END
+    ''',
+]
+
+
+def cache_key(model: str, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+    """以請求內容計算快取鍵"""
+    canonical = json.dumps({"model": model, "messages": messages, "temperature": temperature,
+                            "max_tokens": max_tokens}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """FinGPT 回應快取（執行緒安全，資料存於 SQLite）"""
+
+    def __init__(self, db_path: str = CACHE_PATH, ttls: Optional[Dict[str, int]] = None,
+                 max_bytes: int = MAX_BYTES, max_entries: int = MAX_ENTRIES, touch_interval: float = TOUCH_INTERVAL):
+        self.db_path = db_path
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._stats_lock = threading.Lock()
+        # 尚未寫入的命中：key -> [最近存取時間, 命中次數]
+        self._pending: Dict[str, Tuple[float, int]] = {}
+
+        def create(cursor):
+            for statement in SCHEMA:
+                cursor.execute(statement)
+        audit_db.run_write(create, db_path)
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def ttl_for(self, prompt_class: str) -> int:
+        """取得提示類別的 TTL"""
+        return self.ttls.get(prompt_class, self.ttls["default"])
+
+    def get(self, key: str) -> Optional[Dict]:
+        """讀取未過期的快取回應，命中時更新最近存取時間
+
+        最近存取時間已在 touch_interval 秒內的項目不立即寫入，記在記憶體，於下次 put 淘汰前一併寫入，
+        因此同一行程內的 LRU 順序不受節流影響。
+        """
+        now = time.time()
+        row = audit_db.query_one("SELECT response, last_access FROM llm_cache WHERE key = ? AND expires_at > ?",
+                                 (key, now), self.db_path)
+        if row is None:
+            self._count("misses")
+            return None
+        touch = now - row[1] >= self.touch_interval
+        with self._stats_lock:
+            self._stats["hits"] += 1
+            _, hits = self._pending.pop(key, (None, 0))
+            if not touch:
+                self._pending[key] = (now, hits + 1)
+        if touch:
+            audit_db.execute_write("UPDATE llm_cache SET last_access = ?, hits = hits + ? WHERE key = ?",
+                                   (now, hits + 1, key), self.db_path)
+        return json.loads(row[0])
+
+    def _flush_touches(self, cursor):
+        """寫入暫存於記憶體的命中（於 put 的寫入交易內）"""
+        with self._stats_lock:
+            pending, self._pending = self._pending, {}
+        cursor.executemany("UPDATE llm_cache SET last_access = MAX(last_access, ?), hits = hits + ? WHERE key = ?",
+                           [(last_access, hits, key) for key, (last_access, hits) in pending.items()])
+
+    def _evict(self, cursor, now: float) -> int:
+        """超出容量或筆數上限時，先刪除過期項目，再由最久未使用者淘汰至上限內"""
+        entries, total_bytes = cursor.execute("SELECT entries, total_bytes FROM llm_cache_totals").fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return 0
+        removed = cursor.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+        entries, total_bytes = cursor.execute("SELECT entries, total_bytes FROM llm_cache_totals").fetchone()
+        victims = []
+        oldest = cursor.connection.execute("SELECT key, size_bytes FROM llm_cache ORDER BY last_access")
+        for key, size_bytes in oldest:
+            if entries - len(victims) <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            victims.append((key,))
+            total_bytes -= size_bytes
+        oldest.close()
+        cursor.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        return removed + len(victims)
+
+    def put(self, key: str, response: Dict, prompt_class: str = "default"):
+        """寫入快取並依 LRU 淘汰超出容量的項目"""
+        ttl = self.ttl_for(prompt_class)
+        if ttl <= 0:
+            return
+        now = time.time()
+        payload = json.dumps(response, ensure_ascii=False)
+
+        def store(cursor):
+            self._flush_touches(cursor)
+            cursor.execute('''
+                INSERT INTO llm_cache
+                (key, prompt_class, response, size_bytes, created_at, expires_at, last_access, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+                ON CONFLICT(key) DO UPDATE SET
+                    prompt_class = excluded.prompt_class,
+                    response = excluded.response,
+                    size_bytes = excluded.size_bytes,
+                    created_at = excluded.created_at,
+                    expires_at = excluded.expires_at,
+                    last_access = excluded.last_access,
+                    hits = 0
+            ''', (key, prompt_class, payload, len(payload.encode("utf-8")), now, now + ttl, now))
+            return self._evict(cursor, now)
+
+        self._count("evictions", audit_db.run_write(store, self.db_path))
+        self._count("stores")
+
+    def clear(self):
+        """清空快取"""
+        with self._stats_lock:
+            self._pending.clear()
+        audit_db.execute_write("DELETE FROM llm_cache", (), self.db_path)
+
+    def stats(self) -> Dict:
+        """命中、未命中與容量統計"""
+        entries, total_bytes = audit_db.query_one("SELECT entries, total_bytes FROM llm_cache_totals", (),
+                                                  self.db_path)
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            "entries": entries,
+            "total_bytes": total_bytes,
+        })
+        return stats
@@ -0,0 +1,185 @@
+"""
+市場行情資料 - 大戶投資審核系統
+以 yfinance 批次下載股價，依代號保存 Parquet 快取並只補抓缺少的日期，離線時直接讀快取
+"""
+
+import os
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+import instrumentation
+from risk_engine import calculate_risk_metrics_batch
+
+CACHE_DIR = os.environ.get("MARKET_DATA_CACHE", "market_data_cache")
+DEFAULT_HISTORY_DAYS = 3 * 365
+BATCH_SIZE = 50
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+# 下載函式：(代號清單, 起始日, 結束日[不含]) -> {代號: 日線 DataFrame}
+Downloader = Callable[[List[str], date, date], Dict[str, pd.DataFrame]]
+
+
+def _download_yfinance(tickers: List[str], start: date, end: date) -> Dict[str, pd.DataFrame]:
+    """以單次 yfinance 呼叫下載多檔股票日線"""
+    import yfinance as yf
+
+    raw = yf.download(tickers, start=start.isoformat(), end=end.isoformat(), group_by="ticker",
+                      auto_adjust=False, threads=True, progress=False)
+    # yfinance 下載失敗時不拋出例外；超過一週的區間全無資料視為連線問題
+    if raw.dropna(how="all").empty and (end - start).days > 7:
+        raise ConnectionError(f"yfinance 未回傳任何資料: {', '.join(tickers)}")
+    frames = {}
+    for ticker in tickers:
+        if isinstance(raw.columns, pd.MultiIndex):
+            if ticker not in raw.columns.get_level_values(0):
+                continue
+            frame = raw[ticker]
+        else:
+            frame = raw
+        frames[ticker] = frame.dropna(how="all")
+    return frames
+
+
+def _cache_path(ticker: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, f"{ticker}.parquet")
+
+
+def _normalize(frame: pd.DataFrame) -> pd.DataFrame:
+    """統一索引（不含時區的日期）與欄位"""
+    frame = frame.copy()
+    index = pd.DatetimeIndex(frame.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    frame.index = index.normalize().rename("Date")
+    columns = [column for column in PRICE_COLUMNS if column in frame.columns]
+    return frame[columns].astype(float)
+
+
+def read_cached(ticker: str, cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """讀取單一代號的快取日線，無快取時回傳空表"""
+    path = _cache_path(ticker, cache_dir)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=PRICE_COLUMNS, index=pd.DatetimeIndex([], name="Date"), dtype=float)
+    return pd.read_parquet(path)
+
+
+def _write_cached(ticker: str, frame: pd.DataFrame, cache_dir: str):
+    """原子寫入快取檔"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(ticker, cache_dir)
+    tmp_path = path + ".tmp"
+    frame.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+@instrumentation.instrument("market.sync")
+def sync_prices(tickers: Iterable[str], today: Optional[date] = None,
+                history_days: int = DEFAULT_HISTORY_DAYS, cache_dir: str = CACHE_DIR,
+                downloader: Downloader = _download_yfinance, batch_size: int = BATCH_SIZE) -> Dict:
+    """增量同步股價快取
+
+    依各代號最後快取日期分組，同一起始日的代號以一次批次下載，只抓缺少的日期。
+    最後快取日當天也重新下載並覆寫：盤中同步存下的是未收盤的 K 棒，收盤後需以完整資料取代。
+    updated 為各代號寫入的列數（含覆寫的最後一天）。下載失敗時保留既有快取並回報錯誤。
+    """
+    today = today or date.today()
+    end = today + timedelta(days=1)
+
+    groups: Dict[date, List[str]] = {}
+    for ticker in dict.fromkeys(tickers):
+        cached = read_cached(ticker, cache_dir)
+        if cached.empty:
+            start = today - timedelta(days=history_days)
+        else:
+            start = cached.index.max().date()
+        if start <= today:
+            groups.setdefault(start, []).append(ticker)
+
+    report = {"updated": {}, "up_to_date": [], "errors": {}}
+    for start, group in groups.items():
+        for i in range(0, len(group), batch_size):
+            batch = group[i:i + batch_size]
+            try:
+                with instrumentation.timer("market.download"):
+                    frames = downloader(batch, start, end)
+            except Exception as e:
+                for ticker in batch:
+                    report["errors"][ticker] = str(e)
+                continue
+            for ticker in batch:
+                fresh = frames.get(ticker)
+                if fresh is None or fresh.empty:
+                    report["up_to_date"].append(ticker)
+                    continue
+                fresh = _normalize(fresh)
+                cached = read_cached(ticker, cache_dir)
+                merged = pd.concat([cached, fresh]) if not cached.empty else fresh
+                merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+                _write_cached(ticker, merged, cache_dir)
+                report["updated"][ticker] = len(fresh)
+    report["up_to_date"].extend(ticker for ticker in dict.fromkeys(tickers)
+                                if ticker not in report["updated"] and ticker not in report["errors"]
+                                and ticker not in report["up_to_date"])
+    return report
+
+
+def load_prices(tickers: Iterable[str], start: Optional[date] = None, end: Optional[date] = None,
+                refresh: bool = True, cache_dir: str = CACHE_DIR,
+                downloader: Downloader = _download_yfinance, field: str = "Adj Close") -> pd.DataFrame:
+    """取得多檔股票的價格表（日期 x 代號）
+
+    refresh=False 時完全離線，只讀快取。
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if refresh:
+        sync_prices(tickers, cache_dir=cache_dir, downloader=downloader)
+
+    columns = {}
+    for ticker in tickers:
+        cached = read_cached(ticker, cache_dir)
+        if cached.empty:
+            continue
+        series = cached[field] if field in cached and cached[field].notna().any() else cached["Close"]
+        columns[ticker] = series
+    prices = pd.DataFrame(columns)
+    if start is not None:
+        prices = prices[prices.index >= pd.Timestamp(start)]
+    if end is not None:
+        prices = prices[prices.index <= pd.Timestamp(end)]
+    return prices
+
+
+def portfolio_value_series(holdings: Dict[str, float], prices: pd.DataFrame) -> pd.Series:
+    """依持股數與價格表計算投資組合每日市值"""
+    prices = prices.reindex(columns=list(holdings)).ffill().dropna()
+    shares = pd.Series(holdings, dtype=float)
+    return (prices * shares).sum(axis=1).rename("current_value")
+
+
+def holdings_value_frame(holdings_by_investor: Dict[str, Dict[str, float]],
+                         prices: pd.DataFrame) -> pd.DataFrame:
+    """多位投資者的每日市值（長格式：investor_id, date, current_value）"""
+    frames = []
+    for investor_id, holdings in holdings_by_investor.items():
+        values = portfolio_value_series(holdings, prices)
+        frames.append(pd.DataFrame({"investor_id": investor_id, "date": values.index,
+                                    "current_value": values.to_numpy()}))
+    if not frames:
+        return pd.DataFrame(columns=["investor_id", "date", "current_value"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def holdings_risk_metrics(holdings_by_investor: Dict[str, Dict[str, float]],
+                          start: Optional[date] = None, refresh: bool = True,
+                          cache_dir: str = CACHE_DIR, downloader: Downloader = _download_yfinance) -> pd.DataFrame:
+    """以真實市值時間序列計算每位投資者的風險指標"""
+    tickers = [ticker for holdings in holdings_by_investor.values() for ticker in holdings]
+    prices = load_prices(tickers, start=start, refresh=refresh, cache_dir=cache_dir, downloader=downloader)
+    values = holdings_value_frame(holdings_by_investor, prices)
+    metrics = calculate_risk_metrics_batch(values)
+    # 時間序列下總市值取最新一日，而非逐日加總
+    metrics["total_value"] = values.groupby("investor_id")["current_value"].last()
+    # 缺少行情的投資者保留空白列
+    return metrics.reindex(pd.Index(list(holdings_by_investor), name=metrics.index.name))
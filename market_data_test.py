@@ -0,0 +1,147 @@
+"""
+市場行情資料測試 - 大戶投資審核系統
+以固定的假行情（不連網）驗證增量同步、離線讀取與風險計算
+"""
+
+import sys
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import market_data
+
+FIXTURE_START = date(2024, 1, 1)
+
+
+def fixture_prices(ticker: str, start: date, end: date) -> pd.DataFrame:
+    """產生固定的日線假資料（僅平日，價格由代號決定）"""
+    days = pd.bdate_range(FIXTURE_START, end - timedelta(days=1))
+    seed = sum(ticker.encode())
+    rng = np.random.default_rng(seed)
+    close = 100 * np.cumprod(1 + rng.normal(0.0005, 0.01, len(days)))
+    frame = pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+                          "Adj Close": close, "Volume": 1000.0}, index=days)
+    return frame[frame.index >= pd.Timestamp(start)]
+
+
+class FixtureDownloader:
+    """記錄每次批次下載請求的假下載器"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, tickers, start, end):
+        self.calls.append((list(tickers), start, end))
+        return {ticker: fixture_prices(ticker, start, end) for ticker in tickers}
+
+
+def test_incremental_sync():
+    """測試首次同步整批下載、之後只補抓最後快取日起的日期"""
+    print("\n📈 開始測試增量同步...")
+    cache_dir = tempfile.mkdtemp()
+    downloader = FixtureDownloader()
+
+    market_data.sync_prices(["0050.TW", "2330.TW"], today=date(2024, 3, 29), history_days=120,
+                            cache_dir=cache_dir, downloader=downloader)
+    report = market_data.sync_prices(["0050.TW", "2330.TW"], today=date(2024, 4, 5),
+                                      cache_dir=cache_dir, downloader=downloader)
+    cached = market_data.read_cached("0050.TW", cache_dir)
+    expected = fixture_prices("0050.TW", FIXTURE_START, date(2024, 4, 6))
+
+    print(f"📊 下載呼叫: {[(tickers, str(start)) for tickers, start, _ in downloader.calls]}")
+    print(f"📊 第二次同步: {report['updated']}")
+    assert len(downloader.calls) == 2, "兩檔應合併為一次整批下載"
+    assert downloader.calls[1][1] == date(2024, 3, 29), "第二次同步應從快取最後日期開始（重新抓取最後一天）"
+    assert report["updated"] == {"0050.TW": 6, "2330.TW": 6}
+    assert np.allclose(cached["Close"].to_numpy(), expected["Close"].to_numpy()), "增量合併後的快取與完整資料不一致"
+
+
+def test_refresh_last_bar():
+    """測試盤中同步存下的未收盤 K 棒，在下次同步時以完整資料覆寫"""
+    print("\n🕯️ 開始測試最後一天覆寫...")
+    cache_dir = tempfile.mkdtemp()
+    today = date(2024, 3, 29)
+
+    def intraday(tickers, start, end):
+        frames = FixtureDownloader()(tickers, start, end)
+        for frame in frames.values():
+            frame.iloc[-1] = frame.iloc[-1] * 0.9
+        return frames
+
+    market_data.sync_prices(["0050.TW"], today=today, history_days=30, cache_dir=cache_dir, downloader=intraday)
+    market_data.sync_prices(["0050.TW"], today=today, cache_dir=cache_dir, downloader=FixtureDownloader())
+    cached = market_data.read_cached("0050.TW", cache_dir)
+    expected = fixture_prices("0050.TW", today - timedelta(days=30), today + timedelta(days=1))
+    print(f"📊 最後一天收盤價 {cached['Close'].iloc[-1]:.2f}（完整資料 {expected['Close'].iloc[-1]:.2f}）")
+    assert cached.index.is_unique and len(cached) == len(expected), "覆寫最後一天不應產生重複日期"
+    assert np.allclose(cached["Close"].to_numpy(), expected["Close"].to_numpy()), "未收盤的 K 棒應被完整資料取代"
+
+
+def test_offline_from_cache():
+    """測試下載失敗或離線時仍可由快取取得價格"""
+    print("\n📴 開始測試離線讀取...")
+    cache_dir = tempfile.mkdtemp()
+    market_data.sync_prices(["0050.TW"], today=date(2024, 3, 29), history_days=60,
+                            cache_dir=cache_dir, downloader=FixtureDownloader())
+
+    def offline(tickers, start, end):
+        raise ConnectionError("no network")
+
+    report = market_data.sync_prices(["0050.TW"], today=date(2024, 4, 5), cache_dir=cache_dir, downloader=offline)
+    prices = market_data.load_prices(["0050.TW"], refresh=False, cache_dir=cache_dir)
+    print(f"📊 同步錯誤: {report['errors']}，離線讀取 {len(prices)} 筆")
+    assert "0050.TW" in report["errors"], "下載失敗應記錄於 errors"
+    assert len(prices) > 0 and prices.index.max() == pd.Timestamp(2024, 3, 29), "離線時應讀取既有快取"
+
+
+def test_holdings_risk_metrics():
+    """測試以持股市值時間序列計算風險指標"""
+    print("\n⚖️ 開始測試持股風險計算...")
+    cache_dir = tempfile.mkdtemp()
+    downloader = FixtureDownloader()
+    market_data.sync_prices(["0050.TW", "2330.TW"], today=date(2024, 6, 28), history_days=200,
+                            cache_dir=cache_dir, downloader=downloader)
+    holdings = {"INV001": {"0050.TW": 1000, "2330.TW": 200}, "INV002": {"2330.TW": 50}}
+    metrics = market_data.holdings_risk_metrics(holdings, refresh=False, cache_dir=cache_dir)
+    print(metrics)
+
+    prices = market_data.load_prices(["2330.TW"], refresh=False, cache_dir=cache_dir)["2330.TW"]
+    expected_volatility = prices.pct_change().dropna().std() * (252 ** 0.5)
+    assert list(metrics.index) == ["INV001", "INV002"]
+    assert np.isclose(metrics.loc["INV002", "volatility"], expected_volatility), "單一持股的波動率應等於該股波動率"
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("📈 市場行情資料測試")
+    print("=" * 60)
+
+    tests = [
+        ("🔄 增量同步測試", test_incremental_sync),
+        ("🕯️ 最後一天覆寫測試", test_refresh_last_bar),
+        ("📴 離線讀取測試", test_offline_from_cache),
+        ("⚖️ 持股風險測試", test_holdings_risk_metrics)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+提示詞脈絡建構 - Google 開發計畫整合
+依提問挑選審核記錄、風險指標與技術指標快照，以精簡表格在 token 預算內組成參考資料
+投資者資料只提供呼叫端授權的對象，審核發現預設不送往外部模型
+"""
+
+import math
+import re
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+import audit_db
+import audit_queries
+import instrumentation
+
+DEFAULT_TOKEN_BUDGET = 1200
+AUDIT_ROWS = 10
+
+# 中文句子中無字詞邊界，改以前後字元判斷
+INVESTOR_PATTERN = re.compile(r"(?<![A-Za-z0-9])[A-Z]{2,4}\d{3,}(?!\d)")
+TICKER_PATTERN = re.compile(r"(?<![\w.])(\d{4,6})(\.TWO?)?(?!\d)", re.ASCII)
+
+# 各類資料的基本優先度與提高優先度的關鍵字
+PRIORITIES = {"risk": 30, "audit": 20, "indicators": 10}
+KEYWORDS = {
+    "audit": ["審核", "合規", "紀錄", "記錄", "發現", "建議"],
+    "risk": ["風險", "波動", "回撤", "夏普", "部位"],
+    "indicators": ["技術", "指標", "RSI", "MACD", "均線", "布林", "ATR", "走勢", "股價"],
+}
+SNAPSHOT_COLUMNS = ["Close", "RSI_14", "MACD_12_26_9", "MACDh_12_26_9", "BBL_20_2.0", "BBU_20_2.0",
+                    "ATRr_14", "SMA_20", "SMA_60"]
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 數（中文約一字一 token，其餘約四字元一 token）"""
+    wide = sum(1 for ch in text if ord(ch) > 127)
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+def estimate_messages_tokens(messages: List[Dict]) -> int:
+    """估算整組訊息的 token 數（每則另計角色標記）"""
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages)
+
+
+def extract_entities(question: str) -> Dict[str, List[str]]:
+    """由提問擷取投資者 ID 與台股代號"""
+    investors = list(dict.fromkeys(INVESTOR_PATTERN.findall(question)))
+    tickers = list(dict.fromkeys(code + (suffix or ".TW") for code, suffix in TICKER_PATTERN.findall(question)))
+    return {"investors": investors, "tickers": tickers}
+
+
+# --- 片段：(標題, 表頭, 資料列)，依資料版本記憶，未變動時跨輪次重用 ---
+
+@lru_cache(maxsize=256)
+def _audit_fragment(investor_id: str, version: tuple, limit: int, db_path: Optional[str], redact: bool = True) -> tuple:
+    rows = audit_queries.query_audit_records(investor_id=investor_id, page_size=limit, db_path=db_path)["rows"]
+    lines = tuple(
+        f"{row['timestamp'][:10]}|{row['audit_type']}|{row['risk_level']}|"
+        f"{(row['portfolio_value'] or 0) / 1e4:.0f}|{row['compliance_score']}"
+        + ("" if redact else f"|{(row['findings'] or '')[:40]}|{(row['recommendations'] or '')[:40]}")
+        for row in rows
+    )
+    header = "日期|類型|風險|市值(萬)|合規分" + ("" if redact else "|發現|建議")
+    return (f"投資者 {investor_id} 近期審核", header, lines)
+
+
+@lru_cache(maxsize=256)
+def _risk_fragment(investor_id: str, version: str, state: str) -> tuple:
+    from risk_engine import RiskAccumulator
+    metrics = RiskAccumulator.from_json(state).metrics()
+    line = (f"{metrics['risk_level']}|{metrics['risk_score']:.0f}|{metrics['volatility']:.2%}|"
+            f"{metrics.get('sharpe_ratio', 0):.2f}|{metrics.get('max_drawdown', 0):.2%}")
+    return (f"投資者 {investor_id} 風險指標", "等級|分數|年化波動|夏普|最大回撤", (line,))
+
+
+@lru_cache(maxsize=256)
+def _indicator_fragment(tickers: tuple, versions: tuple, cache_dir: str) -> tuple:
+    import indicators
+    snapshot = indicators.indicator_snapshot(tickers, cache_dir=cache_dir)
+    lines = indicators.format_snapshot(snapshot, SNAPSHOT_COLUMNS).splitlines()
+    if not lines:
+        return ("技術指標快照", "", ())
+    return ("技術指標快照", lines[0], tuple(lines[1:]))
+
+
+def _collect_fragments(investors: List[str], tickers: List[str], db_path: Optional[str],
+                       cache_dir: Optional[str], redact: bool = True) -> List[tuple]:
+    """讀取各資料的版本並取得（記憶的）片段，回傳 [(類別, 片段)]
+
+    風險引擎與技術指標（含 pandas）只在提問涉及投資者或股票時才載入。
+    """
+    fragments = []
+    for investor_id in investors:
+        row = audit_db.query_one("SELECT state, updated_at FROM risk_states WHERE investor_id = ?",
+                                 (investor_id,), db_path)
+        if row:
+            fragments.append(("risk", _risk_fragment(investor_id, row[1], row[0])))
+        # 版本為最新一筆審核 id（含已封存的記錄）與觸發器維護的變更次數：
+        # 補登較舊的記錄、修改或刪除非最新一筆時最新 id 不變，仍會重建片段
+        version = audit_db.query_one('''
+            SELECT s.last_id, COALESCE(r.revision, 0) FROM investor_audit_summary AS s
+            LEFT JOIN investor_audit_revisions AS r ON r.investor_id = s.investor_id
+            WHERE s.investor_id = ?
+        ''', (investor_id,), db_path)
+        if version is not None:
+            fragments.append(("audit", _audit_fragment(investor_id, tuple(version), AUDIT_ROWS, db_path, redact)))
+    if tickers:
+        import indicators
+        cache_dir = cache_dir or indicators.CACHE_DIR
+        versions = tuple(indicators.cache_version(ticker, cache_dir=cache_dir) for ticker in tickers)
+        fragment = _indicator_fragment(tuple(tickers), versions, cache_dir)
+        if fragment[2]:
+            fragments.append(("indicators", fragment))
+    return fragments
+
+
+@instrumentation.instrument("llm.build_context")
+def build_context(question: str, investor_id: Optional[str] = None, tickers: Optional[Iterable[str]] = None,
+                  budget: int = DEFAULT_TOKEN_BUDGET, db_path: Optional[str] = None,
+                  indicator_dir: Optional[str] = None, allowed_investors: Optional[Iterable[str]] = None,
+                  redact: bool = True) -> Dict:
+    """依提問挑選最相關的資料，組成不超過 token 預算的參考資料
+
+    投資者資料只包含呼叫端指定的 investor_id，以及提問中提及且列於 allowed_investors 的投資者；
+    未提供 allowed_investors 時不依提問文字載入任何投資者資料。redact 為 True 時不附審核發現與建議。
+    回傳 text、tokens、build_ms 與各片段的使用情形；表格放不下時只保留較新的資料列。
+    """
+    started = time.perf_counter()
+    entities = extract_entities(question)
+    allowed = set(allowed_investors or ())
+    mentioned = [investor for investor in entities["investors"] if investor in allowed]
+    investors = list(dict.fromkeys(([investor_id] if investor_id else []) + mentioned))
+    tickers = list(dict.fromkeys(list(tickers or []) + entities["tickers"]))
+
+    try:
+        fragments = _collect_fragments(investors, tickers, db_path, indicator_dir, redact)
+    except Exception as e:
+        return {"text": "", "tokens": 0, "build_ms": (time.perf_counter() - started) * 1000,
+                "fragments": [], "error": str(e)}
+
+    def priority(kind: str) -> int:
+        return PRIORITIES[kind] + 10 * sum(word in question for word in KEYWORDS[kind])
+
+    sections, used, report = [], 0, []
+    for kind, (title, header, lines) in sorted(fragments, key=lambda item: -priority(item[0])):
+        block = [f"[{title}]", header]
+        cost = estimate_tokens("\n".join(block)) + 1
+        kept = 0
+        for line in lines:
+            line_cost = estimate_tokens(line) + 1
+            if used + cost + line_cost > budget:
+                break
+            block.append(line)
+            cost += line_cost
+            kept += 1
+        if kept:
+            sections.append("\n".join(block))
+            used += cost
+        report.append({"name": title, "rows": kept, "truncated": kept < len(lines)})
+
+    text = "\n\n".join(sections)
+    return {"text": text, "tokens": estimate_tokens(text), "build_ms": (time.perf_counter() - started) * 1000,
+            "fragments": report}
+
+
+def with_context(system_prompt: str, context: Dict) -> str:
+    """將參考資料附加到系統提示"""
+    if not context.get("text"):
+        return system_prompt
+    return f"{system_prompt}\n\n以下為系統資料（精簡表格，以 | 分隔），請據此回答：\n{context['text']}"
@@ -0,0 +1,160 @@
+"""
+提示詞脈絡建構測試 - Google 開發計畫整合
+驗證資料挑選、投資者授權與遮蔽、token 預算與片段記憶
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date
+
+import audit_db
+import indicators
+import market_data
+import prompt_context
+from market_data_test import FixtureDownloader
+from risk_engine import RiskAccumulator
+
+
+def build_fixture():
+    """建立含審核記錄、風險狀態與技術指標快取的測試資料"""
+    root = tempfile.mkdtemp()
+    db_path = os.path.join(root, "audit.db")
+    audit_db.init_schema(db_path)
+    for i in range(40):
+        audit_db.execute_write('''
+            INSERT INTO audit_records (timestamp, investor_id, audit_type, risk_level, portfolio_value,
+                                       compliance_score, findings, recommendations, auditor)
+            VALUES (?, 'INV001', '例行審核', '中', ?, 80, '分散投資不足', '降低集中度', '測試')
+        ''', (f"2024-05-{i % 28 + 1:02d} 10:00:{i:02d}", 5e7 + i * 1e5), db_path)
+    state = RiskAccumulator().update_many([100, 102, 99, 105, 103]).to_json()
+    audit_db.execute_write("INSERT INTO risk_states (investor_id, state, updated_at) VALUES ('INV001', ?, 't1')",
+                           (state,), db_path)
+
+    price_dir, indicator_dir = os.path.join(root, "prices"), os.path.join(root, "indicators")
+    market_data.sync_prices(["2330.TW"], today=date(2024, 12, 31), history_days=400,
+                            cache_dir=price_dir, downloader=FixtureDownloader())
+    indicators.update_indicators(["2330.TW"], cache_dir=indicator_dir, price_cache_dir=price_dir)
+    return db_path, indicator_dir
+
+
+def test_context_selection():
+    """測試依提問挑選資料並依關鍵字排序"""
+    print("\n🧩 開始測試資料挑選...")
+    db_path, indicator_dir = build_fixture()
+    context = prompt_context.build_context("INV001 持有 2330 的技術指標與 RSI 如何？", budget=2000,
+                                           db_path=db_path, indicator_dir=indicator_dir,
+                                           allowed_investors=["INV001"])
+    print(context["text"])
+    names = [fragment["name"] for fragment in context["fragments"]]
+    print(f"📊 片段: {names}，約 {context['tokens']} tokens，{context['build_ms']:.1f} ms")
+    assert names[0] == "技術指標快照", f"提問含 RSI 時技術指標應排第一，實際 {names}"
+    assert "投資者 INV001 風險指標" in names
+    assert "2330.TW|2024-12-31|" in context["text"]
+    assert "投資者 INV001 近期審核" in names
+
+
+def test_investor_authorization():
+    """測試提問文字不能帶入未授權投資者的資料，審核發現與建議預設遮蔽"""
+    print("\n🔐 開始測試投資者授權...")
+    db_path, indicator_dir = build_fixture()
+    question = "INV001 的審核紀錄與風險"
+
+    def investor_fragments(context):
+        return [fragment["name"] for fragment in context["fragments"] if fragment["name"].startswith("投資者")]
+
+    unrestricted = prompt_context.build_context(question, db_path=db_path, indicator_dir=indicator_dir)
+    other = prompt_context.build_context(question, db_path=db_path, indicator_dir=indicator_dir,
+                                         allowed_investors=["INV002"])
+    selected = prompt_context.build_context("最近的審核紀錄", investor_id="INV001", db_path=db_path,
+                                            indicator_dir=indicator_dir)
+    full = prompt_context.build_context("最近的審核紀錄", investor_id="INV001", db_path=db_path,
+                                        indicator_dir=indicator_dir, redact=False)
+    print(f"📊 未授權片段 {investor_fragments(unrestricted)}，選定後片段 {investor_fragments(selected)}")
+    assert investor_fragments(unrestricted) == [], "未提供授權清單時不應依提問載入投資者資料"
+    assert investor_fragments(other) == [], "提問中的投資者不在授權清單內"
+    assert len(investor_fragments(selected)) == 2
+    assert "分散投資不足" not in selected["text"] and "降低集中度" not in selected["text"], "審核發現與建議應預設遮蔽"
+    assert "分散投資不足" in full["text"] and "降低集中度" in full["text"]
+
+
+def test_token_budget():
+    """測試超出預算時截斷表格列並維持在預算內"""
+    print("\n📏 開始測試 token 預算...")
+    db_path, indicator_dir = build_fixture()
+    context = prompt_context.build_context("INV001 的審核紀錄", budget=100, db_path=db_path,
+                                           indicator_dir=indicator_dir, allowed_investors=["INV001"])
+    audit = next(fragment for fragment in context["fragments"] if fragment["name"].endswith("近期審核"))
+    print(f"📊 約 {context['tokens']} tokens，審核列 {audit['rows']} 筆（截斷: {audit['truncated']}）")
+    assert context["tokens"] <= 100, f"超出預算: {context['tokens']} tokens"
+    assert audit["truncated"] and 0 < audit["rows"] < prompt_context.AUDIT_ROWS, "應截斷列數而非整段捨棄"
+
+
+def test_fragment_memoization():
+    """測試資料未變動時重用片段、新增、修改或刪除審核後重建"""
+    print("\n🧠 開始測試片段記憶...")
+    db_path, indicator_dir = build_fixture()
+    prompt_context._audit_fragment.cache_clear()
+    for _ in range(3):
+        prompt_context.build_context("", investor_id="INV001", db_path=db_path, indicator_dir=indicator_dir,
+                                     redact=False)
+    hits = prompt_context._audit_fragment.cache_info().hits
+    audit_db.execute_write("INSERT INTO audit_records (investor_id, audit_type, risk_level, portfolio_value, "
+                           "compliance_score, findings) VALUES ('INV001', '特別審核', '高', 1e8, 60, '新發現')",
+                           (), db_path)
+    context = prompt_context.build_context("", investor_id="INV001", db_path=db_path, indicator_dir=indicator_dir,
+                                           redact=False)
+    print(f"📊 記憶命中 {hits} 次")
+    assert hits == 2, f"資料未變動時應重用片段，實際命中 {hits} 次"
+    assert "新發現" in context["text"], "新增審核後應重建片段"
+
+    # 補登較舊時間的記錄、修改或刪除非最新一筆時最新 id 不變，片段仍須重建
+    def build():
+        return prompt_context.build_context("", investor_id="INV001", db_path=db_path,
+                                            indicator_dir=indicator_dir, redact=False)["text"]
+
+    audit_db.execute_write("INSERT INTO audit_records (timestamp, investor_id, audit_type, risk_level, "
+                           "portfolio_value, compliance_score, findings) VALUES "
+                           "('2024-05-28 09:00:00', 'INV001', '補登審核', '中', 5e7, 80, '補登發現')", (), db_path)
+    backfilled = build()
+    audit_db.execute_write("UPDATE audit_records SET findings = '修正發現' WHERE findings = '補登發現'", (), db_path)
+    updated = build()
+    audit_db.execute_write("DELETE FROM audit_records WHERE findings = '修正發現'", (), db_path)
+    deleted = build()
+    assert "補登發現" in backfilled, "補登較舊時間的審核後應重建片段"
+    assert "修正發現" in updated and "補登發現" not in updated, "修改非最新一筆審核後應重建片段"
+    assert "修正發現" not in deleted, "刪除非最新一筆審核後應重建片段"
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("🧩 提示詞脈絡建構測試")
+    print("=" * 60)
+
+    tests = [
+        ("🧩 資料挑選測試", test_context_selection),
+        ("🔐 投資者授權測試", test_investor_authorization),
+        ("📏 token 預算測試", test_token_budget),
+        ("🧠 片段記憶測試", test_fragment_memoization)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+批次風險引擎 - 大戶投資審核系統
+一次向量化計算多位投資者的風險指標
+"""
+
+import json
+import math
+from typing import Dict, Iterable, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+
+# 年化交易日數與無風險利率（與單一組合計算一致）
+TRADING_DAYS = 252
+RISK_FREE_RATE = 0.02
+
+RISK_COLUMNS = ["risk_score", "risk_level", "volatility", "sharpe_ratio", "max_drawdown", "total_value"]
+
+
+def _long_to_matrix(data: pd.DataFrame, investor_col: str, date_col: str, value_col: str):
+    """將長格式資料轉為 (投資者 x 時間序) 矩陣，序列靠左對齊，尾端以 NaN 補齊"""
+    frame = data[[investor_col, date_col, value_col]]
+    frame = frame.sort_values([investor_col, date_col], kind="mergesort")
+
+    codes, investors = pd.factorize(frame[investor_col], sort=False)
+    positions = frame.groupby(codes, sort=False).cumcount().to_numpy()
+    lengths = np.bincount(codes, minlength=len(investors))
+
+    matrix = np.full((len(investors), int(lengths.max()) if len(lengths) else 0), np.nan)
+    matrix[codes, positions] = frame[value_col].to_numpy(dtype=float)
+    return matrix, pd.Index(investors, name=investor_col)
+
+
+def _risk_level(risk_score: np.ndarray) -> np.ndarray:
+    """依風險評分分級"""
+    return np.select([risk_score >= 70, risk_score >= 40], ["高", "中"], default="低")
+
+
+def compute_risk_arrays(values: np.ndarray) -> dict:
+    """對 (投資者 x 時間序) 價值矩陣計算各項風險指標，回傳每欄一個陣列"""
+    values = np.asarray(values, dtype=float)
+    if values.ndim != 2:
+        raise ValueError("values 必須為二維陣列 (投資者 x 時間序)")
+
+    total_value = np.nansum(values, axis=1)
+
+    # 報酬率：任一端為 NaN 即視為缺值（等同 pct_change().dropna()）
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = values[:, 1:] / values[:, :-1] - 1
+    valid = ~np.isnan(returns)
+    count = valid.sum(axis=1)
+    filled = np.where(valid, returns, 0.0)
+
+    # 波動率（樣本標準差，年化）
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = filled.sum(axis=1) / count
+        sq_dev = np.where(valid, returns - mean[:, None], 0.0) ** 2
+        std = np.sqrt(sq_dev.sum(axis=1) / (count - 1))
+    std = np.where(count > 1, std, np.nan)
+    volatility = np.where(count > 0, std * (TRADING_DAYS ** 0.5), 0.0)
+
+    # 最大回撤：缺值期間報酬視為 0，不影響累積淨值
+    cumulative = np.cumprod(1 + filled, axis=1)
+    cumulative = np.where(valid, cumulative, np.nan)
+    if cumulative.shape[1]:
+        rolling_max = np.fmax.accumulate(cumulative, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            drawdown = (cumulative - rolling_max) / rolling_max
+        max_drawdown = np.where(count > 0, np.nanmin(np.where(valid, drawdown, np.inf), axis=1), np.nan)
+    else:
+        max_drawdown = np.full(len(values), np.nan)
+
+    return _finalize_metrics(volatility, mean, max_drawdown, total_value)
+
+
+def _finalize_metrics(volatility: np.ndarray, mean: np.ndarray,
+                      max_drawdown: np.ndarray, total_value: np.ndarray) -> dict:
+    """由波動率、平均報酬與最大回撤計算夏普比率、風險評分與等級"""
+    # 夏普比率
+    excess_returns = mean - RISK_FREE_RATE / TRADING_DAYS
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe_ratio = np.where(volatility > 0, excess_returns / volatility, 0.0)
+
+    # 風險評分（沿用 min/max 內建函式對 NaN 的處理方式）
+    raw_score = (volatility * 50) + (np.abs(max_drawdown) * 100) + (100 - sharpe_ratio * 10)
+    risk_score = np.where(raw_score > 0, raw_score, 0.0)
+    risk_score = np.where(risk_score < 100, risk_score, 100.0)
+
+    return {
+        "risk_score": risk_score,
+        "risk_level": _risk_level(risk_score),
+        "volatility": volatility,
+        "sharpe_ratio": sharpe_ratio,
+        "max_drawdown": max_drawdown,
+        "total_value": total_value,
+    }
+
+
+@instrumentation.instrument("risk.metrics_batch")
+def calculate_risk_metrics_batch(data: Union[pd.DataFrame, np.ndarray],
+                                 investor_ids: Optional[Sequence] = None,
+                                 investor_col: str = "investor_id",
+                                 date_col: str = "date",
+                                 value_col: str = "current_value") -> pd.DataFrame:
+    """批次計算風險指標
+
+    data 可為長格式 DataFrame（investor_id, date, current_value），
+    或二維 NumPy 陣列（每列一位投資者，長度不一時尾端以 NaN 補齊）。
+    回傳每位投資者一列的 DataFrame。
+    """
+    if isinstance(data, pd.DataFrame):
+        if data.empty:
+            return pd.DataFrame(columns=RISK_COLUMNS, index=pd.Index([], name=investor_col))
+        matrix, index = _long_to_matrix(data, investor_col, date_col, value_col)
+    else:
+        matrix = np.asarray(data, dtype=float)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        index = pd.Index(investor_ids if investor_ids is not None else range(len(matrix)), name=investor_col)
+
+    return pd.DataFrame(compute_risk_arrays(matrix), index=index, columns=RISK_COLUMNS)
+
+
+class RiskAccumulator:
+    """串流風險累加器
+
+    逐筆（或小批次）接收最新價值，以 O(1) 更新波動率（Welford）、
+    平均報酬、歷史高點與最大回撤；狀態可序列化後存回審核數據庫。
+    """
+
+    def __init__(self):
+        self.value_count = 0
+        self.total_value = 0.0
+        self.last_value = math.nan
+        self.return_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.cumulative = 1.0
+        self.peak = math.nan
+        self.max_drawdown = math.nan
+
+    def update(self, value: float) -> "RiskAccumulator":
+        """加入一筆新價值"""
+        value = float(value)
+        self.value_count += 1
+        if math.isnan(value):
+            self.last_value = math.nan
+            return self
+        self.total_value += value
+
+        if not math.isnan(self.last_value):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ret = float(np.float64(value) / self.last_value - 1)
+            self._add_return(ret)
+        self.last_value = value
+        return self
+
+    def update_many(self, values: Iterable[float]) -> "RiskAccumulator":
+        """依序加入一批新價值"""
+        for value in values:
+            self.update(value)
+        return self
+
+    def _add_return(self, ret: float):
+        """Welford 更新平均與離差平方和，並更新累積淨值與回撤"""
+        self.return_count += 1
+        delta = ret - self.mean
+        self.mean += delta / self.return_count
+        self.m2 += delta * (ret - self.mean)
+
+        self.cumulative *= 1 + ret
+        if math.isnan(self.peak) or self.cumulative > self.peak:
+            self.peak = self.cumulative
+        drawdown = (self.cumulative - self.peak) / self.peak
+        if math.isnan(self.max_drawdown) or drawdown < self.max_drawdown:
+            self.max_drawdown = drawdown
+
+    def metrics(self) -> Dict:
+        """回傳與 calculate_risk_metrics 相同格式的風險指標"""
+        if self.value_count == 0:
+            return {"risk_score": 0, "risk_level": "低", "volatility": 0}
+
+        if self.return_count > 1:
+            volatility = math.sqrt(self.m2 / (self.return_count - 1)) * (TRADING_DAYS ** 0.5)
+        elif self.return_count == 1:
+            volatility = math.nan
+        else:
+            volatility = 0.0
+        mean = self.mean if self.return_count else math.nan
+
+        result = _finalize_metrics(np.array([volatility]), np.array([mean]),
+                                   np.array([self.max_drawdown]), np.array([self.total_value]))
+        return {column: result[column][0].item() for column in RISK_COLUMNS}
+
+    def to_dict(self) -> Dict:
+        """匯出累加器狀態"""
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> "RiskAccumulator":
+        """由狀態還原累加器"""
+        accumulator = cls()
+        for key, value in state.items():
+            if key in accumulator.__dict__:
+                setattr(accumulator, key, value)
+        return accumulator
+
+    def to_json(self) -> str:
+        """序列化為 JSON 字串"""
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_json(cls, payload: str) -> "RiskAccumulator":
+        """由 JSON 字串還原累加器"""
+        return cls.from_dict(json.loads(payload))
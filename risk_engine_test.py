@@ -0,0 +1,158 @@
+"""
+批次風險引擎測試 - 大戶投資審核系統
+驗證批次計算與逐一計算一致、串流累加器與批次結果一致，以及累加器狀態序列化還原
+"""
+
+import math
+import sys
+
+import numpy as np
+import pandas as pd
+
+from risk_engine import RISK_COLUMNS, RiskAccumulator, calculate_risk_metrics_batch
+
+
+def reference_metrics(values) -> dict:
+    """以原本的單一組合公式（pandas pct_change）計算風險指標，作為比對基準"""
+    series = pd.Series(values, dtype=float)
+    returns = series.pct_change().dropna()
+    volatility = returns.std() * (252 ** 0.5) if len(returns) > 0 else 0
+    excess_returns = returns.mean() - 0.02 / 252
+    sharpe_ratio = excess_returns / volatility if volatility > 0 else 0
+    cumulative_returns = (1 + returns).cumprod()
+    rolling_max = cumulative_returns.expanding().max()
+    max_drawdown = ((cumulative_returns - rolling_max) / rolling_max).min()
+    risk_score = min(100, max(0, (volatility * 50) + (abs(max_drawdown) * 100) + (100 - sharpe_ratio * 10)))
+    risk_level = "高" if risk_score >= 70 else "中" if risk_score >= 40 else "低"
+    return {"risk_score": risk_score, "risk_level": risk_level, "volatility": volatility,
+            "sharpe_ratio": sharpe_ratio, "max_drawdown": max_drawdown, "total_value": series.sum()}
+
+
+def assert_metrics_close(actual: dict, expected: dict, label: str):
+    """逐欄比對風險指標（數值容許浮點誤差，NaN 視為相等）"""
+    for column in RISK_COLUMNS:
+        a, b = actual[column], expected[column]
+        if isinstance(b, str):
+            assert a == b, f"{label}: {column} 為 {a}，預期 {b}"
+        else:
+            assert (math.isnan(a) and math.isnan(b)) or math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12), \
+                f"{label}: {column} 為 {a}，預期 {b}"
+
+
+def sample_series(rng: np.random.Generator) -> list:
+    """產生長度與波動不一的市值序列，含邊界情形"""
+    series = [1e7 * np.cumprod(1 + rng.normal(0.0003, sigma, length))
+              for length, sigma in [(250, 0.01), (60, 0.04), (3, 0.02), (120, 0.002), (30, 0.08)]]
+    series += [
+        np.array([1e8, 1.01e8]),          # 只有一筆報酬：樣本標準差為 NaN
+        np.full(20, 5e7),                 # 市值不變：波動率 0、夏普 0
+        np.array([1e8, 1.2e8, 0.6e8, 1.5e8, 0.9e8]),  # 大幅回撤，評分觸及上限
+    ]
+    return series
+
+
+def test_batch_matches_single():
+    """測試長度不一的多個組合整批計算，與逐一計算及原本的單一組合公式一致，且不受輸入順序影響"""
+    print("\n📐 開始測試批次與逐一計算...")
+    series = sample_series(np.random.default_rng(3))
+    width = max(len(values) for values in series)
+    matrix = np.full((len(series), width), np.nan)
+    for row, values in enumerate(series):
+        matrix[row, :len(values)] = values
+    ids = [f"R{row:02d}" for row in range(len(series))]
+
+    from_matrix = calculate_risk_metrics_batch(matrix, investor_ids=ids)
+    long = pd.DataFrame({
+        "investor_id": np.repeat(ids, [len(values) for values in series]),
+        "date": np.concatenate([pd.bdate_range("2024-01-01", periods=len(values)) for values in series]),
+        "current_value": np.concatenate(series),
+    }).sample(frac=1, random_state=1)
+    from_long = calculate_risk_metrics_batch(long)
+    print(from_matrix[["risk_score", "risk_level", "volatility", "max_drawdown"]])
+
+    for row, (investor_id, values) in enumerate(zip(ids, series)):
+        single = calculate_risk_metrics_batch(values[None, :]).iloc[0].to_dict()
+        assert_metrics_close(from_matrix.loc[investor_id].to_dict(), single, f"{investor_id} 矩陣輸入")
+        assert_metrics_close(from_long.loc[investor_id].to_dict(), single, f"{investor_id} 長格式輸入")
+        assert_metrics_close(single, reference_metrics(values), f"{investor_id} 原公式")
+    assert list(from_matrix.loc["R06", ["volatility", "sharpe_ratio"]]) == [0.0, 0.0]
+    assert from_matrix.loc["R07", "risk_score"] == 100 and from_matrix.loc["R07", "risk_level"] == "高"
+
+
+def test_accumulator_matches_batch():
+    """測試串流累加器逐筆、分段加入（含缺值）後，與對同一序列的批次計算一致"""
+    print("\n🔁 開始測試串流累加器...")
+    rng = np.random.default_rng(9)
+    series = sample_series(rng)
+    gapped = 1e7 * np.cumprod(1 + rng.normal(0.0005, 0.02, 80))
+    gapped[[0, 10, 11, 40, 79]] = np.nan
+    series.append(gapped)
+
+    for index, values in enumerate(series):
+        expected = calculate_risk_metrics_batch(values[None, :]).iloc[0].to_dict()
+        one_by_one = RiskAccumulator()
+        for value in values:
+            one_by_one.update(value)
+        cuts = sorted(rng.choice(np.arange(1, len(values)), size=min(3, len(values) - 1), replace=False))
+        chunked = RiskAccumulator()
+        for part in np.split(values, cuts):
+            chunked.update_many(part)
+        assert_metrics_close(one_by_one.metrics(), expected, f"序列 {index} 逐筆加入")
+        assert_metrics_close(chunked.metrics(), expected, f"序列 {index} 分段加入")
+    print(f"📊 含缺值序列: {RiskAccumulator().update_many(gapped).metrics()}")
+    assert RiskAccumulator().metrics() == {"risk_score": 0, "risk_level": "低", "volatility": 0}
+
+
+def test_state_round_trip():
+    """測試中途序列化還原後繼續累加，結果與未中斷相同（含 NaN 狀態與未知欄位）"""
+    print("\n💾 開始測試狀態序列化...")
+    values = 1e8 * np.cumprod(1 + np.random.default_rng(4).normal(0.0002, 0.015, 200))
+    uninterrupted = RiskAccumulator().update_many(values)
+
+    restored = RiskAccumulator()
+    for part in np.array_split(values, 7):
+        restored = RiskAccumulator.from_json(restored.update_many(part).to_json())
+    print(f"📊 還原後狀態: {restored.to_dict()}")
+    assert restored.to_dict() == uninterrupted.to_dict(), "分段保存還原後的狀態與未中斷不同"
+    assert restored.metrics() == uninterrupted.metrics()
+
+    fresh = RiskAccumulator.from_json(RiskAccumulator().to_json())
+    assert math.isnan(fresh.peak) and math.isnan(fresh.last_value), "初始 NaN 狀態應可序列化還原"
+    after_gap = RiskAccumulator.from_json(RiskAccumulator().update_many([1e8, float("nan")]).to_json())
+    assert math.isnan(after_gap.last_value) and after_gap.value_count == 2
+    legacy = RiskAccumulator.from_dict({**uninterrupted.to_dict(), "obsolete_field": 1})
+    assert not hasattr(legacy, "obsolete_field") and legacy.metrics() == uninterrupted.metrics(), \
+        "未知欄位應略過"
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("📐 批次風險引擎測試")
+    print("=" * 60)
+
+    tests = [
+        ("📐 批次與逐一計算測試", test_batch_matches_single),
+        ("🔁 串流累加器測試", test_accumulator_matches_batch),
+        ("💾 狀態序列化測試", test_state_round_trip)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+啟動時間基準測試 - 大戶投資審核系統
+於全新子程序量測各 Streamlit 進入點的模組匯入與首次渲染耗時、載入的重型函式庫，並與時間預算及基準檔比較
+"""
+
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REPEAT = 3
+RENDER_TIMEOUT = 60
+
+# 量測時是否已載入（模組名稱前綴）
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "yfinance", "plotly", "pandas_ta", "google.generativeai"]
+
+# 各進入點首次渲染的時間預算（秒）與首次渲染不應載入的重型函式庫
+ENTRY_POINTS = {
+    # 登入頁只需 Streamlit 與 Google 驗證
+    "app.py": {"budget_s": 1.5, "forbidden": ["pandas", "numpy", "pyarrow", "yfinance", "plotly", "pandas_ta"]},
+    # 預設的新增審核頁不需資料表與行情
+    "large_investment_audit.py": {"budget_s": 2.0,
+                                  "forbidden": ["pandas", "pyarrow", "yfinance", "plotly", "pandas_ta"]},
+}
+
+
+def _top_level_imports(path: str) -> List[ast.stmt]:
+    """進入點最外層的 import 敘述（首次執行時必定載入的模組）"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    return [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def _loaded_heavy_modules() -> List[str]:
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def _probe(entry: str, mode: str) -> Dict:
+    """子程序內執行：import 模式只執行最外層 import，render 模式以 AppTest 執行一次完整渲染
+
+    兩種模式都先載入 Streamlit（伺服器程序本來就已載入），只量測進入點自身的成本。
+    """
+    from streamlit.testing.v1 import AppTest
+
+    path = os.path.join(BASE_DIR, entry)
+    errors = []
+    started = time.perf_counter()
+    if mode == "import":
+        for node in _top_level_imports(path):
+            try:
+                exec(compile(ast.Module(body=[node], type_ignores=[]), path, "exec"), {})
+            except ImportError as e:
+                errors.append(str(e))
+    else:
+        app = AppTest.from_file(path, default_timeout=RENDER_TIMEOUT).run()
+        errors = [exception.message for exception in app.exception]
+    elapsed = time.perf_counter() - started
+
+    peak_mb = 0.0
+    try:
+        import resource
+        # Linux 以 KB 回報
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        pass
+    return {"seconds": elapsed, "heavy_modules": _loaded_heavy_modules(), "errors": errors, "peak_mb": peak_mb}
+
+
+def _run_probe(entry: str, mode: str, db_path: str) -> Dict:
+    """於全新子程序執行量測（暫存審核資料庫，不啟動指標服務）"""
+    env = {**os.environ, "AUDIT_DB_PATH": db_path, "PYTHONPATH": BASE_DIR, "AUDIT_METRICS_PORT": ""}
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--probe", entry, "--mode", mode],
+                               capture_output=True, text=True, encoding="utf-8", env=env, cwd=BASE_DIR,
+                               timeout=RENDER_TIMEOUT * 2)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{entry} {mode} 量測失敗: {completed.stderr.strip()[-500:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def measure_entry(entry: str, repeat: int = DEFAULT_REPEAT) -> Dict:
+    """量測單一進入點：匯入與首次渲染各執行 repeat 次取中位數"""
+    db_path = os.path.join(tempfile.mkdtemp(prefix="startup_"), "audit.db")
+    imports = [_run_probe(entry, "import", db_path) for _ in range(repeat)]
+    renders = [_run_probe(entry, "render", db_path) for _ in range(repeat)]
+    render_times = [probe["seconds"] for probe in renders]
+    config = ENTRY_POINTS.get(entry, {})
+    loaded = renders[-1]["heavy_modules"]
+    return {
+        "import_s": round(statistics.median(probe["seconds"] for probe in imports), 4),
+        "median_s": round(statistics.median(render_times), 4),
+        "min_s": round(min(render_times), 4),
+        "stdev_s": round(statistics.stdev(render_times), 4) if len(render_times) > 1 else 0.0,
+        "peak_mb": round(max(probe["peak_mb"] for probe in renders), 1),
+        "import_heavy_modules": imports[-1]["heavy_modules"],
+        "heavy_modules": loaded,
+        "errors": sorted(set(imports[-1]["errors"] + renders[-1]["errors"])),
+        "budget_s": config.get("budget_s"),
+        "forbidden_loaded": [name for name in config.get("forbidden", []) if name in loaded],
+    }
+
+
+def run_startup(entries: Optional[List[str]] = None, repeat: int = DEFAULT_REPEAT, verbose: bool = True) -> Dict:
+    """量測所有進入點，回傳與 benchmarks.run_benchmarks 相同格式（鍵為 startup@進入點）"""
+    results = {}
+    for entry in entries or list(ENTRY_POINTS):
+        key = f"startup@{entry}"
+        results[key] = measure_entry(entry, repeat)
+        if verbose:
+            stats = results[key]
+            print(f"🚀 {key:<36} 匯入 {stats['import_s'] * 1000:>8.1f} ms  首次渲染 {stats['median_s'] * 1000:>8.1f} ms  "
+                  f"重型函式庫 {', '.join(stats['heavy_modules']) or '無'}", file=sys.stderr)
+            for error in stats["errors"]:
+                print(f"   ⚠️ {error}", file=sys.stderr)
+    return {
+        "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "python": sys.version.split()[0],
+                 "repeat": repeat},
+        "results": results,
+    }
+
+
+def budget_violations(current: Dict) -> List[str]:
+    """超出時間預算或首次渲染載入了不應載入的函式庫的進入點"""
+    violations = []
+    for key, stats in current["results"].items():
+        if stats["errors"]:
+            continue
+        if stats["budget_s"] is not None and stats["median_s"] > stats["budget_s"]:
+            violations.append(f"{key} 首次渲染 {stats['median_s']:.2f} 秒，超出預算 {stats['budget_s']:.2f} 秒")
+        if stats["forbidden_loaded"]:
+            violations.append(f"{key} 首次渲染載入了 {', '.join(stats['forbidden_loaded'])}")
+    return violations
+
+
+def main():
+    """命令列執行"""
+    parser = argparse.ArgumentParser(description="Streamlit 進入點啟動時間基準測試")
+    parser.add_argument("entries", nargs="*", help=f"進入點（預設 {', '.join(ENTRY_POINTS)}）")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="每項量測次數（每次為全新程序）")
+    parser.add_argument("--output", default=None, help="結果 JSON 輸出路徑（預設印出）")
+    parser.add_argument("--baseline", default=None, help="基準 JSON 路徑（預設與 benchmarks.py 共用）")
+    parser.add_argument("--tolerance", type=float, default=None, help="容許退步比例（0.25 = 25%%）")
+    parser.add_argument("--update-baseline", action="store_true", help="以本次結果更新基準檔")
+    parser.add_argument("--probe", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="render", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(_probe(args.probe, args.mode), ensure_ascii=False))
+        return
+
+    import benchmarks
+    baseline_path = args.baseline or benchmarks.BASELINE_PATH
+    tolerance = benchmarks.DEFAULT_TOLERANCE if args.tolerance is None else args.tolerance
+    current = run_startup(args.entries, args.repeat)
+    payload = json.dumps(current, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    failed = False
+    violations = budget_violations(current)
+    for violation in violations:
+        print(f"❌ {violation}", file=sys.stderr)
+        failed = True
+
+    if args.update_baseline:
+        baseline = {"meta": current["meta"], "results": {}}
+        if os.path.exists(baseline_path):
+            with open(baseline_path, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline["results"].update({key: stats for key, stats in current["results"].items() if not stats["errors"]})
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(baseline, ensure_ascii=False, indent=2) + "\n")
+        print(f"📌 已更新基準檔 {baseline_path}", file=sys.stderr)
+    elif os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            regressions = benchmarks.compare(current, json.load(f), tolerance)
+        for item in regressions:
+            print(f"❌ {item['benchmark']} {item['metric']}: {item['baseline']} → {item['current']} "
+                  f"(x{item['ratio']})", file=sys.stderr)
+            failed = True
+    if failed:
+        sys.exit(1)
+    print("✅ 所有進入點都在時間預算與容許範圍內", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
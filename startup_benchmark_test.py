@@ -0,0 +1,92 @@
+"""
+啟動時間基準測試工具測試 - 大戶投資審核系統
+驗證進入點的匯入不載入重型函式庫、首次渲染量測與時間預算判定
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import startup_benchmark
+
+
+def loaded_after_import(*modules: str) -> list:
+    """於全新程序匯入指定模組後已載入的重型函式庫"""
+    code = (f"import sys\nimport {', '.join(modules)}\nimport startup_benchmark\n"
+            "print(startup_benchmark.json.dumps(startup_benchmark._loaded_heavy_modules()))")
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, encoding="utf-8",
+                               cwd=startup_benchmark.BASE_DIR,
+                               env={**os.environ, "PYTHONPATH": startup_benchmark.BASE_DIR})
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def test_lightweight_imports():
+    """測試對話頁與審核核心模組匯入時不載入 pandas 等重型函式庫"""
+    print("\n🪶 開始測試輕量匯入...")
+    chat = loaded_after_import("chat_history", "fingpt_client", "llm_cache", "prompt_context")
+    core = loaded_after_import("audit_core", "audit_db", "audit_queries", "audit_search", "audit_summary",
+                               "job_queue", "instrumentation")
+    print(f"📊 對話頁模組載入 {chat or '無'}，審核核心模組載入 {core or '無'}")
+    assert chat == [], f"對話頁模組匯入時載入了 {chat}"
+    assert core == [], f"審核核心模組匯入時載入了 {core}"
+
+
+def test_measure_entry():
+    """測試審核系統進入點的匯入與首次渲染量測，預設頁不載入 pandas"""
+    print("\n🚀 開始測試首次渲染量測...")
+    stats = startup_benchmark.measure_entry("large_investment_audit.py", repeat=1)
+    print(f"📊 {stats}")
+    assert stats["errors"] == [], f"量測失敗: {stats['errors']}"
+    assert stats["import_s"] > 0 and stats["median_s"] > 0
+    assert "pandas" not in stats["import_heavy_modules"] and "pandas" not in stats["heavy_modules"], \
+        "預設頁首次渲染不應載入 pandas"
+    assert stats["forbidden_loaded"] == []
+
+
+def test_budget_violations():
+    """測試超出預算與載入禁用函式庫時回報，量測失敗的進入點略過"""
+    print("\n⏳ 開始測試時間預算判定...")
+    current = {"results": {
+        "startup@a.py": {"median_s": 2.5, "budget_s": 2.0, "forbidden_loaded": [], "errors": []},
+        "startup@b.py": {"median_s": 0.5, "budget_s": 2.0, "forbidden_loaded": ["pandas"], "errors": []},
+        "startup@c.py": {"median_s": 0.1, "budget_s": 2.0, "forbidden_loaded": [], "errors": []},
+        "startup@d.py": {"median_s": 9.0, "budget_s": 2.0, "forbidden_loaded": [], "errors": ["No module"]},
+    }}
+    violations = startup_benchmark.budget_violations(current)
+    print(f"📊 {violations}")
+    assert len(violations) == 2, f"應回報 a.py 超時與 b.py 載入 pandas，實際 {violations}"
+    assert "a.py" in violations[0] and "pandas" in violations[1]
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("🚀 啟動時間基準測試工具測試")
+    print("=" * 60)
+
+    tests = [
+        ("🪶 輕量匯入測試", test_lightweight_imports),
+        ("🚀 首次渲染量測測試", test_measure_entry),
+        ("⏳ 時間預算判定測試", test_budget_violations)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+尾端風險引擎 - 大戶投資審核系統
+以持股權重與報酬矩陣計算歷史法、參數法與蒙地卡羅法的 VaR / CVaR，蒙地卡羅分段模擬以限制記憶體
+"""
+
+import math
+from statistics import NormalDist
+from typing import Dict, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from audit_db import RISK_LEVELS
+
+CONFIDENCE = 0.99
+HORIZON_DAYS = 1
+MC_PATHS = 100_000
+MC_CHUNK_SIZE = 10_000
+MC_SEED = 20240101
+
+# 依 CVaR（佔組合價值比例）分級的門檻
+TAIL_RISK_THRESHOLDS = {"高": 0.05, "中": 0.025}
+
+TAIL_RISK_COLUMNS = ["historical_var", "historical_cvar", "parametric_var", "parametric_cvar",
+                     "monte_carlo_var", "monte_carlo_cvar"]
+
+
+def returns_from_prices(prices: pd.DataFrame) -> pd.DataFrame:
+    """由價格表（日期 x 代號）計算日報酬，缺價日期以前值補齊"""
+    return prices.ffill().pct_change(fill_method=None).iloc[1:].dropna(how="any")
+
+
+def position_weights(positions: Mapping[str, float], prices: pd.DataFrame) -> pd.Series:
+    """以最新價格計算各持股市值權重（持股數 x 價格）"""
+    latest = prices.ffill().iloc[-1].reindex(list(positions))
+    values = latest * pd.Series(positions, dtype=float)
+    return values / values.sum()
+
+
+def _losses_var_cvar(losses: np.ndarray, confidence: float):
+    """由損失樣本計算 VaR 與 CVaR（CVaR 為不小於 VaR 的損失平均）"""
+    var = float(np.quantile(losses, confidence))
+    return var, float(losses[losses >= var].mean())
+
+
+def historical_var(returns: np.ndarray, weights: np.ndarray, confidence: float = CONFIDENCE,
+                   horizon: int = HORIZON_DAYS) -> Dict[str, float]:
+    """歷史模擬法：以實際報酬矩陣加權後的損失分布計算（依時間平方根放大至持有期）"""
+    losses = -(np.asarray(returns, dtype=float) @ np.asarray(weights, dtype=float))
+    var, cvar = _losses_var_cvar(losses, confidence)
+    scale = math.sqrt(horizon)
+    return {"var": var * scale, "cvar": cvar * scale}
+
+
+def parametric_var(returns: np.ndarray, weights: np.ndarray, confidence: float = CONFIDENCE,
+                   horizon: int = HORIZON_DAYS) -> Dict[str, float]:
+    """參數法（變異數-共變異數）：假設常態分布，以共變異數矩陣計算組合波動"""
+    returns = np.asarray(returns, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    mean = float(returns.mean(axis=0) @ weights) * horizon
+    sigma = math.sqrt(max(float(weights @ np.cov(returns, rowvar=False, ddof=1).reshape(len(weights), -1)
+                                @ weights), 0.0) * horizon)
+    z = NormalDist().inv_cdf(confidence)
+    return {"var": -mean + z * sigma, "cvar": -mean + sigma * NormalDist().pdf(z) / (1 - confidence)}
+
+
+def _cholesky(cov: np.ndarray) -> np.ndarray:
+    """共變異數矩陣的 Cholesky 分解；非正定時以特徵值截斷修正"""
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(cov)
+        return eigenvectors * np.sqrt(np.clip(eigenvalues, 0.0, None))
+
+
+@instrumentation.instrument("risk.monte_carlo")
+def monte_carlo_var(returns: np.ndarray, weights: np.ndarray, confidence: float = CONFIDENCE,
+                    horizon: int = HORIZON_DAYS, paths: int = MC_PATHS, seed: int = MC_SEED,
+                    chunk_size: int = MC_CHUNK_SIZE, df: Optional[float] = None) -> Dict[str, float]:
+    """蒙地卡羅法：以報酬均值與共變異數模擬持有期報酬
+
+    每段只產生 chunk_size x 持股數 的亂數，只保留組合損失，記憶體與路徑數無關；
+    固定種子可重現審核結果。df 指定時改用多元 t 分布以反映厚尾。
+    """
+    returns = np.asarray(returns, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    mean = returns.mean(axis=0) * horizon
+    cov = np.cov(returns, rowvar=False, ddof=1).reshape(len(weights), -1) * horizon
+    # 組合報酬 = w·μ + w·(L z)，以 (Lᵀw) 投影避免產生完整的資產報酬矩陣
+    loading = _cholesky(cov).T @ weights
+    if df is not None:
+        # t 分布變異數為 df/(df-2)，先縮放使共變異數一致
+        loading = loading * math.sqrt((df - 2) / df)
+
+    rng = np.random.default_rng(seed)
+    losses = np.empty(paths)
+    for start in range(0, paths, chunk_size):
+        size = min(chunk_size, paths - start)
+        shocks = rng.standard_normal((size, len(weights))) @ loading
+        if df is not None:
+            shocks *= np.sqrt(df / rng.chisquare(df, size))
+        losses[start:start + size] = -(float(mean @ weights) + shocks)
+    var, cvar = _losses_var_cvar(losses, confidence)
+    return {"var": var, "cvar": cvar}
+
+
+def tail_risk_metrics(returns: pd.DataFrame, weights: pd.Series, confidence: float = CONFIDENCE,
+                      horizon: int = HORIZON_DAYS, paths: int = MC_PATHS, seed: int = MC_SEED,
+                      portfolio_value: Optional[float] = None) -> Dict:
+    """計算三種方法的 VaR / CVaR（佔組合價值比例），提供組合價值時另附金額與尾端風險等級"""
+    columns = list(weights.index)
+    matrix = returns[columns].to_numpy(dtype=float)
+    vector = weights.to_numpy(dtype=float)
+    if len(matrix) < 2:
+        raise ValueError("報酬資料不足，至少需要兩個交易日")
+
+    results = {
+        "historical": historical_var(matrix, vector, confidence, horizon),
+        "parametric": parametric_var(matrix, vector, confidence, horizon),
+        "monte_carlo": monte_carlo_var(matrix, vector, confidence, horizon, paths, seed),
+    }
+    metrics = {f"{method}_{name}": values[name] for method, values in results.items() for name in ("var", "cvar")}
+    metrics.update({"confidence": confidence, "horizon_days": horizon, "observations": len(matrix),
+                    "risk_level": tail_risk_level(max(values["cvar"] for values in results.values()))})
+    if portfolio_value is not None:
+        for column in TAIL_RISK_COLUMNS:
+            metrics[f"{column}_amount"] = metrics[column] * portfolio_value
+    return metrics
+
+
+def tail_risk_level(cvar: float) -> str:
+    """依 CVaR 分級"""
+    for level, threshold in TAIL_RISK_THRESHOLDS.items():
+        if cvar >= threshold:
+            return level
+    return "低"
+
+
+def combine_risk_levels(*levels: Optional[str]) -> str:
+    """取最嚴重的風險等級"""
+    return max((level for level in levels if level in RISK_LEVELS), key=RISK_LEVELS.index, default=RISK_LEVELS[0])
+
+
+@instrumentation.instrument("risk.tail_risk")
+def holdings_tail_risk(positions: Mapping[str, float], prices: pd.DataFrame, lookback: int = 252,
+                       **options) -> Dict:
+    """以持股數與價格表計算持股組合的尾端風險（取最近 lookback 個交易日）"""
+    prices = prices.reindex(columns=list(positions))
+    missing = [ticker for ticker in positions if prices[ticker].isna().all()]
+    if missing:
+        raise ValueError(f"缺少行情資料: {', '.join(missing)}")
+    weights = position_weights(positions, prices)
+    portfolio_value = float((prices.ffill().iloc[-1] * pd.Series(positions, dtype=float)).sum())
+    returns = returns_from_prices(prices).tail(lookback)
+    return {**tail_risk_metrics(returns, weights, portfolio_value=portfolio_value, **options),
+            "portfolio_value": portfolio_value}
@@ -0,0 +1,111 @@
+"""
+尾端風險引擎測試 - 大戶投資審核系統
+驗證三種 VaR / CVaR 方法的一致性、蒙地卡羅可重現性與分段模擬
+"""
+
+import sys
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+
+import market_data
+import tail_risk
+from market_data_test import FixtureDownloader
+
+
+def sample_returns(holdings: int = 300, days: int = 750, seed: int = 3):
+    """產生具相關性的常態報酬矩陣與權重"""
+    rng = np.random.default_rng(seed)
+    factors = rng.normal(0, 0.01, (holdings, holdings)) / np.sqrt(holdings)
+    cov = factors @ factors.T + np.diag(rng.uniform(1e-5, 4e-4, holdings))
+    returns = rng.multivariate_normal(np.full(holdings, 3e-4), cov, days)
+    weights = rng.uniform(0, 1, holdings)
+    return returns, weights / weights.sum()
+
+
+def test_methods_agree():
+    """測試常態資料下三種方法結果接近，且歷史法與手算一致"""
+    print("\n📐 開始測試 VaR 方法一致性...")
+    returns, weights = sample_returns()
+    historical = tail_risk.historical_var(returns, weights)
+    parametric = tail_risk.parametric_var(returns, weights)
+    monte_carlo = tail_risk.monte_carlo_var(returns, weights)
+    losses = -(returns @ weights)
+    print(f"📊 歷史 {historical}\n📊 參數 {parametric}\n📊 蒙地卡羅 {monte_carlo}")
+    assert np.isclose(historical["var"], np.quantile(losses, 0.99)), "歷史法 VaR 與手算分位數不一致"
+    assert abs(monte_carlo["var"] / parametric["var"] - 1) < 0.03, "常態資料下蒙地卡羅與參數法 VaR 差距過大"
+    assert abs(monte_carlo["cvar"] / parametric["cvar"] - 1) < 0.03, "常態資料下蒙地卡羅與參數法 CVaR 差距過大"
+    assert abs(historical["var"] / parametric["var"] - 1) < 0.15
+    assert all(result["cvar"] >= result["var"] for result in (historical, parametric, monte_carlo)), "CVaR 不應小於 VaR"
+
+
+def test_monte_carlo_reproducible():
+    """測試固定種子可重現、分段大小不影響結果，且 10 萬條路徑在合理時間內完成"""
+    print("\n🎲 開始測試蒙地卡羅模擬...")
+    returns, weights = sample_returns(holdings=500)
+    started = time.perf_counter()
+    first = tail_risk.monte_carlo_var(returns, weights, paths=100_000, seed=7)
+    elapsed = time.perf_counter() - started
+    second = tail_risk.monte_carlo_var(returns, weights, paths=100_000, seed=7, chunk_size=2_500)
+    other = tail_risk.monte_carlo_var(returns, weights, paths=100_000, seed=8)
+    fat_tail = tail_risk.monte_carlo_var(returns, weights, paths=100_000, seed=7, df=4)
+    print(f"📊 500 檔持股 10 萬路徑耗時 {elapsed:.2f} 秒，t 分布 CVaR {fat_tail['cvar']:.4%}")
+    assert np.isclose(first["var"], second["var"]) and np.isclose(first["cvar"], second["cvar"]), \
+        "分段大小不應影響結果"
+    assert first != other, "不同種子應產生不同結果"
+    assert fat_tail["cvar"] > first["cvar"], "t 分布的 CVaR 應高於常態"
+    assert elapsed < 10, f"10 萬路徑耗時 {elapsed:.2f} 秒"
+
+
+def test_holdings_tail_risk():
+    """測試以持股數與行情快取計算尾端風險及風險等級"""
+    print("\n🏦 開始測試持股尾端風險...")
+    cache_dir = tempfile.mkdtemp()
+    market_data.sync_prices(["0050.TW", "2330.TW"], today=date(2024, 12, 31), history_days=400,
+                            cache_dir=cache_dir, downloader=FixtureDownloader())
+    prices = market_data.load_prices(["0050.TW", "2330.TW"], refresh=False, cache_dir=cache_dir)
+    metrics = tail_risk.holdings_tail_risk({"0050.TW": 1000, "2330.TW": 200}, prices, paths=20_000)
+    print(f"📊 組合價值 {metrics['portfolio_value']:,.0f}，歷史 VaR 金額 {metrics['historical_var_amount']:,.0f}，"
+          f"等級 {metrics['risk_level']}")
+    assert metrics["risk_level"] in ("低", "中", "高") and metrics["historical_var_amount"] > 0
+    assert np.isclose(metrics["historical_var_amount"], metrics["historical_var"] * metrics["portfolio_value"])
+    assert tail_risk.combine_risk_levels("中", "低") == "中"
+    assert tail_risk.combine_risk_levels(None, "未知") == "低", "無有效等級時應回傳最低等級"
+    # 門檻值本身歸入較高的等級
+    assert tail_risk.tail_risk_level(0.05) == "高" and tail_risk.tail_risk_level(0.025) == "中"
+    assert tail_risk.tail_risk_level(0.0249) == "低"
+
+
+def main():
+    """主測試程式"""
+    print("=" * 60)
+    print("📉 尾端風險引擎測試")
+    print("=" * 60)
+
+    tests = [
+        ("📐 方法一致性測試", test_methods_agree),
+        ("🎲 蒙地卡羅測試", test_monte_carlo_reproducible),
+        ("🏦 持股尾端風險測試", test_holdings_tail_risk)
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            results.append((test_name, "✅ 成功"))
+        except AssertionError as e:
+            results.append((test_name, f"❌ 失敗：{e}"))
+
+    print(f"\n{'='*60}")
+    print("📊 測試結果總結")
+    print(f"{'='*60}")
+    for test_name, result in results:
+        print(f"{test_name}: {result}")
+    if any(result.startswith("❌") for _, result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()